@@ -0,0 +1,166 @@
+#!/usr/bin/env python2.7
+#
+# Maps a set of changed files to the modules whose tests they could affect, so CI only needs to
+# test those. A change affects the module which owns the file, every module which inherits from it
+# (if it is a parent pom), and every module which depends on an affected module, including through
+# test-scoped and test-jar dependencies.
+#
+# Invoke from the root of the repo.
+#
+# usage: affected.py [args] path/to/changed/file ...
+#        affected.py [args] --git-range=origin/master...HEAD
+#
+
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from module_graph import ModuleGraph
+from pom_handlers import LocalTargets
+from pom_utils import PomUtils
+
+
+logger = logging.getLogger(__name__)
+
+
+def changed_paths_from_git(git_range):
+  """Lists the files changed in a git revision range of the repo in the working directory.
+
+  :param string git_range: anything `git diff` accepts, eg 'origin/master...HEAD' or a single
+    revision to compare with the working tree.
+  :return: list of paths relative to the repo root.
+  """
+  output = subprocess.check_output(['git', 'diff', '--name-only', '--no-renames', git_range])
+  return [line for line in output.splitlines() if line.strip()]
+
+
+def read_paths(paths_file):
+  """:param string paths_file: file with one path per line, or '-' for stdin."""
+  if paths_file == '-':
+    lines = sys.stdin.readlines()
+  else:
+    with open(paths_file, 'r') as f:
+      lines = f.readlines()
+  return [line.strip() for line in lines if line.strip()]
+
+
+class AffectedModules(object):
+  """The modules affected by a set of changed files."""
+
+  def __init__(self, graph):
+    """:param ModuleGraph graph: the repo's modules."""
+    self._graph = graph
+
+  def analyze(self, paths):
+    """Maps changed paths to the modules they affect.
+
+    :param paths: changed paths, relative to the repo root.
+    :return: a tuple of (map of affected module -> reason, sorted list of paths which aren't part
+      of any module or parent pom).
+    """
+    changes = {}
+    unowned = set()
+    for path in paths:
+      path = os.path.normpath(path)
+      if path == 'pom.xml':
+        # The top pom.xml lists the modules, so any of them could be affected.
+        return dict((module, 'changed pom.xml') for module in self._graph.modules), []
+      owner = self._graph.owner(path)
+      if owner is None:
+        unowned.add(path)
+      else:
+        changes.setdefault(owner, []).append(path)
+    reasons = dict((owner, 'changed {0}'.format(changed[0]) if len(changed) == 1
+                           else 'changed {0} and {1} other files'.format(min(changed),
+                                                                         len(changed) - 1))
+                   for owner, changed in changes.items())
+    return self._graph.affected(reasons, transitive=True), sorted(unowned)
+
+  @classmethod
+  def test_targets(cls, module):
+    """:return: sorted list of the test targets generated for the module's tests."""
+    return sorted(target for target in LocalTargets.get(module) if target.endswith(':test'))
+
+  @classmethod
+  def format_json(cls, affected, unowned):
+    return json.dumps({
+      'modules': dict((module, {'reason': reason, 'test_targets': cls.test_targets(module)})
+                      for module, reason in affected.items()),
+      'unowned': unowned,
+    }, indent=2, sort_keys=True)
+
+  @classmethod
+  def format_text(cls, affected, unowned):
+    """:return: list of lines describing the affected modules for people to read."""
+    lines = ['{0}: {1}'.format(module, affected[module]) for module in sorted(affected)]
+    lines.append('{0} affected modules.'.format(len(affected)))
+    if unowned:
+      lines.append('{0} changed files are not part of any module:'.format(len(unowned)))
+      lines.extend('  {0}'.format(path) for path in unowned)
+    return lines
+
+
+def usage():
+  print "usage: {0} [args] [path/to/changed/file ...]".format(sys.argv[0])
+  print "Lists the modules affected by a change, and the test targets to run for them."
+  print "Invoke from the root of the repo."
+  print ""
+  print "-?,-h                   Show this message"
+  print "--git-range=<range>     Read the changed files from `git diff --name-only <range>`"
+  print "--paths-from=<file>     Read the changed files from <file>, one per line, or from stdin if"
+  print "                        <file> is -"
+  print "--module-graph=<file>   Read the modules from a graph saved by checkpoms (eg"
+  print "                        .pants.d/pom-gen/<branch>/modules.graph) instead of parsing every"
+  print "                        pom.xml. The poms are still parsed if any of them changed."
+  print "--targets               Only print the test targets, one per line"
+  print "--json                  Print the report as JSON"
+  PomUtils.common_usage()
+
+
+def main():
+  arguments = PomUtils.parse_common_args(sys.argv[1:])
+  flags = set(arg for arg in arguments if arg.startswith('-'))
+  paths = [arg for arg in arguments if not arg.startswith('-')]
+
+  module_graph_file = None
+  for f in flags:
+    if f == '-h' or f == '-?':
+      usage()
+      return
+    elif f.startswith('--git-range='):
+      paths.extend(changed_paths_from_git(f[len('--git-range='):]))
+    elif f.startswith('--paths-from='):
+      paths.extend(read_paths(f[len('--paths-from='):]))
+    elif f.startswith('--module-graph='):
+      module_graph_file = f[len('--module-graph='):]
+    elif f in ('--targets', '--json'):
+      pass
+    else:
+      print ("Unknown flag {0}".format(f))
+      usage()
+      return
+
+  graph = None
+  if module_graph_file and not any(os.path.basename(path) == 'pom.xml' for path in paths):
+    try:
+      graph = ModuleGraph.load(module_graph_file)
+    except (IOError, OSError, ModuleGraph.FormatError) as e:
+      logger.warning('Parsing the poms, unable to use the saved module graph: {0}'.format(e))
+  if graph is None:
+    graph = ModuleGraph.from_poms()
+
+  affected, unowned = AffectedModules(graph).analyze(paths)
+  if '--json' in flags:
+    print AffectedModules.format_json(affected, unowned)
+  elif '--targets' in flags:
+    for module in sorted(affected):
+      for target in AffectedModules.test_targets(module):
+        print target
+  else:
+    print '\n'.join(AffectedModules.format_text(affected, unowned))
+
+
+if __name__ == '__main__':
+  main()
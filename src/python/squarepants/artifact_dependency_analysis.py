@@ -3,12 +3,15 @@
 from __future__ import print_function, with_statement
 
 import argparse
+from collections import defaultdict
+from hashlib import sha1
+import json
+from multiprocessing import Pool
 import os
 import sys
-import xml
+import xml.sax
 
-from pom_utils import PomUtils
-from pom_handlers import _DFPomContentHandler
+from pom_handlers import _DFPomContentHandler, TopPomContentHandler
 
 
 class PomDetails(object):
@@ -50,10 +53,25 @@ class PomDetails(object):
 class RepoDetails(object):
   """Captured information from the analysis that can be stored for later comparison."""
 
-  def __init__(self, analysis):
-    self._produced_artifacts = analysis.produced_artifacts
-    self._consumed_artifacts = analysis.consumed_artifacts
-    self._repo_name = analysis.repo_name
+  _VERSION = 1
+
+  def __init__(self, analysis=None, repo_name=None, produced_artifacts=None,
+               consumed_artifacts=None, pom_stats=None):
+    """Captures the analysis, or the information given explicitly.
+
+    :param ArtifactDependencyAnalysis analysis:
+    :param dict pom_stats: map of each pom.xml path read -> (mtime, size), or None if it was
+      missing. Used to tell whether a snapshot is still up to date.
+    """
+    if analysis is not None:
+      repo_name = analysis.repo_name
+      produced_artifacts = analysis.produced_artifacts
+      consumed_artifacts = analysis.consumed_artifacts
+      pom_stats = analysis.pom_stats
+    self._produced_artifacts = set(produced_artifacts or ())
+    self._consumed_artifacts = set(consumed_artifacts or ())
+    self._repo_name = repo_name
+    self._pom_stats = dict(pom_stats or {})
 
   @property
   def consumed_artifacts(self):
@@ -67,35 +85,161 @@ class RepoDetails(object):
   def repo_name(self):
     return self._repo_name
 
+  def is_current(self):
+    """:return: True if none of the poms this was captured from have changed since."""
+    return all(pom_stat(path) == stat for path, stat in self._pom_stats.items())
+
+  def save(self, path):
+    """Writes a snapshot to path, replacing (rather than writing through) any existing file."""
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    data = {
+      'version': self._VERSION,
+      'repo_name': self._repo_name,
+      'produced_artifacts': sorted(self._produced_artifacts),
+      'consumed_artifacts': sorted(self._consumed_artifacts),
+      'pom_stats': self._pom_stats,
+    }
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump(data, f, sort_keys=True)
+    os.rename(tmp_path, path)
+
+  @classmethod
+  def load(cls, path):
+    """Reads a snapshot written by save().
+
+    :return: the RepoDetails, or None if the snapshot is missing or can't be parsed.
+    """
+    try:
+      with open(path, 'r') as f:
+        data = json.load(f)
+    except (IOError, ValueError):
+      return None
+    if not isinstance(data, dict) or data.get('version') != cls._VERSION:
+      return None
+    return cls(repo_name=data['repo_name'],
+               produced_artifacts=[tuple(artifact) for artifact in data['produced_artifacts']],
+               consumed_artifacts=[tuple(artifact) for artifact in data['consumed_artifacts']],
+               pom_stats=dict((path, tuple(stat) if stat else None)
+                              for path, stat in data['pom_stats'].items()))
+
+
+def pom_stat(path):
+  """:return: (mtime, size) of the file at path, or None if it doesn't exist."""
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return (stat.st_mtime, stat.st_size)
+
+
+def _capture_repo(args):
+  """Analyzes a repo in a worker process of AnalysisSession.capture_all()."""
+  snapshot_dir, repo_dir = args
+  return AnalysisSession(snapshot_dir=snapshot_dir).capture(repo_dir)
+
+
+class AnalysisSession(object):
+  """Holds the parsed poms and repo snapshots for a set of analyses.
+
+  Unlike the PomUtils caches, nothing here is global, so any number of repos can be analyzed in
+  the same process, and each worker of a process pool gets a session of its own.
+  """
+
+  def __init__(self, snapshot_dir=None, jobs=None):
+    """
+    :param string snapshot_dir: directory to save RepoDetails snapshots in, so that repos whose
+      poms haven't changed aren't parsed again. If None, snapshots aren't used.
+    :param int jobs: the number of processes to analyze repos with; defaults to the number of cpus.
+    """
+    self._snapshot_dir = snapshot_dir
+    self._jobs = jobs
+    self._poms = {}
+
+  def parse_pom(self, path, handler_type=_DFPomContentHandler):
+    """:return: the content handler for the pom.xml at path, or None if it doesn't exist."""
+    key = (path, handler_type)
+    if key not in self._poms:
+      handler = handler_type()
+      try:
+        with open(path) as source:
+          xml.sax.parse(source, handler)
+      except IOError:
+        handler = None
+      self._poms[key] = handler
+    return self._poms[key]
+
+  def analyze(self, repo_dir):
+    """:rtype: ArtifactDependencyAnalysis"""
+    return ArtifactDependencyAnalysis(repo_dir, session=self)
+
+  def _snapshot_path(self, repo_dir):
+    return os.path.join(self._snapshot_dir,
+                        '{0}.json'.format(sha1(os.path.abspath(repo_dir)).hexdigest()))
+
+  def capture(self, repo_dir):
+    """Analyzes a repo, or reads a snapshot of it if its poms haven't changed since.
+
+    :rtype: RepoDetails
+    """
+    if self._snapshot_dir:
+      details = RepoDetails.load(self._snapshot_path(repo_dir))
+      if details is not None and details.is_current():
+        return details
+    details = self.analyze(repo_dir).capture()
+    if self._snapshot_dir:
+      details.save(self._snapshot_path(repo_dir))
+    return details
+
+  def capture_all(self, repo_dirs):
+    """Captures several repos, analyzing any without an up to date snapshot in parallel.
+
+    :return: list of RepoDetails, in the same order as repo_dirs.
+    """
+    results = {}
+    stale = []
+    for repo_dir in repo_dirs:
+      details = RepoDetails.load(self._snapshot_path(repo_dir)) if self._snapshot_dir else None
+      if details is not None and details.is_current():
+        results[repo_dir] = details
+      elif repo_dir not in stale:
+        stale.append(repo_dir)
+    if len(stale) > 1 and self._jobs != 1:
+      pool = Pool(min(self._jobs or len(stale), len(stale)))
+      try:
+        captured = pool.map(_capture_repo, [(self._snapshot_dir, repo_dir) for repo_dir in stale])
+      finally:
+        pool.close()
+        pool.join()
+      results.update(zip(stale, captured))
+    else:
+      for repo_dir in stale:
+        results[repo_dir] = self.capture(repo_dir)
+    return [results[repo_dir] for repo_dir in repo_dirs]
+
 
 class ArtifactDependencyAnalysis(object):
   """Analyzes the artifacts produced and consumed by repos build with Maven.
 
-  Note that method calls to this class may be influenced by interleaving calls to PomUtils
-  which includes creating an analysis of another repo.   You should capture information from the
-  analysis with the capture() method before attempting to analyze another repo or make other
-  calls the the PomUtils or PomHandlers libraries.
+  Parsed poms are cached in an AnalysisSession, so analyses of different repos don't interfere.
   """
 
-  def __init__(self, repo_dir):
-    # Clear the cache before analyzing the repo
-    PomUtils.reset_caches()
+  def __init__(self, repo_dir, session=None):
     self.repo_dir = repo_dir
-    self._top_pom = PomUtils.top_pom_content_handler(rootdir=repo_dir)
+    self._session = session or AnalysisSession()
+    self.pom_stats = {}
+    self._top_pom = self._parse(os.path.join(repo_dir, 'pom.xml'), TopPomContentHandler)
 
     self._pom_details = {}
     # Parse oll of the poms for the modules [ plus the top level pom.xml ]
     module_list = self._top_pom.modules + ['']
     while len(module_list):
       module = module_list.pop()
-      if module in self._pom_details.keys():
+      if module in self._pom_details:
         continue
-      full_source_path = os.path.join(repo_dir, module, 'pom.xml')
-      pom_handler = _DFPomContentHandler()
-      try:
-        with open(full_source_path) as source:
-          xml.sax.parse(source, pom_handler)
-      except IOError:
+      pom_handler = self._parse(os.path.join(repo_dir, module, 'pom.xml'))
+      if pom_handler is None:
         # assume this file has been removed for a good reason and just continue normally
         continue
       self._pom_details[module] = PomDetails(repo_dir, module, pom_handler)
@@ -105,9 +249,16 @@ class ArtifactDependencyAnalysis(object):
         if os.path.basename(parent_module) == 'pom.xml':
           parent_module = os.path.dirname(parent_module)
         parent_module =os.path.normpath(parent_module)
-        if parent_module not in self._pom_details.keys():
+        if parent_module not in self._pom_details:
           module_list.append(parent_module)
 
+  def _parse(self, path, handler_type=_DFPomContentHandler):
+    self.pom_stats[path] = pom_stat(path)
+    handler = self._session.parse_pom(path, handler_type)
+    if handler is None and handler_type is TopPomContentHandler:
+      raise IOError('No pom.xml at the root of {0}'.format(self.repo_dir))
+    return handler
+
   @property
   def repo_name(self):
     return os.path.basename(self.repo_dir)
@@ -115,8 +266,8 @@ class ArtifactDependencyAnalysis(object):
   def capture(self):
     """Capture the information from this analysis.
 
-    :returns: A copy of the information from this analysis into an object that won't change
-    with other access to the PomUtils library.
+    :returns: A copy of the information from this analysis which can be compared with other repos,
+      or saved as a snapshot.
     :rtype: RepoDetails
     """
     return RepoDetails(self)
@@ -137,16 +288,19 @@ class ArtifactDependencyAnalysis(object):
 
   @property
   def consumed_artifacts(self):
-    return reduce(set.union, (pom.consumed_artifacts for pom in self.all_pom_details), set())
+    consumed = set()
+    for pom in self.all_pom_details:
+      consumed.update(pom.consumed_artifacts)
+    return consumed
 
   @classmethod
   def _format_artifact_list(cls, artifacts):
     return '\n'.join('  {}, {}'.format(*artifact) for artifact in artifacts)
 
   @classmethod
-  def print_repo_summary(cls, repo_dir):
+  def print_repo_summary(cls, repo_dir, session=None):
     """Just prints a summary of the artifacts produced and consumed by the repo."""
-    repo = cls(repo_dir)
+    repo = (session or AnalysisSession()).capture(repo_dir)
     print('Artifacts Produced:')
     print(cls._format_artifact_list(repo.produced_artifacts))
     print()
@@ -154,12 +308,11 @@ class ArtifactDependencyAnalysis(object):
     print(cls._format_artifact_list(repo.consumed_artifacts))
 
   @classmethod
-  def print_repo_comparison(cls, repo1_dir, repo2_dir):
+  def print_repo_comparison(cls, repo1_dir, repo2_dir, session=None):
     """Determines which artifacts are produced by one repo and consumed by the other."""
     print ("Analyzing repo1 {}".format(repo1_dir))
-    repo1 = cls(repo1_dir).capture()
     print ("Analyzing repo2 {}".format(repo2_dir))
-    repo2 = cls(repo2_dir).capture()
+    repo1, repo2 = (session or AnalysisSession()).capture_all([repo1_dir, repo2_dir])
 
 
     print('Artifacts {} produces that {} consumes:'.format(repo1.repo_name, repo2.repo_name))
@@ -170,6 +323,47 @@ class ArtifactDependencyAnalysis(object):
     two_to_one = set.intersection(repo1.consumed_artifacts, repo2.produced_artifacts)
     print(cls._format_artifact_list(two_to_one))
 
+  @classmethod
+  def repo_matrix(cls, repos):
+    """Finds the artifacts each repo produces that each other repo consumes.
+
+    :param repos: list of RepoDetails.
+    :return: dict of producing repo name -> consuming repo name -> sorted list of artifacts, with
+      an entry for every pair of different repos which share any artifacts.
+    """
+    producers = defaultdict(set)
+    for repo in repos:
+      for artifact in repo.produced_artifacts:
+        producers[artifact].add(repo.repo_name)
+    matrix = defaultdict(lambda: defaultdict(set))
+    for consumer in repos:
+      for artifact in consumer.consumed_artifacts:
+        for producer in producers.get(artifact, ()):
+          if producer != consumer.repo_name:
+            matrix[producer][consumer.repo_name].add(artifact)
+    return dict((producer, dict((consumer, sorted(artifacts))
+                                for consumer, artifacts in consumers.items()))
+                for producer, consumers in matrix.items())
+
+  @classmethod
+  def print_repo_matrix(cls, repo_dirs, session=None, as_json=False):
+    """Prints how many artifacts each repo produces that each other repo consumes."""
+    repos = (session or AnalysisSession()).capture_all(repo_dirs)
+    matrix = cls.repo_matrix(repos)
+    if as_json:
+      print(json.dumps(matrix, indent=2, sort_keys=True))
+      return
+    names = [repo.repo_name for repo in repos]
+    width = max([len(name) for name in names] + [len('producer \\ consumer')])
+    print('{0:<{1}}  {2}'.format('producer \\ consumer', width,
+                                 '  '.join('{0:>{1}}'.format(name, len(name)) for name in names)))
+    for producer in names:
+      counts = []
+      for consumer in names:
+        count = '-' if producer == consumer else len(matrix.get(producer, {}).get(consumer, ()))
+        counts.append('{0:>{1}}'.format(count, len(consumer)))
+      print('{0:<{1}}  {2}'.format(producer, width, '  '.join(counts)))
+
 
 def main(args):
   parser = argparse.ArgumentParser("Report artifacts published by repo1 to those consumed by repo2")
@@ -177,15 +371,36 @@ def main(args):
                       help='Process a summary of the artifacts this repo consumes and produces.')
   parser.add_argument('--other-repo-dir', metavar='OTHER_REPO_DIR',
                       help='Prints a comparison of the inter-relationships between --repo-dir.')
+  parser.add_argument('--repos', metavar='REPO_DIR', nargs='+',
+                      help='Prints the number of artifacts each of these repos produces that each '
+                           'other one consumes.')
+  parser.add_argument('--json', action='store_true',
+                      help='With --repos, prints the artifacts for each pair of repos as JSON.')
+  parser.add_argument('--jobs', type=int, default=None,
+                      help='Number of processes to analyze repos with. Defaults to the number of '
+                           'cpus.')
+  parser.add_argument('--snapshot-dir', metavar='DIR',
+                      default=os.path.expanduser('~/.pants.d/artifact-analysis'),
+                      help='Where to save snapshots of analyzed repos, so repos whose poms are '
+                           'unchanged are not parsed again.')
+  parser.add_argument('--no-snapshots', action='store_true',
+                      help='Always parse every repo, and do not save snapshots.')
   args = parser.parse_args(args)
 
+  session = AnalysisSession(snapshot_dir=None if args.no_snapshots else args.snapshot_dir,
+                            jobs=args.jobs)
+  if args.repos:
+    ArtifactDependencyAnalysis.print_repo_matrix([os.path.abspath(repo) for repo in args.repos],
+                                                 session=session, as_json=args.json)
+    return
+
   repo1_dir = os.path.abspath(args.repo_dir if args.repo_dir else '.')
 
   if not args.other_repo_dir:
-    ArtifactDependencyAnalysis.print_repo_summary(repo1_dir)
+    ArtifactDependencyAnalysis.print_repo_summary(repo1_dir, session=session)
   else:
     repo2_dir = os.path.abspath(args.other_repo_dir)
-    ArtifactDependencyAnalysis.print_repo_comparison(repo1_dir, repo2_dir)
+    ArtifactDependencyAnalysis.print_repo_comparison(repo1_dir, repo2_dir, session=session)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,242 @@
+#!/usr/bin/env python2.7
+#
+# Plans a parallel build of the repo's modules: splits them into waves which only depend on modules
+# in earlier waves, and packs each wave's modules into batches of ./pants targets for a number of
+# workers, so that the batches in a wave can run in parallel.
+#
+# Invoke from the root of the repo.
+#
+# usage: build_planner.py [args]
+#
+
+import heapq
+import json
+import logging
+import os
+import sys
+
+from graph_util import Graph
+from module_graph import ModuleGraph
+from pom_handlers import LocalTargets
+from pom_utils import PomUtils
+
+
+logger = logging.getLogger(__name__)
+
+
+def module_size(module):
+  """:return: total size in bytes of the files under the module's src directory."""
+  size = 0
+  for dirpath, dirnames, filenames in os.walk(os.path.join(module, 'src')):
+    for filename in filenames:
+      try:
+        size += os.path.getsize(os.path.join(dirpath, filename))
+      except OSError:
+        pass # Eg a dangling symlink.
+  return size
+
+
+def estimate_costs(modules, times=None, size=module_size):
+  """Estimates how long each module takes to build.
+
+  Historical build times are used where they are known. Other modules are estimated from their
+  size, scaled by the median time per byte of the modules which have both, so that the two can be
+  compared.
+
+  :param modules: module directories.
+  :param dict times: map of module -> seconds its last build took.
+  :param size: function returning the size of a module.
+  :return: a tuple of (map of module -> cost, unit of the costs: 'seconds' or 'bytes').
+  """
+  modules = set(modules)
+  times = dict((module, float(seconds)) for module, seconds in (times or {}).items()
+               if module in modules)
+  sizes = dict((module, size(module)) for module in modules)
+  if not times:
+    return dict((module, max(1, sizes[module])) for module in modules), 'bytes'
+  ratios = sorted(times[module] / sizes[module] for module in times if sizes[module] > 0)
+  scale = ratios[len(ratios) // 2] if ratios else 0.0
+  estimated = modules - set(times)
+  if estimated and not ratios:
+    logger.warning('No modules with a build time have a size, so {0} modules without a build time '
+                   'are estimated to take no time.'.format(len(estimated)))
+  costs = dict(times)
+  for module in estimated:
+    costs[module] = sizes[module] * scale
+  return costs, 'seconds'
+
+
+def read_modules(modules_file):
+  """:param string modules_file: file with one module per line, or '-' for stdin."""
+  if modules_file == '-':
+    lines = sys.stdin.readlines()
+  else:
+    with open(modules_file, 'r') as f:
+      lines = f.readlines()
+  return [line.strip() for line in lines if line.strip()]
+
+
+class BuildPlanner(object):
+  """Schedules the modules of a repo onto parallel workers without violating dependency order."""
+
+  def __init__(self, graph, costs, modules=None):
+    """
+    :param ModuleGraph graph: the repo's modules and their dependencies.
+    :param dict costs: map of module -> estimated time to build it.
+    :param modules: the modules to schedule, eg those affected by a change; defaults to all of
+      them. Dependencies between them through modules which aren't scheduled are still respected.
+    """
+    self._graph = graph
+    self._costs = costs
+    self._selected = set(graph.modules if modules is None else modules)
+
+  def _units(self):
+    """Groups the modules into units which have to be built together: a cycle of modules can't be
+    ordered, so it is scheduled as one unit.
+
+    :return: a tuple of (list of units, each a sorted list of modules, in build order; Graph of
+      unit index -> index of each unit which depends on it).
+    """
+    build_order = Graph(self._graph.modules)
+    for module, deps in self._graph.dependencies.items():
+      for dep in deps:
+        if dep in self._graph.modules:
+          build_order.add_edge(Graph.Edge(dep, module))
+    components, dag = build_order.condensation()
+    for component in components:
+      if len(component) > 1:
+        logger.warning('Modules {0} depend on each other, scheduling them together.'
+                       .format(', '.join(sorted(component))))
+    return [sorted(component) for component in components], dag
+
+  def plan(self, workers):
+    """Computes the schedule.
+
+    A unit goes in the wave after the last wave holding a scheduled module it depends on. Within a
+    wave, units are assigned longest first to the least loaded worker.
+
+    :param int workers: the number of workers.
+    :return: dict with the list of 'waves', each a list of batches of modules with their estimated
+      'cost'; the 'critical_path' of modules through the dependency graph with the highest total
+      cost; and the estimated 'total_cost' of building serially and 'makespan' of the schedule.
+    """
+    if workers < 1:
+      raise ValueError('At least one worker is needed, not {0}'.format(workers))
+    units, dag = self._units()
+    selected = [[module for module in unit if module in self._selected] for unit in units]
+    costs = [sum(self._costs.get(module, 0) for module in unit) for unit in selected]
+
+    # Units are indexed in build order, so every unit's dependencies have a lower index.
+    levels = [0] * len(units)
+    finish = [0] * len(units)
+    critical_predecessor = [None] * len(units)
+    for index in xrange(len(units)):
+      predecessors = dag.incoming_vertices(index)
+      if predecessors:
+        levels[index] = max(levels[p] + (1 if selected[p] else 0) for p in predecessors)
+        critical_predecessor[index] = max(predecessors, key=lambda p: (finish[p], -p))
+        finish[index] = finish[critical_predecessor[index]]
+      finish[index] += costs[index]
+
+    critical_path = []
+    index = max(xrange(len(units)), key=lambda i: (finish[i], -i)) if units else None
+    while index is not None:
+      critical_path[:0] = selected[index]
+      index = critical_predecessor[index]
+
+    waves = {}
+    for index, level in enumerate(levels):
+      if selected[index]:
+        waves.setdefault(level, []).append(index)
+    schedule = []
+    for level in sorted(waves):
+      loads = [(0, worker) for worker in xrange(workers)]
+      batches = [[] for _ in xrange(workers)]
+      for index in sorted(waves[level], key=lambda i: (-costs[i], selected[i])):
+        load, worker = heapq.heappop(loads)
+        batches[worker].extend(selected[index])
+        heapq.heappush(loads, (load + costs[index], worker))
+      loads = dict((worker, load) for load, worker in loads)
+      schedule.append([{'modules': sorted(batches[worker]), 'cost': loads[worker]}
+                       for worker in xrange(workers) if batches[worker]])
+
+    return {
+      'waves': schedule,
+      'critical_path': critical_path,
+      'total_cost': sum(costs),
+      'makespan': sum(max(batch['cost'] for batch in wave) for wave in schedule),
+    }
+
+  @classmethod
+  def targets(cls, module):
+    """:return: sorted list of the targets generated for the module."""
+    return sorted(LocalTargets.get(module))
+
+  @classmethod
+  def format_json(cls, plan, workers, cost_unit):
+    """Adds the ./pants targets to build for each batch of the plan, and formats it as JSON."""
+    waves = []
+    for wave in plan['waves']:
+      waves.append([dict(batch, targets=[target for module in batch['modules']
+                                         for target in cls.targets(module)])
+                    for batch in wave])
+    return json.dumps(dict(plan, waves=waves, workers=workers, cost_unit=cost_unit), indent=2,
+                      sort_keys=True)
+
+
+def usage():
+  print "usage: {0} [args]".format(sys.argv[0])
+  print "Plans the waves of ./pants target batches to build the repo's modules on parallel workers,"
+  print "as JSON. Invoke from the root of the repo."
+  print ""
+  print "-?,-h                   Show this message"
+  print "--workers=<n>           Number of parallel workers (default 4)"
+  print "--times=<file>          JSON map of module -> seconds it took to build. Modules without a"
+  print "                        time are estimated from their size."
+  print "--modules-from=<file>   Only schedule the modules in <file>, one per line, or from stdin if"
+  print "                        <file> is -"
+  print "--module-graph=<file>   Read the modules from a graph saved by checkpoms instead of parsing"
+  print "                        every pom.xml"
+  PomUtils.common_usage()
+
+
+def main():
+  arguments = PomUtils.parse_common_args(sys.argv[1:])
+  workers = 4
+  times = None
+  modules = None
+  module_graph_file = None
+  for f in arguments:
+    if f == '-h' or f == '-?':
+      usage()
+      return
+    elif f.startswith('--workers='):
+      workers = int(f[len('--workers='):])
+    elif f.startswith('--times='):
+      with open(f[len('--times='):], 'r') as times_file:
+        times = json.load(times_file)
+    elif f.startswith('--modules-from='):
+      modules = [os.path.normpath(module) for module in read_modules(f[len('--modules-from='):])]
+    elif f.startswith('--module-graph='):
+      module_graph_file = f[len('--module-graph='):]
+    else:
+      print ("Unknown argument {0}".format(f))
+      usage()
+      return
+
+  if module_graph_file:
+    graph = ModuleGraph.load(module_graph_file)
+  else:
+    graph = ModuleGraph.from_poms()
+  if modules is not None:
+    unknown = set(modules) - graph.modules
+    if unknown:
+      logger.warning('Ignoring unknown modules: {0}'.format(', '.join(sorted(unknown))))
+    modules = set(modules) & graph.modules
+  costs, cost_unit = estimate_costs(graph.modules if modules is None else modules, times)
+  plan = BuildPlanner(graph, costs, modules).plan(workers)
+  print BuildPlanner.format_json(plan, workers, cost_unit)
+
+
+if __name__ == '__main__':
+  main()
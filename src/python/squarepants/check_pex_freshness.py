@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 
 # Stores a fingerprint of the pants.pex file so that we can clean out the repo when it is updated.
+#
+# The fingerprint is keyed by the pex file's inode, size and mtime, so the multi-megabyte file is
+# only re-read when it has actually been replaced. Besides a hash of the whole file, the
+# fingerprint records a hash of each plugin and distribution bundled in the pex (computed from the
+# CRCs in the zip directory, without decompressing anything), which lets --selective-clean remove
+# only the .pants.d directories of the tasks whose plugins changed.
 
 from hashlib import sha1
+import json
+import logging
 import os
+import re
+from shutil import rmtree
 import sys
-import logging
+from zipfile import BadZipfile, ZipFile
 
 from pom_utils import PomUtils
 
@@ -14,47 +24,215 @@ from pom_utils import PomUtils
 # GLOBAL CONFIGURATION VARIABLES
 # -------------------------------------------------
 _CACHE_DIRECTORY = './.pants.d/pom-gen/'
+_FINGERPRINT_FILE = 'pex-fingerprint.json'
+# Written by older versions of this script; holds just the sha1 of the whole pex.
+_LEGACY_HASHES_FILE = 'pex-hashes'
+_FINGERPRINT_VERSION = 1
+_PANTS_WORKDIR = '.pants.d'
+# Entries the pex tool rewrites on every build, which say nothing about what changed.
+_PEX_BOOKKEEPING = ('.bootstrap', 'PEX-INFO', '__main__.py')
+_PLUGIN_PACKAGE = 'squarepants/plugins/'
+_CONTRIB_DISTRIBUTION_PREFIX = 'pantsbuild.pants.contrib.'
 # -------------------------------------------------
 
 
 logger = logging.getLogger(__name__)
 
 
+def pex_file_path(baseroot):
+  return os.path.join(baseroot, 'squarepants', 'bin', 'pants.pex')
+
+def _stat_key(path):
+  st = os.stat(path)
+  return [st.st_ino, st.st_size, st.st_mtime]
+
+def _component_name(entry):
+  """:return: the name of the plugin or distribution a pex entry belongs to, or None."""
+  if entry.startswith(_PEX_BOOKKEEPING):
+    return None
+  if entry.startswith('.deps/'):
+    # Eg .deps/pantsbuild.pants-1.0.0-py2-none-any.whl/pants/... -> pantsbuild.pants
+    return entry.split('/')[1].split('-')[0]
+  if entry.startswith(_PLUGIN_PACKAGE):
+    # Eg squarepants/plugins/square_depmap/register.py -> squarepants.plugins.square_depmap
+    parts = entry.split('/')
+    if len(parts) > 3:
+      return '.'.join(parts[:3])
+  return entry.split('/')[0]
+
+def _component_hashes(zip_file):
+  """Hashes the entries of each component from the CRCs in the zip directory."""
+  hashers = {}
+  for info in sorted(zip_file.infolist(), key=lambda info: info.filename):
+    name = _component_name(info.filename)
+    if name is None:
+      continue
+    if name not in hashers:
+      hashers[name] = sha1()
+    hashers[name].update('{0}\t{1}\t{2}\n'.format(info.filename, info.CRC, info.file_size))
+  return dict((name, hasher.hexdigest()) for name, hasher in hashers.items())
+
+def pex_fingerprint(pex_file, previous=None):
+  """Fingerprints a pex file.
+
+  :param string pex_file: path to the pex.
+  :param dict previous: a previously computed fingerprint. If the pex's inode, size and mtime
+    still match it, it is returned as is, without reading the pex.
+  :return: dict with the pex's 'stat' key, the 'sha1' of the whole file, and a map of each
+    bundled plugin and distribution to a hash of its contents, under 'components'.
+  """
+  stat_key = _stat_key(pex_file)
+  if previous and previous.get('stat') == stat_key:
+    return previous
+  with open(pex_file, 'rb') as pex:
+    digest = sha1(pex.read()).hexdigest()
+  try:
+    with ZipFile(pex_file) as zip_file:
+      components = _component_hashes(zip_file)
+  except (BadZipfile, IOError) as e:
+    logger.debug('Unable to read {0} as a zip file: {1}'.format(pex_file, e))
+    components = {}
+  return {
+    'version': _FINGERPRINT_VERSION,
+    'stat': stat_key,
+    'sha1': digest,
+    'components': components,
+  }
+
+def changed_components(old, new):
+  """:return: sorted names of the components which were added, removed or changed."""
+  old_components, new_components = old.get('components', {}), new.get('components', {})
+  return sorted(name for name in set(old_components) | set(new_components)
+                if old_components.get(name) != new_components.get(name))
+
+def _is_selectively_cleanable(component):
+  return (component.startswith(_PLUGIN_PACKAGE.replace('/', '.'))
+          or component.startswith(_CONTRIB_DISTRIBUTION_PREFIX))
+
+_TASK_RE = re.compile(r"""task\(\s*name\s*=\s*['"]([^'"]+)['"].*?\)\s*\.install\(\s*(?:['"]([^'"]+)['"])?""",
+                      re.DOTALL)
+
+def task_workdirs(register_source):
+  """Finds the .pants.d work directories of the tasks installed by a plugin's register.py.
+
+  Pants gives each task the work directory .pants.d/<goal>/<task>, or .pants.d/<goal> when the
+  task has the same name as its goal.
+
+  :param string register_source: contents of a register.py file.
+  :return: list of directories relative to .pants.d.
+  """
+  workdirs = []
+  for task_name, goal in _TASK_RE.findall(register_source):
+    goal = goal or task_name
+    workdirs.append(goal if goal == task_name else os.path.join(goal, task_name))
+  return workdirs
+
+def _workdirs_to_clean(pex_file, components):
+  """Finds the .pants.d directories which hold the state of tasks from the given components.
+
+  :return: list of directories relative to .pants.d, or None if some component can't be cleaned
+    selectively, so everything must be.
+  """
+  if not components:
+    return None # The pex changed, but not in a way we can attribute to any component.
+  unselective = [component for component in components if not _is_selectively_cleanable(component)]
+  if unselective:
+    logger.info('Pants itself or its dependencies changed ({0}).'.format(', '.join(unselective)))
+    return None
+  workdirs = set()
+  with ZipFile(pex_file) as zip_file:
+    for entry in zip_file.namelist():
+      if os.path.basename(entry) == 'register.py' and _component_name(entry) in components:
+        workdirs.update(task_workdirs(zip_file.read(entry)))
+  return sorted(workdirs)
+
+def _read_fingerprint(path):
+  try:
+    with open(path, 'r') as f:
+      fingerprint = json.load(f)
+  except (IOError, ValueError):
+    return None
+  if not isinstance(fingerprint, dict) or fingerprint.get('version') != _FINGERPRINT_VERSION:
+    return None
+  return fingerprint
+
+def _read_legacy_hashes(path):
+  try:
+    with open(path, 'r') as f:
+      return set(l.strip() for l in f.readlines() if l.strip())
+  except IOError:
+    return None
+
+def _write_fingerprint(path, fingerprint):
+  if not os.path.exists(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'w') as f:
+    json.dump(fingerprint, f, indent=2, sort_keys=True)
+  os.rename(tmp_path, path)
+
+def _clean_all(pex_file):
+  logger.info('Cleaning .pants.d ...')
+  result = os.system('{pex} goal clean-all'.format(pex=pex_file))
+  if result:
+    logger.error('pants goal clean-all failed with status {0}'.format(result))
+    sys.exit(result)
+
+def _clean_selectively(baseroot, pex_file, components):
+  """Removes the .pants.d task directories of the changed components, if that's possible.
+
+  :return: True if the components could be cleaned selectively.
+  """
+  workdirs = _workdirs_to_clean(pex_file, components)
+  if workdirs is None:
+    return False
+  logger.info('Only plugins changed ({0}), cleaning their task directories.'
+              .format(', '.join(components)))
+  for workdir in workdirs:
+    path = os.path.join(baseroot, _PANTS_WORKDIR, workdir)
+    if os.path.isdir(path):
+      logger.info('Removing {0}'.format(path))
+      rmtree(path)
+  return True
+
 def check_pex_health(baseroot, flags):
   """Check to see if pants.pex has been modified since the version stored in the branch. If so,
   then the workspace is cleaned up to remove old state and force BUILD files to be regenerated.
 
   :param string baseroot: directory at the root of the repo
-  :param list<String> flags: flags passed on the command line
+  :param list<String> flags: flags passed on the command line. With --selective-clean, only the
+    task directories of changed plugins are removed, if nothing else in the pex changed.
   """
   logger.info('Checking to see if pants.pex version has changed ...')
-  pex_file = os.path.join(baseroot, 'squarepants', 'bin', 'pants.pex')
+  pex_file = pex_file_path(baseroot)
   if not os.path.exists(pex_file):
-    error("No pants.pex file found; pants isn't installed properly in your repo.")
+    logger.error("No pants.pex file found; pants isn't installed properly in your repo.")
     sys.exit(1)
-  hashes = set()
-  with open(pex_file, 'rb') as pex:
-    hashes.add(sha1(pex.read()).hexdigest())
-  cached_hashes = os.path.join(baseroot, _CACHE_DIRECTORY, 'pex-hashes')
-  if os.path.exists(cached_hashes):
-    with open(cached_hashes, 'r') as f:
-      if hashes == set(l.strip() for l in f.readlines() if l.strip()):
-        return # Nothing changed.
-    logger.info('Pants version has changed since last run. Cleaning .pants.d ...')
-    result = os.system('{pex} goal clean-all'.format(pex=pex_file))
-    if result:
-      logger.error('pants goal clean-all failed with status {0}'.format(result))
-      sys.exit(result)
-  if not os.path.exists(os.path.dirname(cached_hashes)):
-    os.makedirs(os.path.dirname(cached_hashes))
-  with open(cached_hashes, 'w+b') as f:
-    f.write('\n'.join(hashes))
+  cache_dir = os.path.join(baseroot, _CACHE_DIRECTORY)
+  fingerprint_file = os.path.join(cache_dir, _FINGERPRINT_FILE)
+  previous = _read_fingerprint(fingerprint_file)
+  current = pex_fingerprint(pex_file, previous)
+  if current is previous:
+    return # Nothing changed.
+
+  if previous is None:
+    legacy_hashes = _read_legacy_hashes(os.path.join(cache_dir, _LEGACY_HASHES_FILE))
+    if legacy_hashes is not None and legacy_hashes != set([current['sha1']]):
+      logger.info('Pants version has changed since last run.')
+      _clean_all(pex_file)
+  elif previous['sha1'] != current['sha1']:
+    logger.info('Pants version has changed since last run.')
+    components = changed_components(previous, current)
+    if not ('--selective-clean' in flags and _clean_selectively(baseroot, pex_file, components)):
+      _clean_all(pex_file)
+  _write_fingerprint(fingerprint_file, current)
 
 def usage():
   print "usage: %s [args] " % sys.argv[0]
   print "Checks the pants.pex file to see if it has changed.  If so, runs a clean-all."
   print ""
-  print "-?,-h         Show this message"
+  print "-?,-h              Show this message"
+  print "--selective-clean  if only plugins changed, just remove their task directories"
   PomUtils.common_usage()
 
 def main():
@@ -72,6 +250,8 @@ def main():
     if f == '-h' or f == '-?':
       usage()
       return
+    elif f == '--selective-clean':
+      pass
     else:
       print ("Unknown flag %s" % f)
       usage()
@@ -8,20 +8,23 @@
 #
 # When running for the very first time it typically takes a bit longer.
 
-import fnmatch
 from hashlib import sha1
 import logging
 import os
 import re
-from shutil import copyfile, rmtree
+from shutil import rmtree
 import signal
 import subprocess
 import sys
 import time
 
+from check_pex_freshness import check_pex_health
+from gen_cache import GenCache
+from gen_journal import GenerationJournal
+from module_graph import ModuleGraph
 from pom_utils import PomUtils
 from pom_to_build import PomToBuild
-from generate_3rdparty import ThirdPartyBuildGenerator
+from generate_3rdparty import format_update, update_build_files
 
 
 def _get_dependency_patterns():
@@ -41,9 +44,20 @@ _DEPENDENCY_PATTERNS = _get_dependency_patterns()
 _GENERATOR_PATHS = ['squarepants',]
 _GENERATOR_PATTERNS = ['*/bin/*', '*/src/main/python/*.py', '*/src/main/python/*/*.py',]
 _SCRIPT_DIR = 'squarepants/src/main/python/squarepants'
-_VERSION = 1.7
+_VERSION = 1.8
 _GEN_NAMES = set(['BUILD.gen', 'BUILD.aux',])
 _BUILD_GEN_CACHING_ENABLED = True
+# Content-addressed store of generated files, shared by all branches (relative to the cache dir).
+_STORE_DIRECTORY = 'store'
+_STORE_MAX_AGE_SECONDS = 14 * 24 * 60 * 60
+_STORE_MAX_BYTES = 512 * 1024 * 1024
+# Module graph as of the last generation, used to find which modules a change affects.
+_MODULE_GRAPH_FILE = 'modules.graph'
+# Record of the generation run in progress, used to resume it if it is interrupted.
+_JOURNAL_FILE = 'generation.journal'
+_THIRD_PARTY_BUILD_GEN = '3rdparty/BUILD.gen'
+# 3rdparty/BUILD.gen is generated from the dependencyManagement section of this parent pom.
+_THIRD_PARTY_PARENT = 'parents/base'
 # -------------------------------------------------
 
 logger = logging.getLogger(__name__)
@@ -205,11 +219,6 @@ def stream_stdout(popen_list):
       else:
         break
 
-def same_contents(a, b):
-  """:return: True if the strong hashes of the files are identical."""
-  ha, hb = compute_hashes([a, b])
-  return ha == hb
-
 def read_binary(args, env=None):
   """Executes the given command-line arguments and yields its stdout line by line.
   Convenience method to combine the call to exec_binaries() and drain_pipes()"""
@@ -217,12 +226,6 @@ def read_binary(args, env=None):
   logger.debug('read_binary: %s' % vargs)
   return drain_pipes(exec_binaries([args], env=env))
 
-def iter_multi(*groups):
-  """:returns: a generator which iterates over all the items in all the input iterators."""
-  for group in groups:
-    for item in group:
-      yield item
-
 def common_prefix(a, b):
   """:return: the longest common prefix between a and b."""
   for i in range(min(len(a), len(b))):
@@ -355,13 +358,14 @@ class CheckPoms(object):
     self.index_dir = get_branch_cache(self.index_base, self.baseroot)
     self.index_file = os.path.join(self.index_dir, 'poms.index')
     logger.debug('Index file path: {path}'.format(path=self.index_file))
+    self.gen_cache = GenCache(os.path.join(self.index_base, _STORE_DIRECTORY))
+    self.module_graph_file = os.path.join(self.index_dir, _MODULE_GRAPH_FILE)
+    self.journal = GenerationJournal(os.path.join(self.index_dir, _JOURNAL_FILE))
 
     def signal_handler(signal, frame):
-      print('Aborted with Ctrl-C. Cleaning up.')
-      # Removing the current cached dir means the next invocation will re-calculate it
-      self._clean_index_dir()
-      # Generated build files may be in an inconsistent state. Get rid of them to avoid confusion.
-      self._clean_generated_builds()
+      # The index is only replaced once generation is complete, and the journal records every
+      # module finished so far, so the next invocation picks up where this one stopped.
+      print('Aborted with Ctrl-C. The next run will resume where this one stopped.')
       sys.exit(1)
     signal.signal(signal.SIGINT, signal_handler)
 
@@ -374,31 +378,13 @@ class CheckPoms(object):
     self._execute_clean_flags()
     self._find_dependency_differences()
     self._regenerate_if_necessary_and_reindex()
+    self._execute_cache_flags()
 
   def _check_pex_health(self):
     """Check to see if pants.pex has been modified since the version stored in the branch. If so,
     then the workspace is cleaned up to remove old state and force BUILD files to be regenerated.
     """
-    logger.info('Checking to see if pants.pex version has changed ...')
-    pex_file = os.path.join(self.baseroot, 'squarepants', 'bin', 'pants.pex')
-    if not os.path.exists(pex_file):
-      error("No pants.pex file found; pants isn't installed properly in your repo.")
-      sys.exit(1)
-    hashes = set()
-    with open(pex_file, 'rb') as pex:
-      hashes.add(sha1(pex.read()).hexdigest())
-    cached_hashes = os.path.join(_CACHE_DIRECTORY, 'pex-hashes')
-    if os.path.exists(cached_hashes):
-      with open(cached_hashes, 'r') as f:
-        if hashes == set(l.strip() for l in f.readlines() if l.strip()):
-          return # Nothing changed.
-      logger.info('Pants version has changed since last run. Cleaning .pants.d ...')
-      for line in read_binary([pex_file, 'goal', 'clean-all']):
-        logger.debug('clean: %s' % line.strip())
-    if not os.path.exists(os.path.dirname(cached_hashes)):
-      os.makedirs(os.path.dirname(cached_hashes))
-    with open(cached_hashes, 'w+b') as f:
-      f.write('\n'.join(hashes))
+    check_pex_health(self.baseroot, self.flags)
 
   def _find_dependencies(self):
     logger.info('Checking to see if generated BUILD.* files are outdated in %s ...' % self.baseroot)
@@ -417,6 +403,13 @@ class CheckPoms(object):
     if '--clean' in self.flags: # Fairly destructive.
       self._clean_index_dir()
 
+  def _execute_cache_flags(self):
+    """Implements the --cache-gc and --cache-stats flags for this script."""
+    if '--cache-gc' in self.flags:
+      self._gc_cache()
+    if '--cache-stats' in self.flags:
+      logger.info('BUILD.gen cache: {0}'.format(self.gen_cache.format_stats()))
+
   def _find_dependency_differences(self):
     logger.debug('Loading index file...')
     self.old_pairs = self._load_previous_depset()
@@ -450,17 +443,9 @@ class CheckPoms(object):
 
   def _regenerate_if_necessary_and_reindex(self):
     if Task('poms_to_builds', self._regenerate_maybe)():
-      if os.path.exists(self.index_file):
-        os.remove(self.index_file)
       p, h = Task('find_and_hash_deps', lambda: find_and_hash_deps(self.baseroot))()
       Task('write_index', lambda: write_index(self.index_file, set(zip(p, h))))()
-
-  def _clean_generated_builds(self):
-    """Removes all generated BUILD files from the source diretory"""
-    Task('clean_build_gen', lambda:
-      os.system(
-        "find {root} \( -name BUILD.gen -o -name BUILD.aux \! -path '*/.pants.d/*' \) | xargs rm -f"
-        .format(root=self.baseroot)))
+      self.journal.clear()
 
   def _clean_index_dir(self):
     """Removes the currently computed index of files to shas"""
@@ -468,112 +453,282 @@ class CheckPoms(object):
     if os.path.exists(self.index_dir):
       rmtree(self.index_dir)
 
+  def _input_fingerprint(self):
+    """Fingerprints everything the generated BUILD.* files are computed from.
+
+    The generated files themselves are excluded, and paths are made relative to the repo root, so
+    the fingerprint only depends on the contents of the pom.xml files, the handwritten BUILD files,
+    the source directory layout, and the generator itself.
+    """
+    pairs = ((os.path.relpath(dep, self.baseroot), sha) for dep, sha in self.new_pairs
+             if os.path.basename(dep) not in _GEN_NAMES)
+    return GenCache.fingerprint(pairs, salt=str(_VERSION))
+
   def _regenerate_maybe(self):
     """Generates (or links) BUILD.gen files, if necessary.
     :returns: True if this generated or linked any files, False if it noop'd.
     """
-    cache_dir = self.index_dir
-    removed_deps = self.removed_deps
-    added_deps = self.added_deps
-    changed_deps = self.changed_deps
-
     force_rebuild = not _BUILD_GEN_CACHING_ENABLED or '--rebuild' in self.flags
 
     if not force_rebuild and  self.total_diffs == 0:
+      self.journal.clear() # The last run was interrupted after writing the index, if at all.
       return False # Nothing to do.
 
-    self._clean_generated_builds()
-
+    # The generated files aren't removed up front: restoring from the cache only replaces the ones
+    # that differ, and regenerating some of the modules keeps the rest.
+    fingerprint = self._input_fingerprint()
+    logger.debug('Input fingerprint: {0}'.format(fingerprint))
+    manifest = None
     if not force_rebuild:
-      for dep in iter_multi(removed_deps, added_deps, changed_deps):
-        filename = os.path.basename(dep)
-        if fnmatch.fnmatch(filename, 'BUILD*'):
-          continue
-        logger.debug('Matched non-BUILD file %s, forcing rebuild' % (dep))
-        force_rebuild = True
-        break
+      manifest = Task('cache_lookup', lambda: self.gen_cache.lookup(fingerprint))()
 
-    if not force_rebuild:
-      # GEN's need to be re-gen'd if a BUILD file was removed.
-      # AUX's need to be re-gen'd if a BUILD file was added.
-      for dep in iter_multi(removed_deps, added_deps):
-        name = os.path.basename(dep)
-        if name.startswith('BUILD') and name not in _GEN_NAMES:
-          force_rebuild = True
-          break
-
-    builds_index = os.path.join(cache_dir, 'build_gen.index')
-    gens_dir = os.path.join(cache_dir, 'gens')
-
-    if not force_rebuild and os.path.exists(builds_index):
+    if manifest is not None:
       logger.info('Generated BUILD.* files are outdated, loading correct versions from cache.')
-      self._restore_cache(gens_dir, builds_index)
-    else:
-      logger.info('Generated BUILD.* files are outdated, Regenerating.')
-      self._rebuild_everything(gens_dir, builds_index)
+      try:
+        self._restore_cache(manifest)
+        self._restore_module_graph(fingerprint)
+      except GenCache.CorruptObjectError as e:
+        logger.warning('{0} Discarding cache entry.'.format(e))
+        manifest = None
+
+    if manifest is None:
+      plan = None
+      if not force_rebuild:
+        plan = Task('plan_regeneration', lambda: self._plan_regeneration(fingerprint))()
+      if plan is None:
+        logger.info('Generated BUILD.* files are outdated, Regenerating.')
+        self._rebuild_everything(fingerprint)
+      else:
+        self._rebuild_modules(fingerprint, *plan)
+    self.gen_cache.save_stats()
     return True
 
-  def _restore_cache(self, gens_dir, builds_index):
-    for dep in self.added_deps:
-      if os.path.basename(dep) in _GEN_NAMES:
-        logger.debug('Removing %s' % dep)
-        try:
-          os.remove(dep)
-        except OSError:
-          # don't complain if the file doesn't exist
-          pass
+  def _restore_cache(self, manifest):
+    """Makes the generated BUILD.* files in the workspace match the cached manifest.
 
-    for source, target in read_index(builds_index, '-f' in self.flags or '--force' in self.flags):
+    :param manifest: list of (content hash, relative path) tuples from the GenCache.
+    """
+    cached_targets = set(relpath for _, relpath in manifest)
+    for dep in self.dep_files:
+      if os.path.basename(dep) in _GEN_NAMES \
+          and os.path.relpath(dep, self.baseroot) not in cached_targets:
+        logger.debug('Removing %s' % dep)
+        self._remove_quietly(dep)
+
+    # Directories with a handwritten BUILD file don't get a BUILD.gen, and the hashes recorded in
+    # the index tell us which generated files are already up to date without reading them again.
+    handwritten_dirs = set(os.path.dirname(dep) for dep in self.dep_files
+                           if os.path.basename(dep).startswith('BUILD')
+                           and os.path.basename(dep) not in _GEN_NAMES)
+    current_hashes = self._current_gen_hashes()
+
+    to_restore = []
+    for content_hash, relpath in manifest:
+      target = os.path.join(self.baseroot, relpath)
       target_dir = os.path.dirname(target)
-      if not os.path.exists(target_dir):
-        warn('Missing directory for target %s' % target_dir)
-        continue # What? Okay, skip it, I guess.
-      if not '3rdparty' in target_dir:
-        if any(f.startswith('BUILD') and f != 'BUILD.gen' for f in os.listdir(target_dir)):
+      if os.path.basename(target) == 'BUILD.gen' and not '3rdparty' in target_dir:
+        if target_dir in handwritten_dirs:
           logger.debug('Skipping directory %s, build file already exists.' % target_dir)
-          if os.path.exists(target):
+          if relpath in current_hashes:
             os.remove(target)
           continue # There's a real BUILD file here already.
-      gen_source = os.path.join(gens_dir, source)
-      if not same_contents(gen_source, target):
-        logger.debug('Replacing %s' % target)
-        if os.path.exists(target):
-          os.remove(target)
-        for output in read_binary(['cp', gen_source, target]):
-          # Generally isn't any output, and we don't care if there is.
-          # Just here to make the stream is drained and the subprocess is closed.
-          pass
-
-  def _rebuild_everything(self, gens_dir, builds_index):
-    # The cached BUILD files are now invalid. Remove them first
-    rmtree(gens_dir, ignore_errors=True)
-
-    poms = [x + '/pom.xml' for x in PomUtils.get_modules()]
+      to_restore.append((content_hash, relpath))
+    result = Task('cache_restore', lambda: self.gen_cache.restore(
+      to_restore, self.baseroot, current_hashes=current_hashes))()
+    logger.info(GenCache.format_restore_result(result))
+
+  def _restore_module_graph(self, fingerprint):
+    """Restores the module graph which was cached alongside the generated files."""
+    manifest = self.gen_cache.lookup(self._module_graph_key(fingerprint), record_stats=False)
+    if manifest is not None:
+      self.gen_cache.restore(manifest, self.index_dir)
+    elif os.path.exists(self.module_graph_file):
+      # The graph on disk describes some other state, so the next change has to regenerate
+      # everything.
+      os.remove(self.module_graph_file)
+
+  def _module_graph_key(self, fingerprint):
+    return '{0}.modules'.format(fingerprint)
+
+  def _current_gen_hashes(self):
+    """:return: map of relative path -> content hash for the generated files in the workspace."""
+    return dict((os.path.relpath(dep, self.baseroot), sha) for dep, sha in self.new_pairs
+                if os.path.basename(dep) in _GEN_NAMES)
+
+  def _plan_regeneration(self, fingerprint):
+    """Maps the changed files to the modules whose generated BUILD.* files they affect.
+
+    If the last run was interrupted while generating from the same inputs, only the modules it
+    didn't finish are planned.
+
+    :return: a tuple of (current ModuleGraph, map of affected module -> reason, reason to
+      regenerate 3rdparty/BUILD.gen or None, stray generated files to remove), or None if
+      everything has to be regenerated.
+    """
+    interrupted = self._read_journal()
+    if interrupted is not None and interrupted.fingerprint == fingerprint:
+      return self._plan_resumption(interrupted)
+
+    if not self.old_pairs:
+      return None
+    try:
+      previous = ModuleGraph.load(self.module_graph_file)
+    except (IOError, OSError, ModuleGraph.FormatError) as e:
+      logger.debug('No usable module graph from the last run: {0}'.format(e))
+      return None
+    graph = Task('module_graph', ModuleGraph.from_poms)()
+
+    changes = {}
+    third_party_reason = None
+    stray = []
+    generator_prefixes = tuple(path + os.sep for path in _GENERATOR_PATHS)
+    for kind, deps in (('changed', self.changed_deps), ('added', self.added_deps),
+                       ('removed', self.removed_deps)):
+      for dep in sorted(deps):
+        relpath = os.path.relpath(dep, self.baseroot)
+        change = '{0} {1}'.format(kind, relpath)
+        if relpath.startswith(generator_prefixes):
+          logger.info('Generator {0}, regenerating everything.'.format(change))
+          return None
+        if relpath == _THIRD_PARTY_BUILD_GEN:
+          third_party_reason = third_party_reason or change
+          continue
+        owner = graph.owner(relpath) or previous.owner(relpath)
+        if owner is None:
+          if os.path.basename(relpath) == 'pom.xml':
+            logger.info('{0} is not part of any module, regenerating everything.'.format(relpath))
+            return None
+          if os.path.basename(relpath) in _GEN_NAMES:
+            stray.append(relpath)
+          else:
+            logger.debug('Ignoring {0}, it is not part of any module.'.format(change))
+          continue
+        if owner == _THIRD_PARTY_PARENT:
+          third_party_reason = third_party_reason or change
+        changes.setdefault(owner, []).append(change)
+
+    reasons = dict((owner, changed[0] if len(changed) == 1
+                           else '{0} and {1} other files'.format(changed[0], len(changed) - 1))
+                   for owner, changed in changes.items())
+    return graph, graph.affected(reasons, previous), third_party_reason, stray
+
+  def _read_journal(self):
+    try:
+      return self.journal.read()
+    except GenerationJournal.FormatError as e:
+      logger.warning('Ignoring journal: {0}'.format(e))
+      return None
+
+  def _plan_resumption(self, interrupted):
+    """Plans to finish the work an interrupted run left undone.
+
+    Modules the interrupted run finished are skipped, unless their generated file has changed since.
+    """
+    pending = interrupted.pending(self._current_gen_hashes())
+    logger.info('Resuming an interrupted run: {0} of {1} planned modules were finished.'
+                .format(len(interrupted.planned) - len(pending), len(interrupted.planned)))
+    graph = Task('module_graph', ModuleGraph.from_poms)()
+    reason = 'unfinished when the last run was interrupted'
+    affected = dict((unit, reason) for unit in pending if unit != _THIRD_PARTY_BUILD_GEN)
+    third_party_reason = reason if _THIRD_PARTY_BUILD_GEN in pending else None
+    return graph, affected, third_party_reason, []
+
+  def _rebuild_modules(self, fingerprint, graph, affected, third_party_reason, stray):
+    """Regenerates the BUILD.* files for only the given modules.
+
+    :param ModuleGraph graph: the current module graph.
+    :param dict affected: map of module -> reason it needs to be regenerated.
+    :param string third_party_reason: why 3rdparty/BUILD.gen needs to be regenerated, or None.
+    :param stray: generated files which don't belong to any module, to be removed.
+    """
+    logger.info('Generated BUILD.* files are outdated, Regenerating {0} of {1} modules.'
+                .format(len(affected), len(graph.modules)))
+    modules = sorted(affected)
+    self.journal.begin(fingerprint, modules + ([_THIRD_PARTY_BUILD_GEN] if third_party_reason
+                                               else []))
+    for module in modules:
+      logger.info('  {0}: {1}'.format(module, affected[module]))
+      self._remove_generated(module)
+      pom_file_name = os.path.join(module, 'pom.xml')
+      if module in graph.modules and os.path.exists(pom_file_name):
+        PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot)
+      self._journal_done(module, [os.path.join(module, name) for name in sorted(_GEN_NAMES)])
+
+    if third_party_reason:
+      logger.info('Re-generating 3rdparty/BUILD.gen ({0})'.format(third_party_reason))
+      self._generate_third_party()
+      self._journal_done(_THIRD_PARTY_BUILD_GEN, [_THIRD_PARTY_BUILD_GEN])
+
+    for relpath in stray:
+      logger.debug('Removing %s' % relpath)
+      self._remove_quietly(os.path.join(self.baseroot, relpath))
+
+    self._store_generated(fingerprint, graph)
+
+  def _rebuild_everything(self, fingerprint):
+    modules = [os.path.normpath(module) for module in PomUtils.get_modules()]
+    self.journal.begin(fingerprint, modules + [_THIRD_PARTY_BUILD_GEN])
     # Convert pom files to BUILD files
-    for pom_file_name in poms:
-      PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot)
+    for module in modules:
+      self._remove_generated(module)
+      PomToBuild().convert_pom(module + '/pom.xml', rootdir=self.baseroot)
+      self._journal_done(module, [os.path.join(module, name) for name in sorted(_GEN_NAMES)])
 
     logger.info('Re-generating 3rdparty/BUILD.gen')
-    with open('3rdparty/BUILD.gen', 'w') as build_file:
-      build_file.write(ThirdPartyBuildGenerator().generate())
+    self._generate_third_party()
+    self._journal_done(_THIRD_PARTY_BUILD_GEN, [_THIRD_PARTY_BUILD_GEN])
+    self._store_generated(fingerprint, ModuleGraph.from_poms())
 
-    new_gens = find_files([self.baseroot], _GEN_NAMES)
+  def _journal_done(self, unit, candidates):
+    """Records that a unit of work is finished, along with the generated file it wrote.
+
+    :param candidates: relative paths the unit's generated file may have been written to.
+    """
+    for relpath in candidates:
+      path = os.path.join(self.baseroot, relpath)
+      if os.path.exists(path):
+        self.journal.done(unit, relpath, GenCache.content_hash(path))
+        return
+    self.journal.done(unit)
+
+  def _generate_third_party(self):
+    # update_build_files() skips generation if the managed dependencies haven't changed, replaces
+    # rather than overwrites in case the old files are hardlinked into the cache, and leaves
+    # shards whose artifacts didn't change alone.
+    for line in format_update(update_build_files()):
+      logger.info(line)
+
+  def _remove_generated(self, module):
+    """Removes a module's generated BUILD.* files before they are regenerated.
+
+    Generated files may be hardlinked into the cache, so they must never be written in place.
+    """
+    for name in _GEN_NAMES:
+      self._remove_quietly(os.path.join(self.baseroot, module, name))
+
+  def _remove_quietly(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      # don't complain if the file doesn't exist
+      pass
+
+  def _store_generated(self, fingerprint, graph):
+    """Caches the generated files and the module graph they were generated from."""
+    graph.save(self.module_graph_file)
+    new_gens = [gen for gen in find_files([self.baseroot], _GEN_NAMES) if gen]
     logger.info('Caching {num_build_files} regenerated BUILD.* files. '
                 .format(num_build_files=len(new_gens)))
-    os.makedirs(gens_dir)
-    gen_pairs = set()
-    for gen in new_gens:
-      if gen == '':
-        continue
-      cache_name = sha1(gen).hexdigest()
-      index = 0
-      while os.path.exists(os.path.join(gens_dir, cache_name+str(index))):
-        index += 1
-      cache_name += str(index)
-      cache_path = os.path.join(gens_dir, cache_name)
-      copyfile(gen, cache_path)
-      gen_pairs.add((cache_path, gen))
-    write_index(builds_index, gen_pairs)
+    Task('cache_store', lambda: self.gen_cache.store(
+      fingerprint, self.baseroot, [os.path.relpath(gen, self.baseroot) for gen in new_gens]))()
+    self.gen_cache.store(self._module_graph_key(fingerprint), self.index_dir, [_MODULE_GRAPH_FILE])
+    self._gc_cache()
+
+  def _gc_cache(self):
+    removed, freed = Task('cache_gc', lambda: self.gen_cache.gc(max_age=_STORE_MAX_AGE_SECONDS,
+                                                                max_bytes=_STORE_MAX_BYTES))()
+    if removed:
+      logger.info('Removed {0} old BUILD.gen cache entries ({1} bytes).'.format(removed, freed))
 
 def usage():
   print "usage: %s [args] " % sys.argv[0]
@@ -582,6 +737,10 @@ def usage():
   print "-?,-h         Show this message"
   print "--rebuild     unconditionally rebuild the BUILD files from pom.xml"
   print "-f, --force   force the use of a seemingly incompatible index version"
+  print "--cache-gc    remove old entries from the shared BUILD.gen cache"
+  print "--cache-stats print hit, miss and bytes saved totals for the shared BUILD.gen cache"
+  print "--selective-clean  when pants.pex changes, if only plugins changed just remove their"
+  print "              task directories from .pants.d instead of running clean-all"
   PomUtils.common_usage()
 
 def main():
@@ -606,6 +765,10 @@ def main():
       pass
     elif f == '-f' or f == '--force':
       pass
+    elif f == '--cache-gc' or f == '--cache-stats':
+      pass
+    elif f == '--selective-clean':
+      pass
     else:
       print ("Unknown flag %s" % f)
       usage()
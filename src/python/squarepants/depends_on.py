@@ -1,90 +1,306 @@
 #!/usr/bin/python
 #
 # Shows projects a target depends on (transitively) going through definitions defined  and referenced in the top level repo.
+# Can also show the projects which depend on a target, and answer many queries in one run.
 # invoke from ~/Development/java
 #
-# usage: depends_on.py path/to/pom.xml
+# The module dependency graph is kept in an index under .pants.d/pom-gen/ between runs. Each module
+# is only re-parsed when its pom.xml, or a parent pom it inherits from, changes.
+#
+# usage: depends_on.py [args] path/to/pom.xml ...
+#        depends_on.py [args] --batch=queries.txt
 #
 
+import hashlib
+import json
 import logging
 import os
 import os.path
 import sys
 
+from graph_util import Graph, ReachabilityIndex
 from pom_utils import PomUtils
-from pom_handlers import CachedDependencyInfos
+from pom_handlers import CachedDependencyInfos, DependencyInfo
 
 logger = logging.getLogger(__name__)
 
-def recursive_find_deps(query, dependency_edges, results):
+_INDEX_FILE = '.pants.d/pom-gen/depends-on-index.json'
+
+def recursive_find_deps(query, dependency_edges, results, index=None):
   """ query - the name of the target to find
       dependency_edges - the dictionary of all dependencies found
       results - set() containing the result set.
+      index - a ReachabilityIndex over dependency_edges, to reuse between queries.
   """
   logger.debug("looking for {query} in graph" .format(query=query))
   if query in results:
     # avoid following the same dep twice
     return
   results.add(query)
-  if not dependency_edges.has_key(query):
-    return
-  deps = dependency_edges[query]
-  for dep in deps:
-    recursive_find_deps(dep, dependency_edges, results)
+  if index is None:
+    index = ReachabilityIndex(dependency_graph(dependency_edges))
+  results.update(index.closure(query))
+
+def dependency_graph(dependency_edges):
+  """ dependency_edges - the dictionary of all dependencies found
+      returns the dependencies as a Graph.
+  """
+  graph = Graph(vertices=dependency_edges)
+  for target, deps in dependency_edges.items():
+    for dep in deps:
+      graph.add_edge(Graph.Edge(target, dep))
+  return graph
+
+def module_dependencies(module):
+  """ module - the module directory, as listed in the top pom.xml
+      returns a tuple of the module's target and the list of targets it depends on.
+  """
+  finder = CachedDependencyInfos.get(module + "/pom.xml")
+  target = "{group_id}.{artifact_id}".format(group_id=finder.groupId,
+                                             artifact_id=finder.artifactId)
+  logger.debug("Adding dependencies for {target}".format(target=target))
+  dep_targets = []
+  for dep in finder.dependencies:
+    dep_target = "{group_id}.{artifact_id}".format(group_id=dep['groupId'],
+                                                   artifact_id=dep['artifactId'])
+    logger.debug("{target} => {dep_target}".format(target=target, dep_target=dep_target))
+    dep_targets.append(dep_target)
+  return target, dep_targets
 
 def build_dependency_graph():
   dependency_edges = {}
   for module in PomUtils.top_pom_content_handler().modules:
     logger.debug("found module: " + module)
-    finder = CachedDependencyInfos.get(module + "/pom.xml")
-    deps = finder.dependencies
-    target = "{group_id}.{artifact_id}".format(group_id=finder.groupId,
-                                               artifact_id=finder.artifactId)
-    logger.debug("Adding dependencies for {target}".format(target=target))
-    dependency_edges[target] = []
-    for dep in deps:
-      dep_target = "{group_id}.{artifact_id}".format(group_id=dep['groupId'],
-                                                     artifact_id=dep['artifactId'])
-      logger.debug("{target} => {dep_target}".format(target=target, dep_target=dep_target))
-      dependency_edges[target].append(dep_target)
+    target, dep_targets = module_dependencies(module)
+    dependency_edges[target] = dep_targets
   return dependency_edges
 
-def main(sourceFile):
-  """Builds a dependency graph,  searches the graph for all transitive dependencies
-     of the module defined in sourceFile and prints them out as <groupId>.<artifactId>
+def pom_fingerprint(path):
+  """ path - path to a pom.xml file
+      returns the sha1 of the file's contents, or None if it doesn't exist.
   """
-  # Fetch the group/artifact for the source file
-  finder = DependencyInfo(sourceFile)
-  query =  "{group_id}.{artifact_id}".format(group_id=finder.groupId,
-                                             artifact_id=finder.artifactId)
-  logger.debug("Looking for all dependencies of: {query}".format(query=query))
+  try:
+    with open(path, 'rb') as f:
+      return hashlib.sha1(f.read()).hexdigest()
+  except IOError:
+    return None
+
+
+class DependencyIndex(object):
+  """The forward and reverse dependency edges between the targets of the repo's modules.
+
+  The index is saved between runs. Each module's entry records the fingerprints of the poms it was
+  computed from (its own and the parent poms it inherits from), and is only recomputed when one of
+  them changes.
+  """
+
+  _VERSION = 1
+
+  def __init__(self, modules):
+    """ modules - map of module directory -> {'target', 'dependencies', 'files'} entry, where files
+        maps each pom the entry was computed from to its fingerprint.
+    """
+    self.modules = modules
+    self.dependency_edges = {}
+    for module in sorted(modules):
+      entry = modules[module]
+      self.dependency_edges[entry['target']] = entry['dependencies']
+    self.graph = dependency_graph(self.dependency_edges)
+    self.reachability = ReachabilityIndex(self.graph)
+
+  @classmethod
+  def _module_entry(cls, module, fingerprints):
+    target, dep_targets = module_dependencies(module)
+    files = {}
+    pom = os.path.normpath(os.path.join(module, 'pom.xml'))
+    while pom and pom not in files:
+      if pom not in fingerprints:
+        fingerprints[pom] = pom_fingerprint(pom)
+      files[pom] = fingerprints[pom]
+      if fingerprints[pom] is None:
+        break
+      pom = CachedDependencyInfos.get(pom).parent_path
+    return {'target': target, 'dependencies': dep_targets, 'files': files}
 
-  dependency_edges = build_dependency_graph()
+  @classmethod
+  def _read(cls, index_file):
+    try:
+      with open(index_file, 'r') as f:
+        data = json.load(f)
+    except (IOError, ValueError) as e:
+      logger.debug("Unable to read {index_file}: {error}".format(index_file=index_file, error=e))
+      return {}
+    if not isinstance(data, dict) or data.get('version') != cls._VERSION:
+      return {}
+    return data.get('modules', {})
 
-  results = set()
-  recursive_find_deps(query, dependency_edges, results)
-  logger.debug("Found {num_results} results.".format(num_results=len(results)))
-  sorted_results = sorted(results)
+  @classmethod
+  def load(cls, index_file=_INDEX_FILE, rebuild=False):
+    """ index_file - where the index is saved between runs.
+        rebuild - if True, ignores any saved index.
+        returns the index for the modules currently listed in the top pom.xml, updating the saved
+        index if any of them had to be re-parsed.
+    """
+    previous = {} if rebuild else cls._read(index_file)
+    fingerprints = {}
+    modules = {}
+    reparsed = 0
+    for module in PomUtils.top_pom_content_handler().modules:
+      entry = previous.get(module)
+      if entry is not None:
+        for pom, fingerprint in entry['files'].items():
+          if pom not in fingerprints:
+            fingerprints[pom] = pom_fingerprint(pom)
+          if fingerprints[pom] != fingerprint:
+            entry = None
+            break
+      if entry is None:
+        logger.debug("found module: " + module)
+        entry = cls._module_entry(module, fingerprints)
+        reparsed += 1
+      modules[module] = entry
+    logger.debug("Re-parsed {reparsed} of {total} modules.".format(reparsed=reparsed,
+                                                                   total=len(modules)))
+    index = cls(modules)
+    if reparsed or set(previous) != set(modules):
+      index.save(index_file)
+    return index
 
+  def save(self, index_file=_INDEX_FILE):
+    """Writes the index, replacing (rather than writing through) any existing file."""
+    if not os.path.isdir(os.path.dirname(index_file)):
+      os.makedirs(os.path.dirname(index_file))
+    tmp_file = '{index_file}.{pid}.tmp'.format(index_file=index_file, pid=os.getpid())
+    with open(tmp_file, 'w') as f:
+      json.dump({'version': self._VERSION, 'modules': self.modules}, f, indent=2, sort_keys=True)
+    os.rename(tmp_file, index_file)
+
+  def target_for(self, query):
+    """ query - a path to a pom.xml, a module directory, or a <groupId>.<artifactId> target.
+        returns the target the query refers to.
+    """
+    module = query
+    if os.path.basename(module) == 'pom.xml':
+      module = os.path.dirname(module)
+    module = os.path.normpath(module)
+    if module in self.modules:
+      return self.modules[module]['target']
+    pom = os.path.join(module, 'pom.xml')
+    if os.path.exists(pom):
+      # Not a module, eg a parent pom.
+      finder = DependencyInfo(pom)
+      return "{group_id}.{artifact_id}".format(group_id=finder.groupId,
+                                               artifact_id=finder.artifactId)
+    return query
+
+  def depends_on(self, target):
+    """Returns the set of targets the target transitively depends on."""
+    return self.reachability.closure(target)
+
+  def depended_on_by(self, target):
+    """Returns the set of targets which transitively depend on the target."""
+    return self.reachability.reverse_closure(target)
+
+  def query(self, query, directions=('depends_on',)):
+    """ query - see target_for().
+        directions - which of 'depends_on' and 'depended_on_by' to answer.
+        returns a dict with the query, its target, and a sorted list of targets for each direction.
+    """
+    target = self.target_for(query)
+    result = {'query': query, 'target': target}
+    for direction in directions:
+      result[direction] = sorted(getattr(self, direction)(target))
+    return result
+
+
+def read_queries(batch_file):
+  """ batch_file - file with one query per line, or '-' for stdin. Blank lines and lines starting
+      with '#' are skipped.
+      returns the list of queries.
+  """
+  if batch_file == '-':
+    lines = sys.stdin.readlines()
+  else:
+    with open(batch_file, 'r') as f:
+      lines = f.readlines()
+  return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+def print_targets(targets):
   # Sort the output with local deps first
-  for dep_target in sorted_results:
+  for dep_target in sorted(targets):
     if PomUtils.is_local_dep(dep_target):
       print dep_target
-  for dep_target in sorted_results:
+  for dep_target in sorted(targets):
     if not PomUtils.is_local_dep(dep_target):
       print dep_target
 
+def usage():
+  print "usage: {progname} [args] path/to/pom.xml ...".format(progname=os.path.basename(sys.argv[0]))
+  print "Shows the targets a module transitively depends on, or is depended on by."
+  print "Queries can be paths to pom.xml files, module directories, or <groupId>.<artifactId>."
+  print ""
+  print "-?,-h               Show this message"
+  print "--depends-on        Show the targets each query depends on (the default)"
+  print "--depended-on-by    Show the targets which depend on each query"
+  print "--batch=<file>      Read more queries from <file>, one per line, or from stdin if <file> is -"
+  print "--json              Print the results as JSON"
+  print "--rebuild-index     Re-parse every module rather than reusing the saved index"
+  PomUtils.common_usage()
+
+def main(queries, flags):
+  """Loads the dependency index and answers each query.
+
+     queries - see DependencyIndex.target_for().
+     flags - command line flags, see usage().
+  """
+  directions = [direction for flag, direction in (('--depends-on', 'depends_on'),
+                                                  ('--depended-on-by', 'depended_on_by'))
+                if flag in flags] or ['depends_on']
+  index = DependencyIndex.load(rebuild='--rebuild-index' in flags)
+  results = [index.query(query, directions) for query in queries]
+
+  reached = set()
+  for result in results:
+    reached.add(result['target'])
+    for direction in directions:
+      reached.update(result[direction])
+  for cycle in index.graph.find_cycles():
+    # Either every target in a cycle is reached, or none is.
+    if cycle[0] in reached:
+      logger.warning("Dependency cycle: {cycle}".format(cycle=" -> ".join(cycle)))
+
+  if '--json' in flags:
+    print json.dumps(results, indent=2, sort_keys=True)
+  elif len(results) == 1 and directions == ['depends_on']:
+    # Like the original output, this includes the target itself.
+    print_targets(set(results[0]['depends_on']) | {results[0]['target']})
+  else:
+    for result in results:
+      for direction in directions:
+        print "{target} {relation}:".format(target=result['target'],
+                                            relation=direction.replace('_', ' '))
+        for dep_target in result[direction]:
+          print "  " + dep_target
+
 if __name__ == "__main__":
-  pom = ""
   args = PomUtils.parse_common_args(sys.argv[1:])
-  if len(args) == 1:
-    pom = args[0]
-  else:
+  flags = set(arg for arg in args if arg.startswith('-'))
+  queries = [arg for arg in args if not arg.startswith('-')]
+  for flag in flags:
+    if flag == '-h' or flag == '-?':
+      usage()
+      sys.exit(0)
+    elif flag.startswith('--batch='):
+      queries.extend(read_queries(flag[len('--batch='):]))
+    elif flag not in ('--depends-on', '--depended-on-by', '--json', '--rebuild-index'):
+      print "Unknown flag {flag}".format(flag=flag)
+      usage()
+      sys.exit(1)
+  if not queries:
     pom = "common/pom.xml"
-    print "usage: {progname} path/to/pom.xml".format(progname=os.path.basename(sys.argv[0]))
-    print
-    PomUtils.common_usage()
+    usage()
     print
     print "Example with {pom}:".format(pom=pom)
+    queries = [pom]
 
-  main(pom)
+  main(queries, flags)
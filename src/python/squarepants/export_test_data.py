@@ -7,13 +7,15 @@
 from __future__ import unicode_literals, print_function
 
 import argparse
-import json
-from squarepants.junit_report import get_test_cases, State
+from squarepants.junit_report import RecordWriter, get_test_cases, open_output, State
 
 
 PARSER = argparse.ArgumentParser('Convert JUnit XML reports to universal json format.')
 PARSER.add_argument('--output', help="Output file", required=True)
 PARSER.add_argument('--dir', help="Directory with reports", required=True)
+PARSER.add_argument('--format', help="Output format", choices=RecordWriter.FORMATS,
+                    default='json')
+PARSER.add_argument('--gzip', help="Compress the output with gzip", action='store_true')
 
 
 def case_to_json_dict(case):
@@ -31,8 +33,12 @@ def case_to_json_dict(case):
 def main():
   ns = PARSER.parse_args()
   cases = get_test_cases(ns.dir)
-  with open(ns.output, 'w') as fp:
-    fp.write(json.dumps(map(case_to_json_dict, cases)))
+  with open_output(ns.output, ns.gzip) as fp:
+    # The records are written as the reports are parsed, rather than collected first.
+    writer = RecordWriter(fp, ns.format)
+    for case in cases:
+      writer.write(case_to_json_dict(case))
+    writer.close()
 
 if __name__ == '__main__':
   main()
@@ -1,5 +1,6 @@
 import os
 import shutil
+import sys
 from contextlib import contextmanager
 from tempfile import mkdtemp, mktemp
 
@@ -54,6 +55,20 @@ def file_pattern_exists_in_subdir(subdir, pattern):
   return False
 
 
+def read_lines(filename):
+  """Reads a list of names, eg modules or targets, given one per line.
+
+  :param string filename: the file to read, or '-' for stdin.
+  :return: the non-blank lines, stripped of surrounding whitespace.
+  """
+  if filename == '-':
+    lines = sys.stdin.readlines()
+  else:
+    with open(filename, 'r') as f:
+      lines = f.readlines()
+  return [line.strip() for line in lines if line.strip()]
+
+
 def touch(fname, times=None, makedirs=False):
   """Creates the specified file at the named path (and optionally sets the time)."""
   if makedirs:
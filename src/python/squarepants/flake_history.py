@@ -0,0 +1,182 @@
+#!/usr/bin/env python2.7
+#
+# Keeps a history of the JUnit test results of each CI run, to tell how often each test fails and
+# to propose which tests to mark flaky in the flakes directory used by junit_report, and which ones
+# to stop treating as flaky.
+#
+# Called from script/ci after the tests run to record the results in the JUnit .xml reports:
+#
+#   flake_history record --dir=<reports> [--label=<build id>]
+#
+# and to propose changes to the flakes directory:
+#
+#   flake_history propose --flakes=<flakes directory>
+#
+# The results are kept in a SQLite database, with a row per test per run, indexed by test and by run
+# so that queries only read the runs they ask about.
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import json
+import logging
+import time
+
+from squarepants.junit_report import State, get_test_cases, load_flakes
+from squarepants.sqlite_store import SQLiteStore
+
+
+logger = logging.getLogger(__name__)
+
+
+_DEFAULT_DB = '.pants.d/flake-history/history.db'
+
+
+class FlakeHistory(SQLiteStore):
+  """The results of every test in each recorded run, stored in a SQLite database."""
+
+  _VERSION = 1
+  _SCHEMA = (
+    'CREATE TABLE runs ('
+    '  id INTEGER PRIMARY KEY,'
+    '  label TEXT,'
+    '  recorded_at REAL NOT NULL)',
+    'CREATE TABLE tests ('
+    '  id INTEGER PRIMARY KEY,'
+    '  name TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE results ('
+    '  test_id INTEGER NOT NULL,'
+    '  run_id INTEGER NOT NULL,'
+    '  failed INTEGER NOT NULL,'
+    '  PRIMARY KEY (test_id, run_id)) WITHOUT ROWID',
+    'CREATE INDEX results_by_run ON results (run_id, test_id, failed)',
+  )
+
+  def __init__(self, path=_DEFAULT_DB):
+    super(FlakeHistory, self).__init__(path)
+
+  def record_run(self, cases, label=None, recorded_at=None):
+    """Adds the results of a test run to the history.
+
+    A test reported more than once in the run counts as failed if any of its results failed.
+
+    :param cases: the TestCases of the run, as returned by junit_report.get_test_cases().
+    :param string label: identifies the run, eg the CI build number.
+    :param float recorded_at: when the run happened, in seconds since the epoch; defaults to now.
+    :return: the id of the run.
+    """
+    failed = {}
+    for case in cases:
+      failed[case.full_name] = failed.get(case.full_name, False) or case.state != State.SUCCESS
+    with self._db:
+      run_id = self._db.execute('INSERT INTO runs (label, recorded_at) VALUES (?, ?)',
+                                (label, time.time() if recorded_at is None else recorded_at)
+                                ).lastrowid
+      self._db.executemany('INSERT OR IGNORE INTO tests (name) VALUES (?)',
+                           ((name,) for name in failed))
+      test_ids = self._test_ids(failed)
+      self._db.executemany('INSERT INTO results VALUES (?, ?, ?)',
+                           ((test_ids[name], run_id, int(failed[name])) for name in failed))
+    return run_id
+
+  def _test_ids(self, names):
+    """:return: map of test name -> id for the names which have been recorded."""
+    names = list(names)
+    test_ids = {}
+    # Looked up in batches, as SQLite limits the number of parameters in a statement.
+    for start in xrange(0, len(names), 500):
+      batch = names[start:start + 500]
+      test_ids.update(self._db.execute('SELECT name, id FROM tests WHERE name IN ({})'
+                                       .format(', '.join('?' * len(batch))), batch))
+    return test_ids
+
+  def test_history(self, name, runs=None):
+    """:return: list of (run label, failed) for the test in each of the most recent runs it was in,
+    latest first.
+    """
+    return [(label, bool(failed)) for label, failed in self._db.execute(
+      'SELECT runs.label, results.failed FROM results'
+      '  JOIN tests ON tests.id = results.test_id JOIN runs ON runs.id = results.run_id'
+      '  WHERE tests.name = ? ORDER BY results.run_id DESC LIMIT ?',
+      (name, -1 if runs is None else runs))]
+
+  def failure_rates(self, window):
+    """Counts how often each test failed in recent runs.
+
+    :param int window: the number of most recent runs to count.
+    :return: map of test name -> (number of runs it was in, number of them it failed in).
+    """
+    row = self._db.execute('SELECT MAX(id) FROM runs').fetchone()
+    if row[0] is None:
+      return {}
+    counts = self._db.execute('SELECT tests.name, counts.runs, counts.failures FROM'
+                              '  (SELECT test_id, COUNT(*) AS runs, SUM(failed) AS failures'
+                              '     FROM results WHERE run_id > ? GROUP BY test_id) AS counts'
+                              '  JOIN tests ON tests.id = counts.test_id',
+                              (row[0] - window,))
+    return dict((name, (runs, failures)) for name, runs, failures in counts)
+
+  def propose(self, flakes, window=100, threshold=0.02, min_runs=10):
+    """Proposes changes to the set of tests treated as flaky.
+
+    A test is proposed for quarantine if it both failed and passed in the window, it failed at
+    least twice and in at least the threshold fraction of its runs: a test which fails every time
+    is broken rather than flaky. A flaky test is proposed for release if it didn't fail at all.
+    Tests which ran fewer than min_runs times in the window aren't proposed either way.
+
+    :param flakes: set of the names of the tests currently treated as flaky.
+    :param int window: the number of most recent runs to consider.
+    :param float threshold: the fraction of its runs a test has to fail in to be quarantined.
+    :param int min_runs: the number of runs in the window needed to propose a test.
+    :return: dict of the tests to 'quarantine' and to 'release', each a sorted list of dicts with
+      the 'test' name and its 'runs', 'failures' and failure 'rate' in the window.
+    """
+    quarantine, release = [], []
+    for name, (runs, failures) in sorted(self.failure_rates(window).items()):
+      if runs < min_runs:
+        continue
+      stats = {'test': name, 'runs': runs, 'failures': failures,
+               'rate': float(failures) / runs}
+      if name in flakes:
+        if failures == 0:
+          release.append(stats)
+      elif 2 <= failures < runs and stats['rate'] >= threshold:
+        quarantine.append(stats)
+    return {'quarantine': quarantine, 'release': release}
+
+
+PARSER = argparse.ArgumentParser('Record JUnit test results and propose flaky tests to quarantine')
+PARSER.add_argument('--db', help="SQLite database of test results", default=_DEFAULT_DB)
+SUBPARSERS = PARSER.add_subparsers(dest='command')
+RECORD_PARSER = SUBPARSERS.add_parser('record', help="Record the test results in JUnit reports")
+RECORD_PARSER.add_argument('--dir', help="Directory with reports", required=True)
+RECORD_PARSER.add_argument('--label', help="Label of the run, eg the CI build number")
+PROPOSE_PARSER = SUBPARSERS.add_parser('propose',
+                                       help="Propose tests to quarantine or release, as JSON")
+PROPOSE_PARSER.add_argument('--flakes', help="Directory with flake indicators", required=True)
+PROPOSE_PARSER.add_argument('--window', help="Number of recent runs to consider", type=int,
+                            default=100)
+PROPOSE_PARSER.add_argument('--threshold', help="Fraction of runs a test fails in to quarantine it",
+                            type=float, default=0.02)
+PROPOSE_PARSER.add_argument('--min-runs', help="Runs needed in the window to propose a test",
+                            type=int, default=10)
+
+
+def main():
+  logging.basicConfig()
+  ns = PARSER.parse_args()
+  history = FlakeHistory(ns.db)
+  try:
+    if ns.command == 'record':
+      run_id = history.record_run(get_test_cases(ns.dir), label=ns.label)
+      print('Recorded run {} in {}'.format(run_id, ns.db))
+    else:
+      print(json.dumps(history.propose(load_flakes(ns.flakes), window=ns.window,
+                                       threshold=ns.threshold, min_runs=ns.min_runs),
+                       indent=2, sort_keys=True))
+  finally:
+    history.close()
+
+
+if __name__ == '__main__':
+  main()
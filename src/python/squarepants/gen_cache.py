@@ -0,0 +1,410 @@
+# Content-addressed cache of generated BUILD.* files.
+#
+# Generated files are stored once per unique content hash under objects/, and each cache entry maps
+# a fingerprint of the generator's inputs to the list of (content hash, output path) pairs that
+# those inputs produced. Because entries are keyed by their inputs rather than by branch name, any
+# branch whose pom.xml files and handwritten BUILD files match a previously cached state reuses it.
+
+import errno
+import json
+import logging
+import os
+import shutil
+import time
+from collections import namedtuple
+from hashlib import sha1
+from multiprocessing.pool import ThreadPool
+from uuid import uuid4
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Linux ioctl request number for cloning a file's extents (copy-on-write), from <linux/fs.h>.
+_FICLONE = 0x40049409
+
+
+class GenCache(object):
+  """A content-addressed store of generated files, shared between branches.
+
+  Layout under store_dir:
+    objects/<2 chars>/<38 chars>   file contents, named by the sha1 of the contents.
+    entries/<fingerprint>          one line per generated file: <content hash>\t<relative path>
+    stats.json                     running totals of hits, misses and bytes saved.
+
+  Objects may be hardlinked into the workspace when restoring, so every object's mtime is pinned
+  to _OBJECT_MTIME when it is stored. Writing to a hardlinked workspace file in place bumps the
+  shared mtime, which is how a modified object is detected before it is restored again.
+  """
+
+  class FormatError(Exception):
+    """Raised when a cache entry can't be parsed."""
+
+  class CorruptObjectError(Exception):
+    """Raised when a stored object was modified after it was written to the store."""
+
+  RestoreResult = namedtuple('RestoreResult', ['files', 'bytes', 'seconds', 'methods'])
+
+  _VERSION = 1
+  _OBJECT_MTIME = 1
+  _STAT_KEYS = ('hits', 'misses', 'bytes_stored', 'bytes_saved', 'bytes_restored')
+  # Ways of materializing an object in the workspace, in order of preference.
+  _METHODS = ('reflink', 'hardlink', 'copy')
+
+  def __init__(self, store_dir, methods=None, jobs=8):
+    """
+    :param string store_dir: directory to keep the store in.
+    :param methods: names of the methods which may be used to materialize restored files, in order
+      of preference. Defaults to reflink, then hardlink, then an in-process copy.
+    :param int jobs: number of threads used to restore files.
+    """
+    self.store_dir = store_dir
+    self.objects_dir = os.path.join(store_dir, 'objects')
+    self.entries_dir = os.path.join(store_dir, 'entries')
+    self.stats_file = os.path.join(store_dir, 'stats.json')
+    self.jobs = jobs
+    # Methods are dropped from this list the first time they fail, eg because the filesystem
+    # doesn't support reflinks or the workspace is on a different device than the store.
+    self._methods = list(methods or self._METHODS)
+    self._stats = None
+
+  @classmethod
+  def fingerprint(cls, pairs, salt=''):
+    """Computes a fingerprint for a set of (path, hash) input pairs.
+
+    :param pairs: iterable of (path, hash) tuples describing the generator's inputs.
+    :param string salt: extra data mixed into the fingerprint (eg, the generator version).
+    :rtype: string
+    """
+    hasher = sha1()
+    hasher.update('{0}\n{1}\n'.format(cls._VERSION, salt))
+    for path, digest in sorted(pairs):
+      hasher.update('{0}\t{1}\n'.format(path, digest))
+    return hasher.hexdigest()
+
+  @classmethod
+  def content_hash(cls, path):
+    """:return: the sha1 of the file's contents."""
+    with open(path, 'rb') as f:
+      return sha1(f.read()).hexdigest()
+
+  def object_path(self, content_hash):
+    return os.path.join(self.objects_dir, content_hash[:2], content_hash[2:])
+
+  def entry_path(self, fingerprint):
+    return os.path.join(self.entries_dir, fingerprint)
+
+  def has_entry(self, fingerprint):
+    return os.path.exists(self.entry_path(fingerprint))
+
+  def lookup(self, fingerprint, record_stats=True):
+    """Looks up the manifest stored for the given input fingerprint.
+
+    A successful lookup refreshes the entry's modification time, which garbage collection uses as
+    its last-used time.
+
+    :param bool record_stats: whether to count this lookup as a hit or miss.
+    :return: a list of (content hash, relative path) tuples, or None on a cache miss.
+    """
+    bump = self._bump if record_stats else lambda key: None
+    entry_path = self.entry_path(fingerprint)
+    try:
+      manifest = self._read_entry(entry_path)
+    except (IOError, OSError):
+      bump('misses')
+      return None
+    except self.FormatError as e:
+      logger.warning('{0}, ignoring it.'.format(e))
+      self._remove_quietly(entry_path)
+      bump('misses')
+      return None
+    if not all(self._is_intact(self.object_path(content_hash)) for content_hash, _ in manifest):
+      logger.warning('Cache entry {0} references missing or modified objects, ignoring it.'
+                     .format(fingerprint))
+      self._remove_quietly(entry_path)
+      bump('misses')
+      return None
+    os.utime(entry_path, None)
+    bump('hits')
+    return manifest
+
+  def store(self, fingerprint, root, relpaths):
+    """Stores the generated files under the given input fingerprint.
+
+    :param string fingerprint: fingerprint of the inputs which produced these files.
+    :param string root: directory the relative paths are relative to.
+    :param relpaths: relative paths of the generated files.
+    :return: the manifest of (content hash, relative path) tuples that was stored.
+    """
+    manifest = []
+    for relpath in sorted(set(relpaths)):
+      path = os.path.join(root, relpath)
+      content_hash = self.content_hash(path)
+      size = os.path.getsize(path)
+      object_path = self.object_path(content_hash)
+      if self._is_intact(object_path):
+        self._bump('bytes_saved', size)
+      else:
+        self._atomic_copy(path, object_path, mtime=self._OBJECT_MTIME)
+        self._bump('bytes_stored', size)
+      manifest.append((content_hash, relpath))
+    self._write_entry(self.entry_path(fingerprint), manifest)
+    return manifest
+
+  def restore(self, manifest, root, current_hashes=None):
+    """Materializes the objects in the manifest at their paths under root, in parallel.
+
+    Files whose current content hash already matches the manifest are left alone.
+
+    :param manifest: list of (content hash, relative path) tuples.
+    :param string root: directory the relative paths are relative to.
+    :param dict current_hashes: map of relative path -> content hash for the generated files that
+      currently exist under root. If given, these hashes are trusted instead of re-reading every
+      file, and any path missing from the map is assumed not to exist.
+    :return: a RestoreResult describing the files that were replaced.
+    :raises: CorruptObjectError if an object was modified after it was stored.
+    """
+    start = time.time()
+    pending = []
+    for content_hash, relpath in manifest:
+      target = os.path.join(root, relpath)
+      if current_hashes is not None:
+        current_hash = current_hashes.get(relpath)
+      elif os.path.exists(target):
+        current_hash = self.content_hash(target)
+      else:
+        current_hash = None
+      if current_hash == content_hash:
+        continue
+      object_path = self.object_path(content_hash)
+      if not self._is_intact(object_path):
+        self._remove_quietly(object_path)
+        raise self.CorruptObjectError('Cached object for {0} was modified in place.'.format(relpath))
+      if not os.path.isdir(os.path.dirname(target)):
+        logger.warning('Missing directory for target {0}'.format(os.path.dirname(target)))
+        continue
+      pending.append((object_path, target))
+
+    if len(pending) > 1 and self.jobs > 1:
+      pool = ThreadPool(min(self.jobs, len(pending)))
+      try:
+        results = pool.map(self._materialize_job, pending)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      results = [self._materialize_job(job) for job in pending]
+
+    restored_bytes = sum(size for size, _ in results)
+    methods = {}
+    for _, method in results:
+      methods[method] = methods.get(method, 0) + 1
+    self._bump('bytes_restored', restored_bytes)
+    return self.RestoreResult(files=len(results), bytes=restored_bytes,
+                              seconds=time.time() - start, methods=methods)
+
+  @classmethod
+  def format_restore_result(cls, result):
+    seconds = max(result.seconds, 1e-6)
+    return ('Restored {files} files ({mb:.2f} MB) in {seconds:.3f} seconds, {rate:.0f} files/s, '
+            '{mbps:.1f} MB/s ({methods}).'
+            .format(files=result.files,
+                    mb=result.bytes / 1048576.0,
+                    seconds=result.seconds,
+                    rate=result.files / seconds,
+                    mbps=result.bytes / 1048576.0 / seconds,
+                    methods=', '.join('{0} {1}'.format(count, method)
+                                      for method, count in sorted(result.methods.items()))
+                            or 'nothing to do'))
+
+  def _materialize_job(self, job):
+    object_path, target = job
+    logger.debug('Replacing {0}'.format(target))
+    method = self._materialize(object_path, target)
+    return os.path.getsize(object_path), method
+
+  def _materialize(self, object_path, target):
+    """Atomically replaces target with the contents of object_path.
+
+    :return: the name of the method that was used.
+    """
+    tmp_path = self._tmp_path(target)
+    for method in list(self._methods):
+      try:
+        if method == 'reflink':
+          self._reflink(object_path, tmp_path)
+        elif method == 'hardlink':
+          os.link(object_path, tmp_path)
+        else:
+          shutil.copyfile(object_path, tmp_path)
+      except (IOError, OSError) as e:
+        self._remove_quietly(tmp_path)
+        if method == 'copy':
+          raise
+        logger.debug('Unable to {0} {1}: {2}'.format(method, object_path, e))
+        if method in self._methods:
+          try:
+            self._methods.remove(method)
+          except ValueError:
+            pass # Removed concurrently by another thread.
+        continue
+      os.rename(tmp_path, target)
+      return method
+    raise IOError(errno.EINVAL, 'No way to materialize {0}'.format(object_path))
+
+  @classmethod
+  def _reflink(cls, source, target):
+    if fcntl is None:
+      raise IOError(errno.EOPNOTSUPP, 'reflinks are not supported on this platform')
+    with open(source, 'rb') as src:
+      with open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+  def _is_intact(self, object_path):
+    """:return: True if the object exists and hasn't been written to since it was stored."""
+    try:
+      return int(os.path.getmtime(object_path)) == self._OBJECT_MTIME
+    except OSError:
+      return False
+
+  def gc(self, max_age=None, max_bytes=None, now=None):
+    """Removes cache entries that are too old or don't fit, then removes unreferenced objects.
+
+    Entries are removed oldest-used first until the objects they reference fit within max_bytes.
+
+    :param float max_age: maximum number of seconds since an entry was last used.
+    :param int max_bytes: maximum total size of the stored objects.
+    :return: tuple of (number of entries removed, number of bytes freed).
+    """
+    now = now if now is not None else time.time()
+    entries = []
+    if os.path.isdir(self.entries_dir):
+      for name in os.listdir(self.entries_dir):
+        path = os.path.join(self.entries_dir, name)
+        try:
+          entries.append((os.path.getmtime(path), path, self._read_entry(path)))
+        except (IOError, OSError, self.FormatError):
+          logger.debug('Removing unreadable cache entry {0}'.format(path))
+          self._remove_quietly(path)
+    # Most recently used first.
+    entries.sort(reverse=True)
+
+    sizes = self._object_sizes()
+    kept, removed = set(), 0
+    kept_bytes = 0
+    for mtime, path, manifest in entries:
+      hashes = set(content_hash for content_hash, _ in manifest)
+      added_bytes = sum(sizes.get(h, 0) for h in hashes - kept)
+      too_old = max_age is not None and now - mtime > max_age
+      too_big = max_bytes is not None and kept and kept_bytes + added_bytes > max_bytes
+      if too_old or too_big:
+        self._remove_quietly(path)
+        removed += 1
+        continue
+      kept.update(hashes)
+      kept_bytes += added_bytes
+
+    freed = 0
+    for content_hash, size in sizes.items():
+      if content_hash not in kept:
+        self._remove_quietly(self.object_path(content_hash))
+        freed += size
+    if removed or freed:
+      logger.debug('Cache gc removed {0} entries and freed {1} bytes.'.format(removed, freed))
+    return removed, freed
+
+  @property
+  def stats(self):
+    """Running totals of cache hits, misses and bytes saved since the store was created."""
+    if self._stats is None:
+      self._stats = dict.fromkeys(self._STAT_KEYS, 0)
+      try:
+        with open(self.stats_file, 'r') as f:
+          self._stats.update(json.load(f))
+      except (IOError, ValueError):
+        pass
+    return self._stats
+
+  def save_stats(self):
+    if self._stats is None:
+      return
+    self._atomic_write(self.stats_file, json.dumps(self._stats, indent=2, sort_keys=True))
+
+  def format_stats(self):
+    stats = self.stats
+    lookups = stats['hits'] + stats['misses']
+    return ('{hits} hits, {misses} misses ({rate:.0%} hit rate), {saved} bytes saved by '
+            'deduplication, {restored} bytes restored.'
+            .format(hits=stats['hits'],
+                    misses=stats['misses'],
+                    rate=float(stats['hits']) / lookups if lookups else 0.0,
+                    saved=stats['bytes_saved'],
+                    restored=stats['bytes_restored']))
+
+  def _bump(self, key, amount=1):
+    self.stats[key] = self.stats.get(key, 0) + amount
+
+  def _object_sizes(self):
+    sizes = {}
+    if not os.path.isdir(self.objects_dir):
+      return sizes
+    for prefix in os.listdir(self.objects_dir):
+      prefix_dir = os.path.join(self.objects_dir, prefix)
+      for rest in os.listdir(prefix_dir):
+        sizes[prefix + rest] = os.path.getsize(os.path.join(prefix_dir, rest))
+    return sizes
+
+  def _read_entry(self, path):
+    manifest = []
+    with open(path, 'r') as f:
+      for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+          continue
+        parts = line.split('\t')
+        if len(parts) != 2:
+          raise self.FormatError('Expected 2 entries separated by tabs, got: {line} in '
+                                 '{file}:{line_number}'.format(line=line, file=path,
+                                                               line_number=line_number))
+        manifest.append(tuple(parts))
+    return manifest
+
+  def _write_entry(self, path, manifest):
+    lines = ['# gen-cache entry version {0}'.format(self._VERSION)]
+    lines.extend('\t'.join(pair) for pair in manifest)
+    self._atomic_write(path, '\n'.join(lines) + '\n')
+
+  def _atomic_write(self, path, data):
+    tmp_path = self._tmp_path(path)
+    with open(tmp_path, 'w') as f:
+      f.write(data)
+    os.rename(tmp_path, path)
+
+  def _atomic_copy(self, source, path, mtime=None):
+    tmp_path = self._tmp_path(path)
+    shutil.copyfile(source, tmp_path)
+    if mtime is not None:
+      os.utime(tmp_path, (mtime, mtime))
+    os.rename(tmp_path, path)
+
+  def _tmp_path(self, path):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        # Another process may have created it concurrently.
+        if not os.path.isdir(directory):
+          raise
+    return '{0}.{1}.tmp'.format(path, uuid4().hex)
+
+  def _remove_quietly(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
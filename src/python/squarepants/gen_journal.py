@@ -0,0 +1,126 @@
+# Journal of an in-progress BUILD.* generation run.
+#
+# Generation writes one generated file per module. The journal records which modules a run set out
+# to regenerate and which of those it finished (and what it wrote), so a run that is interrupted
+# part way through can be resumed by regenerating only the modules that were still in flight.
+
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationJournal(object):
+  """An append-only log of a generation run, kept in a single file.
+
+  Each record is one tab-separated line, written and flushed as soon as the step it describes is
+  complete. A process that is killed leaves every completed record behind; a record that was only
+  partly written when the process died is ignored when the journal is read back.
+  """
+
+  class FormatError(Exception):
+    """Raised when a journal can't be parsed."""
+
+  class State(object):
+    """What a journal says about the run that wrote it."""
+
+    def __init__(self, fingerprint, planned, done):
+      """
+      :param string fingerprint: fingerprint of the inputs the run was generating from.
+      :param planned: units of work the run set out to do, in order.
+      :param dict done: map of finished unit -> (relative path, content hash) of the file it wrote,
+        or (None, None) if it didn't write one.
+      """
+      self.fingerprint = fingerprint
+      self.planned = planned
+      self.done = done
+
+    def pending(self, current_hashes):
+      """Lists the planned units that still need to be done.
+
+      :param dict current_hashes: map of relative path -> content hash of the generated files
+        currently in the workspace. A finished unit whose file no longer matches is redone.
+      :return: list of units, in the order they were planned.
+      """
+      pending = []
+      for unit in self.planned:
+        if unit in self.done:
+          relpath, content_hash = self.done[unit]
+          if relpath is None or current_hashes.get(relpath) == content_hash:
+            continue
+        pending.append(unit)
+      return pending
+
+  _VERSION = 1
+  _HEADER = '# checkpoms generation journal version {0}'.format(_VERSION)
+
+  def __init__(self, path):
+    self.path = path
+
+  def read(self):
+    """Reads back the journal left by a previous run.
+
+    :return: a State, or None if there is no journal.
+    :raises: FormatError if the journal can't be parsed.
+    """
+    try:
+      with open(self.path, 'r') as f:
+        data = f.read()
+    except (IOError, OSError):
+      return None
+    lines = data.split('\n')
+    # The last element is either empty, or a record which was interrupted part way through.
+    lines.pop()
+    if not lines or lines[0] != self._HEADER:
+      raise self.FormatError('Unexpected journal header in {0}'.format(self.path))
+    fingerprint, planned, done = None, [], {}
+    for line in lines[1:]:
+      fields = line.split('\t')
+      if fields[0] == 'begin' and len(fields) == 2:
+        fingerprint = fields[1]
+      elif fields[0] == 'plan' and len(fields) == 2:
+        planned.append(fields[1])
+      elif fields[0] == 'done' and len(fields) == 4:
+        done[fields[1]] = (fields[2] or None, fields[3] or None)
+      else:
+        raise self.FormatError('Unexpected journal record in {0}: {1}'.format(self.path, line))
+    if fingerprint is None:
+      raise self.FormatError('No begin record in {0}'.format(self.path))
+    return self.State(fingerprint, planned, done)
+
+  def begin(self, fingerprint, units):
+    """Starts a new journal, replacing any previous one.
+
+    :param string fingerprint: fingerprint of the inputs being generated from.
+    :param units: names of the units of work that will be done.
+    """
+    lines = [self._HEADER, 'begin\t{0}'.format(fingerprint)]
+    lines.extend('plan\t{0}'.format(unit) for unit in units)
+    if not os.path.isdir(os.path.dirname(self.path)):
+      os.makedirs(os.path.dirname(self.path))
+    tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      f.write('\n'.join(lines) + '\n')
+    os.rename(tmp_path, self.path)
+
+  def done(self, unit, relpath=None, content_hash=None):
+    """Records that a unit of work is finished.
+
+    :param string relpath: relative path of the file the unit wrote, if any.
+    :param string content_hash: content hash of that file.
+    """
+    self._append('done', unit, relpath or '', content_hash or '')
+
+  def clear(self):
+    """Removes the journal once the run it describes is complete."""
+    try:
+      os.remove(self.path)
+    except OSError:
+      pass
+
+  def _append(self, *fields):
+    # Flushing on close is enough to survive the process being killed; the journal isn't meant to
+    # survive the machine crashing.
+    with open(self.path, 'a') as f:
+      f.write('\t'.join(fields) + '\n')
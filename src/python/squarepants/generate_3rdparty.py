@@ -1,14 +1,19 @@
 #!/usr/bin/python
 # Used to automatically pull in external dependencies defined in Maven into Pants' 3rdparty BUILD
 
+import json
 import logging
 import os
+import re
 import sys
 from collections import defaultdict, namedtuple
+from glob import glob
+from hashlib import sha1
 from textwrap import dedent
 
 from pom_utils import PomUtils
 from generation_utils import GenerationUtils
+from maven_closure import Closure, DependencyGraph, LocalMavenRepository, node_name
 from target_template import Target
 from pom_file import PomFile
 
@@ -20,6 +25,27 @@ _excludes = [
               #'com.google.guava.guava',
             ]
 
+_BUILD_FILE = '3rdparty/BUILD.gen'
+# Shards of the generated 3rdparty targets each get a BUILD.gen in a subdirectory of this one.
+_SHARD_DIRECTORY = '3rdparty/shards'
+# Properties in parents/base/pom.xml which turn on sharding: shard-by is 'org' or 'bucket'.
+_SHARD_BY_PROPERTY = 'squarepants.3rdparty.shard-by'
+_SHARD_BUCKETS_PROPERTY = 'squarepants.3rdparty.shard-buckets'
+_DEFAULT_SHARD_BUCKETS = 16
+# Properties in parents/base/pom.xml which turn on resolving the managed artifacts' transitive
+# dependencies from a local Maven repository: closure is one of the _CLOSURE_MODES.
+_CLOSURE_PROPERTY = 'squarepants.3rdparty.closure'
+_M2_REPOSITORY_PROPERTY = 'squarepants.3rdparty.m2-repository'
+# lockfile writes _LOCKFILE; pinned and intransitive write _PINNED_BUILD_FILE, whose
+# jar_library() targets list every jar in the closure, pinned to its mediated version.
+_CLOSURE_MODES = ('lockfile', 'pinned', 'intransitive')
+_LOCKFILE = '3rdparty/3rdparty.lock.json'
+_PINNED_BUILD_FILE = '3rdparty/pinned/BUILD.gen'
+_GRAPH_CACHE_FILE = '.pants.d/pom-gen/m2-graph.json'
+# Fingerprint of the managed dependencies 3rdparty/BUILD.gen was last generated from.
+_STATE_FILE = '.pants.d/pom-gen/3rdparty-fingerprint.json'
+_STATE_VERSION = 1
+
 
 class ArtifactId(namedtuple('Id', ['org', 'name', 'rev'])):
 
@@ -42,6 +68,48 @@ class ArtifactId(namedtuple('Id', ['org', 'name', 'rev'])):
     return True
 
 
+class ArtifactSetIndex(object):
+  """Finds which named set of ArtifactId patterns an artifact belongs to.
+
+  The patterns are indexed by org, then name, then rev, with None as the wildcard at each level, so
+  a lookup costs at most eight dict probes no matter how many sets or patterns there are.
+  """
+
+  def __init__(self, artifact_sets):
+    """
+    :param dict artifact_sets: map of set name -> list of ArtifactIds, whose None fields match
+      anything (see ArtifactId.contains()).
+    """
+    self._index = {}
+    for set_name, patterns in artifact_sets.items():
+      for pattern in patterns:
+        names = self._index.setdefault(pattern.org, {}).setdefault(pattern.name, {})
+        # If the same pattern is in two sets, pick one deterministically.
+        names[pattern.rev] = min(set_name, names.get(pattern.rev, set_name))
+
+  def lookup(self, id):
+    """Finds the set containing a pattern which matches the given id.
+
+    If patterns from several sets match, the most specific one wins: an exact org beats a wildcard
+    org, then likewise for name and rev.
+
+    :param ArtifactId id: the artifact to look up.
+    :return: the name of the set, or None.
+    """
+    for org in (id.org, None):
+      names = self._index.get(org)
+      if names is None:
+        continue
+      for name in (id.name, None):
+        revs = names.get(name)
+        if revs is None:
+          continue
+        for rev in (id.rev, None):
+          if rev in revs:
+            return revs[rev]
+    return None
+
+
 class ThirdPartyBuildGenerator(object):
 
   # Sets of artifact coordinates to keep in separated managed dependencies. This allows downstream
@@ -58,21 +126,59 @@ class ThirdPartyBuildGenerator(object):
   def _compute_dependencies(self):
     return PomUtils.dependency_management_finder().find_dependencies('parents/base/pom.xml')
 
-  @classmethod
-  def _get_artifact_set(cls, id):
-    for name, artifacts in cls._disjoint_artifact_sets.items():
-      if any(artifact.contains(id) for artifact in artifacts):
-        return name
-    return None
+  def _get_artifact_set(self, id):
+    return self._artifact_set_index.lookup(id)
 
   @classmethod
   def _substitute_symbols(cls, s):
     return GenerationUtils.symbol_substitution(PomFile('parents/base/pom.xml').properties, s)
 
-  def __init__(self, dependencies=None):
+  @classmethod
+  def _configured_options(cls):
+    properties = PomFile('parents/base/pom.xml').properties
+    return {
+      'shard_by': properties.get(_SHARD_BY_PROPERTY) or None,
+      'buckets': int(properties.get(_SHARD_BUCKETS_PROPERTY) or _DEFAULT_SHARD_BUCKETS),
+      'closure': properties.get(_CLOSURE_PROPERTY) or None,
+      'm2_repository': properties.get(_M2_REPOSITORY_PROPERTY) or None,
+    }
+
+  def __init__(self, dependencies=None, shard_by=None, buckets=_DEFAULT_SHARD_BUCKETS,
+               closure=None, m2_repository=None, graph_cache_file=_GRAPH_CACHE_FILE):
+    """
+    :param list dependencies: the managed dependencies, as dicts. Defaults to the
+      dependencyManagement section of parents/base/pom.xml, in which case the other options
+      default to its squarepants.3rdparty.* properties.
+    :param string shard_by: how generate_files() splits up the jar_library() targets: 'org' puts
+      each org in its own BUILD file, 'bucket' spreads them over a fixed number of BUILD files by
+      hash, and None keeps everything in 3rdparty/BUILD.gen.
+    :param int buckets: the number of BUILD files to use when sharding by bucket.
+    :param string closure: what generate_files() writes from the managed artifacts' transitive
+      closure, read from a local Maven repository: 'lockfile' for a JSON sidecar, 'pinned' for
+      jar_library() targets listing every jar in the closure at its mediated version,
+      'intransitive' for the same with intransitive jars, or None to skip resolving the closure.
+    :param string m2_repository: the local Maven repository; defaults to ~/.m2/repository.
+    :param string graph_cache_file: where to cache the dependencies read from the repository.
+    """
     if dependencies is None:
       dependencies = self._compute_dependencies()
+      if shard_by is None and closure is None:
+        options = self._configured_options()
+        shard_by, buckets = options['shard_by'], options['buckets']
+        closure, m2_repository = options['closure'], options['m2_repository']
+    if shard_by not in (None, 'org', 'bucket'):
+      raise ValueError('Unknown 3rdparty shard type {0!r}, expected org or bucket.'.format(shard_by))
+    if closure not in (None,) + _CLOSURE_MODES:
+      raise ValueError('Unknown 3rdparty closure output {0!r}, expected one of {1}.'
+                       .format(closure, ', '.join(_CLOSURE_MODES)))
     self._deps = dependencies
+    self._artifact_set_index = ArtifactSetIndex(self._disjoint_artifact_sets)
+    self._shard_by = shard_by
+    self._buckets = buckets
+    self._closure_mode = closure
+    self._m2_repository = m2_repository
+    self._graph_cache_file = graph_cache_file
+    self._resolved_closure = None
 
   class Artifact(object):
     """Represents a single external dependency artifact (such as a jar or a pom file)."""
@@ -106,14 +212,15 @@ class ThirdPartyBuildGenerator(object):
     def id(self):
       return ArtifactId(self.groupId, self.artifactId, self.version)
 
-    def format(self):
+    def format(self, intransitive=None):
       return Target.sjar.format(org=self.groupId,
                                 name=self.artifactId,
                                 rev=self.version,
                                 classifier=self.classifier,
                                 type_=self.type_,
                                 force=self.force,
-                                excludes=self.jar_excludes)
+                                excludes=self.jar_excludes,
+                                intransitive=intransitive)
 
   class ManagedLibrary(object):
     """Stores the data and formats the BUILD target for a jar_library()."""
@@ -146,15 +253,21 @@ class ThirdPartyBuildGenerator(object):
         return self.spec
       return self.artifacts[0].format()
 
-    def format_body(self):
+    def format_body(self, managed_dependencies_spec=None):
       """The body of the target (ie jar_library(...)) for inclusion in a build file.
 
       If this library has no body, this returns the emptystring.
+
+      :param string managed_dependencies_spec: the spec of this library's managed dependencies,
+        when the library is written to a different BUILD file than they are. Every library has a
+        body in that case, since no managed_jar_libraries() target generates it.
       """
-      if not self.has_body:
+      if not self.has_body and not managed_dependencies_spec:
         return ''
       management = ''
-      if self.managed_dependencies:
+      if managed_dependencies_spec:
+        management = "\n  managed_dependencies='{}',".format(managed_dependencies_spec)
+      elif self.managed_dependencies:
         management = "\n  managed_dependencies=':{}',".format(self.managed_dependencies.name)
       return GenerationUtils.autoindent(ThirdPartyBuildGenerator._substitute_symbols(dedent('''
         jar_library(name='{name}',
@@ -192,9 +305,12 @@ class ThirdPartyBuildGenerator(object):
       library.managed_dependencies = self
       self.libraries.append(library)
 
-    def _formatted_jars(self):
+    def _formatted_jars(self, spec_for=None):
       for jar in self.libraries:
-        yield jar.format_reference() if self.generate_libraries else jar.spec
+        if spec_for:
+          yield "'{}'".format(spec_for(jar))
+        else:
+          yield jar.format_reference() if self.generate_libraries else jar.spec
 
     @property
     def _type_explanation(self):
@@ -202,9 +318,15 @@ class ThirdPartyBuildGenerator(object):
         return 'This target pins artifact versions, and also generates jar_library() targets.'
       return 'This target pins artifact versions, but does not generate jar_library() targets.'
 
-    def format(self):
-      """Generates a formatted string for inclusion in a BUILD file."""
-      references = sorted(self._formatted_jars())
+    def format(self, spec_for=None):
+      """Generates a formatted string for inclusion in a BUILD file.
+
+      :param spec_for: function which returns the spec of a ManagedLibrary's jar_library() target,
+        when those are written to other BUILD files. This target then only references them, rather
+        than generating them.
+      """
+      generate_libraries = self.generate_libraries and not spec_for
+      references = sorted(self._formatted_jars(spec_for))
       return GenerationUtils.autoindent(ThirdPartyBuildGenerator._substitute_symbols(dedent('''
         # {type_explanation}
         managed_jar_{type_}(name='{name}',
@@ -215,23 +337,37 @@ class ThirdPartyBuildGenerator(object):
         name=self.name,
         artifacts=''.join('\n    {},'.format(s) for s in references),
         parent='' if not self.parent else "\n  dependencies=[':{}'],".format(self.parent),
-        type_='libraries' if self.generate_libraries else 'dependencies',
-        type_explanation=self._type_explanation,
+        type_='libraries' if generate_libraries else 'dependencies',
+        type_explanation=self._type_explanation if not spec_for else
+          'This target pins artifact versions of the jar_library() targets in 3rdparty/shards.',
       )))
 
-  def generate(self):
-    header = dedent('''
+  @classmethod
+  def _header(cls):
+    return dedent('''
       # Automatically generated by {0}
 
     ''').lstrip().format(os.path.basename(sys.argv[0]))
+
+  def _managed_dependencies(self):
+    """Groups the artifacts into libraries and the libraries into managed dependencies.
+
+    This is one pass over the artifacts to group them by id, and one pass over the ids in sorted
+    order, so it takes O(n log n) time in the number of managed artifacts.
+
+    :return: list of ManagedDependencies, largest first.
+    """
+    excludes = frozenset(_excludes)
+    debug = logger.isEnabledFor(logging.DEBUG)
     artifacts_by_id = defaultdict(list)
     versions_by_name = defaultdict(set)
     for dep in self._deps:
-      artifact = "{groupId}.{artifactId}".format(groupId=dep['groupId'] ,
-                                                 artifactId=dep['artifactId'],)
-      if artifact in _excludes:
-        logger.debug("skipping " + artifact)
-        continue
+      if excludes:
+        artifact = "{groupId}.{artifactId}".format(groupId=dep['groupId'] ,
+                                                   artifactId=dep['artifactId'],)
+        if artifact in excludes:
+          logger.debug("skipping " + artifact)
+          continue
       artifact = self.Artifact(dep)
       artifacts_by_id[artifact.id].append(artifact)
       versions_by_name[artifact.name].add(artifact.version)
@@ -263,9 +399,10 @@ class ThirdPartyBuildGenerator(object):
         managed = True
 
       library_name = ''.join(name_buffer)
-      logger.debug("Adding {jars} as {name}.".format(
-        jars=', '.join(jar.name for jar in artifact_list),
-        name=library_name))
+      if debug:
+        logger.debug("Adding {jars} as {name}.".format(
+          jars=', '.join(jar.name for jar in artifact_list),
+          name=library_name))
 
       if managed:
         management_name = self._get_artifact_set(artifact_id) or default_name
@@ -292,17 +429,329 @@ class ThirdPartyBuildGenerator(object):
       # If there are no special-case managed dependencies, we only need the single global target.
       managed_dependencies_by_name.pop(default_name)
 
-    managed_dependencies = sorted(managed_dependencies_by_name.values(),
-                                  key=lambda m: (-len(m.libraries), m.name))
+    return sorted(managed_dependencies_by_name.values(), key=lambda m: (-len(m.libraries), m.name))
 
+  def generate(self):
+    """:return: the contents of a single 3rdparty/BUILD.gen holding every target."""
+    managed_dependencies = self._managed_dependencies()
     parts = []
-    parts.append(header)
+    parts.append(self._header())
     parts.extend(deps.format() for deps in managed_dependencies)
     for deps in managed_dependencies:
       if deps.generate_libraries:
         parts.extend(sorted(filter(None, (jar.format_body() for jar in deps.libraries))))
     return ''.join(parts)
 
+  def managed_artifacts(self):
+    """Summarizes the managed dependencies, for fingerprinting and for reporting what changed.
+
+    :return: dict of artifact name (see Artifact.name) -> dict with the sorted 'versions' it is
+      managed at and the sorted 'exclusions' (as org:name) of those versions.
+    """
+    artifacts = {}
+    for dep in self._deps:
+      artifact = self.Artifact(dep)
+      summary = artifacts.setdefault(artifact.name, {'versions': set(), 'exclusions': set()})
+      summary['versions'].add(artifact.version)
+      summary['exclusions'].update('{groupId}:{artifactId}'.format(**exclusion)
+                                   for exclusion in dep.get('exclusions') or ())
+    for summary in artifacts.values():
+      summary['versions'] = sorted(summary['versions'])
+      summary['exclusions'] = sorted(summary['exclusions'])
+    return artifacts
+
+  def _referenced_properties(self):
+    """Finds the values of the properties the managed dependencies still refer to.
+
+    The dependencyManagement section is resolved against its own pom's properties as it's read;
+    anything left over is substituted from parents/base/pom.xml when the targets are formatted.
+    """
+    names = set()
+    for dep in self._deps:
+      for value in dep.values():
+        if isinstance(value, basestring):
+          names.update(re.findall(r'[$][{]([^{}]*?)[}]', value))
+    if not names:
+      return {}
+    properties = PomFile('parents/base/pom.xml').properties
+    return dict((name, properties.get(name)) for name in names)
+
+  @classmethod
+  def _generator_hash(cls):
+    try:
+      with open(os.path.splitext(__file__)[0] + '.py', 'rb') as f:
+        return sha1(f.read()).hexdigest()
+    except IOError:
+      return None # Eg when running from a pex; the checkpoms fingerprint still covers this file.
+
+  def fingerprint(self, artifacts=None):
+    """Fingerprints everything the generated 3rdparty BUILD files depend on.
+
+    That's the managed artifacts' coordinates, versions and exclusions, the properties they
+    reference, how the output is sharded, and this generator's own source.
+
+    :param dict artifacts: the result of managed_artifacts(), if it has already been computed.
+    :return: hex digest.
+    """
+    if artifacts is None:
+      artifacts = self.managed_artifacts()
+    return sha1(json.dumps({
+      'version': _STATE_VERSION,
+      'generator': self._generator_hash(),
+      'artifacts': artifacts,
+      'properties': self._referenced_properties(),
+      'shard_by': self._shard_by,
+      'buckets': self._buckets if self._shard_by == 'bucket' else None,
+      'closure': self._closure_mode and [self._closure_mode, self.closure().to_lockfile()],
+    }, sort_keys=True)).hexdigest()
+
+  def closure(self):
+    """Resolves the transitive closure of the managed artifacts from the local Maven repository.
+
+    :return: Closure
+    """
+    if self._resolved_closure is None:
+      excludes = frozenset(_excludes)
+      roots = [dep for dep in self._deps
+               if '{groupId}.{artifactId}'.format(**dep) not in excludes]
+      graph = DependencyGraph(LocalMavenRepository(self._m2_repository),
+                              cache_file=self._graph_cache_file)
+      self._resolved_closure = Closure.resolve(roots, graph)
+      if self._resolved_closure.missing:
+        logger.warn('{0} POMs were not found in {1}, their dependencies are not pinned.'
+                    .format(len(self._resolved_closure.missing), graph.repository.root))
+    return self._resolved_closure
+
+  def _generate_pinned(self, managed_dependencies):
+    """Generates jar_library() targets which list every jar in each library's closure."""
+    closure = self.closure()
+    intransitive = True if self._closure_mode == 'intransitive' else None
+    parts = [self._header()]
+    for deps in managed_dependencies:
+      if not deps.generate_libraries:
+        continue
+      for library in deps.libraries:
+        own = set(node_name(a.groupId, a.artifactId, a.classifier) for a in library.artifacts)
+        reached = set()
+        for artifact in library.artifacts:
+          reached.update(closure.dependencies.get(
+            node_name(artifact.groupId, artifact.artifactId, artifact.classifier), ()))
+        jars = [artifact.format(intransitive=intransitive) for artifact in library.artifacts]
+        for name in sorted(reached - own):
+          if closure.types.get(name) == 'pom':
+            continue # Only brings in its own dependencies, which are already in the closure.
+          coordinate = name.split(':')
+          jars.append(Target.sjar.format(org=coordinate[0],
+                                         name=coordinate[1],
+                                         rev=closure.versions[node_name(*coordinate[:2])],
+                                         classifier=coordinate[2] if len(coordinate) > 2 else None,
+                                         type_=closure.types.get(name),
+                                         intransitive=intransitive))
+        parts.append(GenerationUtils.autoindent(self._substitute_symbols(dedent('''
+          jar_library(name='{name}',
+            jars=[
+              {jars},
+            ],
+          )
+        ''').format(name=library.name, jars=',\n    '.join(jars)))))
+    return ''.join(parts)
+
+  def _shard(self, library):
+    if self._shard_by == 'org':
+      return library.artifacts[0].groupId
+    return 'bucket-{0:02d}'.format(int(sha1(library.name).hexdigest(), 16) % self._buckets)
+
+  def generate_files(self):
+    """Generates the 3rdparty BUILD files, sharded if this generator was configured to.
+
+    When sharded, each jar_library() target goes in 3rdparty/shards/<shard>/BUILD.gen.
+    3rdparty/BUILD.gen keeps the managed dependencies targets, which only reference the libraries,
+    and an alias for each library so that 3rdparty:<name> specs keep working. Versions only
+    appear in the shards, so changing one artifact's version only changes its shard.
+
+    If this generator was configured to resolve the managed artifacts' closure, this also
+    generates 3rdparty/3rdparty.lock.json or 3rdparty/pinned/BUILD.gen.
+
+    :return: dict of path relative to the repo root -> contents.
+    """
+    files = {}
+    if self._closure_mode == 'lockfile':
+      files[_LOCKFILE] = self.closure().to_lockfile()
+    elif self._closure_mode:
+      files[_PINNED_BUILD_FILE] = self._generate_pinned(self._managed_dependencies())
+
+    if not self._shard_by:
+      files[_BUILD_FILE] = self.generate()
+      return files
+
+    managed_dependencies = self._managed_dependencies()
+    specs = {}
+    bodies = defaultdict(list)
+    for deps in managed_dependencies:
+      if not deps.generate_libraries:
+        continue
+      for library in deps.libraries:
+        shard_dir = '{0}/{1}'.format(_SHARD_DIRECTORY, self._shard(library))
+        specs[library.name] = '{0}:{1}'.format(shard_dir, library.name)
+        bodies[shard_dir].append(library.format_body(
+          managed_dependencies_spec='3rdparty:{0}'.format(library.managed_dependencies.name)))
+
+    spec_for = lambda library: specs[library.name]
+    parts = [self._header()]
+    parts.extend(deps.format(spec_for=spec_for) for deps in managed_dependencies)
+    parts.append('\n# Aliases for the jar_library() targets in 3rdparty/shards.\n')
+    parts.extend("target(name='{0}', dependencies=['{1}'])\n".format(name, spec)
+                 for name, spec in sorted(specs.items()))
+    files[_BUILD_FILE] = ''.join(parts)
+    for shard_dir, shard_bodies in bodies.items():
+      files['{0}/BUILD.gen'.format(shard_dir)] = self._header() + ''.join(sorted(shard_bodies))
+    return files
+
+
+def write_build_files(files, rootdir=None):
+  """Writes out generated 3rdparty BUILD files, leaving those whose contents are unchanged alone.
+
+  Files are replaced rather than written in place, since they may be hardlinked from a cache.
+  Shards under 3rdparty/shards which are no longer generated are removed.
+
+  :param dict files: map of path relative to rootdir -> contents, as from generate_files().
+  :param string rootdir: the root of the repo; defaults to the working directory.
+  :return: tuple of (written, unchanged, removed) lists of relative paths.
+  """
+  rootdir = rootdir or '.'
+  written, unchanged = [], []
+  for relpath, contents in sorted(files.items()):
+    path = os.path.join(rootdir, relpath)
+    try:
+      with open(path, 'r') as f:
+        if f.read() == contents:
+          unchanged.append(relpath)
+          continue
+    except IOError:
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      f.write(contents)
+    os.rename(tmp_path, path)
+    written.append(relpath)
+
+  removed = []
+  outputs = glob(os.path.join(rootdir, _SHARD_DIRECTORY, '*', 'BUILD.gen'))
+  outputs.extend(os.path.join(rootdir, relpath) for relpath in (_LOCKFILE, _PINNED_BUILD_FILE))
+  for path in outputs:
+    relpath = os.path.relpath(path, rootdir)
+    if relpath not in files and os.path.exists(path):
+      os.remove(path)
+      if not os.listdir(os.path.dirname(path)):
+        os.rmdir(os.path.dirname(path))
+      removed.append(relpath)
+  return written, unchanged, removed
+
+
+ThirdPartyUpdate = namedtuple('ThirdPartyUpdate', ['skipped', 'added', 'removed', 'changed',
+                                                   'written', 'unchanged', 'deleted'])
+
+
+def diff_managed_artifacts(old, new):
+  """Compares two results of ThirdPartyBuildGenerator.managed_artifacts().
+
+  :return: tuple of (added, removed, changed): sorted lists of (name, summary) tuples for the
+    first two, and of (name, old summary, new summary) tuples for the last.
+  """
+  added = sorted((name, new[name]) for name in set(new) - set(old))
+  removed = sorted((name, old[name]) for name in set(old) - set(new))
+  changed = sorted((name, old[name], new[name]) for name in set(old) & set(new)
+                   if old[name] != new[name])
+  return added, removed, changed
+
+
+def format_update(update):
+  """Formats a ThirdPartyUpdate as a per-artifact report.
+
+  :return: list of lines.
+  """
+  if update.skipped:
+    return ['3rdparty managed dependencies are unchanged, skipping generation.']
+  lines = ['3rdparty managed dependencies: {0} added, {1} removed, {2} changed.'
+           .format(len(update.added), len(update.removed), len(update.changed))]
+  lines.extend('  + {0} {1}'.format(name, ', '.join(summary['versions']))
+               for name, summary in update.added)
+  lines.extend('  - {0} {1}'.format(name, ', '.join(summary['versions']))
+               for name, summary in update.removed)
+  for name, old, new in update.changed:
+    detail = []
+    if old['versions'] != new['versions']:
+      detail.append('{0} -> {1}'.format(', '.join(old['versions']), ', '.join(new['versions'])))
+    if old['exclusions'] != new['exclusions']:
+      detail.append('exclusions {0} -> {1}'.format(', '.join(old['exclusions']) or 'none',
+                                                  ', '.join(new['exclusions']) or 'none'))
+    lines.append('  * {0} {1}'.format(name, '; '.join(detail)))
+  lines.append('  {0} BUILD files rewritten, {1} unchanged, {2} removed.'
+               .format(len(update.written), len(update.unchanged), len(update.deleted)))
+  return lines
+
+
+def _read_state(path):
+  try:
+    with open(path, 'r') as f:
+      state = json.load(f)
+  except (IOError, ValueError):
+    return None
+  if not isinstance(state, dict) or state.get('version') != _STATE_VERSION:
+    return None
+  return state
+
+
+def _file_hashes(relpaths, rootdir):
+  hashes = {}
+  for relpath in relpaths:
+    try:
+      with open(os.path.join(rootdir, relpath), 'rb') as f:
+        hashes[relpath] = sha1(f.read()).hexdigest()
+    except IOError:
+      pass
+  return hashes
+
+
+def update_build_files(generator=None, rootdir=None, state_file=None):
+  """Regenerates the 3rdparty BUILD files, unless nothing they are generated from has changed.
+
+  Generation is skipped when the generator's fingerprint matches the one recorded by the last
+  run and the files that run wrote are still there, untouched.
+
+  :param ThirdPartyBuildGenerator generator: defaults to one reading parents/base/pom.xml.
+  :param string rootdir: the root of the repo; defaults to the working directory.
+  :param string state_file: where the last run's fingerprint is kept, relative to rootdir.
+  :return: ThirdPartyUpdate
+  """
+  rootdir = rootdir or '.'
+  generator = generator or ThirdPartyBuildGenerator()
+  state_path = os.path.join(rootdir, state_file or _STATE_FILE)
+  artifacts = generator.managed_artifacts()
+  fingerprint = generator.fingerprint(artifacts)
+  previous = _read_state(state_path) or {}
+  if (previous.get('fingerprint') == fingerprint
+      and _file_hashes(previous['files'], rootdir) == previous['files']):
+    return ThirdPartyUpdate(True, [], [], [], [], sorted(previous['files']), [])
+
+  added, removed, changed = diff_managed_artifacts(previous.get('artifacts', {}), artifacts)
+  files = generator.generate_files()
+  written, unchanged, deleted = write_build_files(files, rootdir)
+
+  if not os.path.isdir(os.path.dirname(state_path)):
+    os.makedirs(os.path.dirname(state_path))
+  tmp_path = '{0}.{1}.tmp'.format(state_path, os.getpid())
+  with open(tmp_path, 'w') as f:
+    json.dump({
+      'version': _STATE_VERSION,
+      'fingerprint': fingerprint,
+      'artifacts': artifacts,
+      'files': _file_hashes(files, rootdir),
+    }, f, indent=2, sort_keys=True)
+  os.rename(tmp_path, state_path)
+  return ThirdPartyUpdate(False, added, removed, changed, written, unchanged, deleted)
+
 
 def main():
   """Test driver that spits out <dependencyManagement> contents.
@@ -56,6 +56,8 @@ class GenerationContext(object):
     self.settings_to_platforms = {}
     self.pom_file_cache = {}
     self.os_to_java_homes = {}
+    # If not None, write_build_file() appends the (path, contents) of each file it writes here.
+    self.written_build_files = None
 
   def get_pants_ini_gen(self):
     return [
@@ -147,3 +149,5 @@ class GenerationContext(object):
       contents = header + contents
     with open(outfile_name, 'w') as outfile:
       outfile.write(contents)
+    if self.written_build_files is not None:
+      self.written_build_files.append((outfile_name, contents))
@@ -2,17 +2,31 @@
 # Copyright 2015 Square, Inc.
 
 import heapq
-import functools
-from collections import defaultdict
+import itertools
+from array import array
+from collections import deque
 
 
 class Graph(object):
-  """Simple directed graph using dicts and sets to store directed edges."""
+  """Directed graph which interns its vertices to integer ids.
+
+  Each vertex is assigned a small integer id the first time it is seen, and adjacency is stored per
+  id as a dict of neighbor id -> edge weight, in both directions. So adding or removing an edge is
+  O(1), removing a vertex is O(degree), and copying or transposing the graph only copies the
+  adjacency dicts rather than re-adding every edge. Algorithms which walk the whole graph work from
+  a compressed sparse row (CSR) snapshot of the adjacency; see _csr().
+  """
 
   class CycleError(Exception):
     """Raised if a cycle is detected during a topsort."""
 
+    def __init__(self, message, cycles=()):
+      super(Graph.CycleError, self).__init__(message)
+      self.cycles = list(cycles)
+
   class Edge(object):
+    __slots__ = ('_src', '_dst', '_weight')
+
     def __init__(self, src, dst, weight=1.0):
       self._src = src
       self._dst = dst
@@ -40,23 +54,164 @@ class Graph(object):
     def __str__(self):
       return '{} -> {}'.format(self.src, self.dst)
 
+    # Like before, the weight isn't part of an edge's identity.
     def __hash__(self):
-      return hash(str(self))
+      return hash((self._src, self._dst))
 
     def __eq__(self, other):
-      return str(self) == str(other)
+      return (isinstance(other, Graph.Edge)
+              and self._src == other._src and self._dst == other._dst)
+
+    def __ne__(self, other):
+      return not self == other
+
+
+  # Orders in which traverse() can expand vertices.
+  BFS = 'bfs'
+  DFS = 'dfs'
+  UNIFORM_COST = 'uniform-cost'
+
+  class Search(object):
+    """A graph search, run lazily as it is iterated; see Graph.traverse().
+
+    Iterating yields each reachable vertex once, in the order it is expanded. Only a parent pointer
+    and a distance are kept per visited vertex, and paths are rebuilt from the parent pointers when
+    path() is called, so expanding a vertex costs O(degree) no matter how deep it is.
+    """
+
+    # Parent of the start vertices; None could be a vertex.
+    _ROOT = object()
+
+    def __init__(self, starts, adjacent, order, cycle_handler, cost):
+      if order not in (Graph.BFS, Graph.DFS, Graph.UNIFORM_COST):
+        raise ValueError('Unknown search order {!r}.'.format(order))
+      self._starts = starts
+      self._adjacent = adjacent
+      self._order = order
+      self._cycle_handler = cycle_handler
+      self._cost = cost
+      self._parents = {}
+      self._distances = {}
+      self._vertices = self._run()
+
+    def __iter__(self):
+      return self._vertices
+
+    def _run(self):
+      # Frontier entries are (vertex, parent, distance), or (distance, tiebreak, vertex, parent)
+      # in the uniform cost search's heap, where the tiebreak keeps equal distances first-in,
+      # first-out.
+      if self._order == Graph.UNIFORM_COST:
+        frontier = []
+        counter = itertools.count()
+        push = lambda vertex, parent, distance: heapq.heappush(
+          frontier, (distance, next(counter), vertex, parent))
+        def pop():
+          distance, _, vertex, parent = heapq.heappop(frontier)
+          return vertex, parent, distance
+      else:
+        frontier = deque() if self._order == Graph.BFS else []
+        push = lambda vertex, parent, distance: frontier.append((vertex, parent, distance))
+        pop = frontier.popleft if self._order == Graph.BFS else frontier.pop
+      cost = self._cost or (lambda src, dst: 1)
+      adjacent, cycle_handler = self._adjacent, self._cycle_handler
+      parents, distances = self._parents, self._distances
+
+      for start in self._starts:
+        push(start, self._ROOT, 0)
+      while frontier:
+        vertex, parent, distance = pop()
+        if vertex in parents:
+          continue
+        parents[vertex] = parent
+        distances[vertex] = distance
+
+        yield vertex
+
+        for neighbor in adjacent(vertex):
+          if neighbor not in parents:
+            push(neighbor, vertex, distance + cost(vertex, neighbor))
+          elif cycle_handler and self._on_path(neighbor, vertex):
+            cycle_handler(self.path(vertex) + (vertex,), neighbor)
+
+    def _on_path(self, ancestor, vertex):
+      """Returns True if ancestor is vertex, or is on the path by which vertex was reached."""
+      while vertex is not self._ROOT:
+        if vertex == ancestor:
+          return True
+        vertex = self._parents[vertex]
+      return False
+
+    def path(self, vertex):
+      """Returns the tuple of vertices by which the (visited) vertex was reached, excluding itself.
+
+      The first vertex is the start the search reached vertex from; a start's path is empty.
+      """
+      path = []
+      parent = self._parents[vertex]
+      while parent is not self._ROOT:
+        path.append(parent)
+        parent = self._parents[parent]
+      path.reverse()
+      return tuple(path)
+
+    def distance(self, vertex):
+      """Returns the cost of the path to the (visited) vertex; for BFS and DFS, its length."""
+      return self._distances[vertex]
 
 
   def __init__(self, vertices=None, edges=None):
-    self._incomingEdges = defaultdict(set)
-    self._outgoingEdges = defaultdict(set)
+    # vertex -> id, and id -> vertex.
+    self._ids = {}
+    self._names = []
+    # id -> {neighbor id: weight}.
+    self._out = []
+    self._in = []
+    # Only the vertices which were explicitly added; edges may refer to other vertices too.
     self._vertices = set()
+    # Cached CSR snapshots of the adjacency, keyed by direction. Cleared on every modification.
+    self._snapshots = {}
     if vertices:
-      self._vertices.update(vertices)
+      for vertex in vertices:
+        self.add_vertex(vertex)
     if edges:
       for edge in edges:
         self.add_edge(edge)
 
+  def _intern(self, vertex):
+    """Returns the id of the vertex, assigning it a new one if it hasn't been seen before."""
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is None:
+      vertex_id = len(self._names)
+      self._ids[vertex] = vertex_id
+      self._names.append(vertex)
+      self._out.append({})
+      self._in.append({})
+    return vertex_id
+
+  def _modified(self):
+    if self._snapshots:
+      self._snapshots = {}
+
+  def _csr(self, incoming=False):
+    """Returns a compressed sparse row snapshot of the adjacency as an (offsets, targets) pair.
+
+    The neighbor ids of the vertex with id i are targets[offsets[i]:offsets[i + 1]]. The snapshot is
+    cached until the graph is next modified.
+
+    :param bool incoming: if True, the snapshot lists the sources of each vertex's incoming edges
+      rather than the destinations of its outgoing ones.
+    """
+    snapshot = self._snapshots.get(incoming)
+    if snapshot is None:
+      offsets = array('l', [0])
+      targets = array('l')
+      for neighbors in (self._in if incoming else self._out):
+        targets.extend(neighbors)
+        offsets.append(len(targets))
+      snapshot = self._snapshots[incoming] = (offsets, targets)
+    return snapshot
+
   @property
   def vertices(self):
     """All vertices in this graph."""
@@ -65,66 +220,141 @@ class Graph(object):
   @property
   def edges(self):
     """All directed edges in this graph."""
-    return reduce(set.union, self._incomingEdges.values(), set())
+    names = self._names
+    return {Graph.Edge(names[src], names[dst], weight)
+            for src, neighbors in enumerate(self._out)
+            for dst, weight in neighbors.iteritems()}
 
   def incoming(self, vertex):
     """Returns the set of edges which lead to this vertex."""
-    return self._incomingEdges[vertex]
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is None:
+      return set()
+    names = self._names
+    return {Graph.Edge(names[src], vertex, weight)
+            for src, weight in self._in[vertex_id].iteritems()}
 
   def outgoing(self, vertex):
     """Returns the set of edges which depart from this vertex."""
-    return self._outgoingEdges[vertex]
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is None:
+      return set()
+    names = self._names
+    return {Graph.Edge(vertex, names[dst], weight)
+            for dst, weight in self._out[vertex_id].iteritems()}
 
   def incoming_vertices(self, vertex):
     """Returns the source vertices of the set of incoming edges."""
-    return { edge.src for edge in self.incoming(vertex) }
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is None:
+      return set()
+    names = self._names
+    return {names[src] for src in self._in[vertex_id]}
 
   def outgoing_vertices(self, vertex):
     """Returns the destination vertices of the set of outgoing edges."""
-    return { edge.dst for edge in self.outgoing(vertex) }
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is None:
+      return set()
+    names = self._names
+    return {names[dst] for dst in self._out[vertex_id]}
 
   def add_vertex(self, vertex):
     """Adds the vertex to the graph."""
+    self._intern(vertex)
     self._vertices.add(vertex)
 
   def add_edge(self, edge):
-    """Adds the directed edge to the graph."""
-    # Remove first, just in case the edge already exists with a different weight.
-    self.remove_edge(edge)
-    self._outgoingEdges[edge.src].add(edge)
-    self._incomingEdges[edge.dst].add(edge)
+    """Adds the directed edge to the graph, replacing its weight if it already exists."""
+    src = self._intern(edge.src)
+    dst = self._intern(edge.dst)
+    self._out[src][dst] = edge.weight
+    self._in[dst][src] = edge.weight
+    self._modified()
 
   def remove_edge(self, edge):
     """Removes the directed edge from the graph."""
-    self._outgoingEdges[edge.src].discard(edge)
-    self._incomingEdges[edge.dst].discard(edge)
+    src = self._ids.get(edge.src)
+    dst = self._ids.get(edge.dst)
+    if src is None or dst is None:
+      return
+    self._out[src].pop(dst, None)
+    self._in[dst].pop(src, None)
+    self._modified()
 
   def remove_vertex(self, vertex):
     """Removes the vertex from the graph."""
-    for edge in self.edges:
-      if edge.is_adjacent(vertex):
-        self.remove_edge(edge)
-    self.vertices.discard(vertex)
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is not None:
+      # The id stays interned, so the vertex gets the same one back if it is re-added.
+      for dst in self._out[vertex_id]:
+        del self._in[dst][vertex_id]
+      for src in self._in[vertex_id]:
+        del self._out[src][vertex_id]
+      self._out[vertex_id] = {}
+      self._in[vertex_id] = {}
+      self._modified()
+    self._vertices.discard(vertex)
+
+  def traverse(self, start, adjacent=None, order=BFS, multistart=False, cycle_handler=None,
+               cost=None):
+    """Returns a Graph.Search, which yields the vertices reachable from start as it is iterated.
 
-  def search(self, start, adjacent=None, next_index=None, multistart=False, cycle_handler=None):
+    :param start: the starting (source) vertex.
+    :param adjacent: the adjacency(vertex) function, defaulting to graph.outgoing_vertices.
+    :param order: the order to expand vertices in: Graph.BFS (default), Graph.DFS, or
+      Graph.UNIFORM_COST, which expands the vertex with the cheapest path first.
+    :param multistart: if True, treats 'start' as a list of sources, rather than a single source.
+    :param cycle_handler: function(path, vertex) to call if a cycle is detected, ie if a vertex has
+      an edge to itself or to a vertex on the path it was reached by. Checking walks that path, so
+      it is only done if a handler is given.
+    :param cost: function(src, dst) giving the cost of following an edge, for a uniform cost
+      search. Defaults to the edge's weight, or 1 for edges the graph doesn't have (eg if adjacent
+      is given).
+    """
+    # Default to forward-directed search.
+    adjacent = adjacent or self.outgoing_vertices
+    if cost is None and order == Graph.UNIFORM_COST:
+      cost = self._weight
+    return Graph.Search(start if multistart else (start,), adjacent, order, cycle_handler, cost)
+
+  def _weight(self, src, dst):
+    src_id = self._ids.get(src)
+    dst_id = self._ids.get(dst)
+    if src_id is None or dst_id is None:
+      return 1
+    return self._out[src_id].get(dst_id, 1)
+
+  def search(self, start, adjacent=None, next_index=None, multistart=False, cycle_handler=None,
+             order=BFS):
     """Performs a graph search, yielding (path, vertex) pairs.
 
-    If visit is set, simply searches the whole graph without yielding, passing all (path, vertex)
-    pairs to visit(), terminating early if visit ever returns True.
+    This wraps traverse(), building each vertex's path as it is yielded. Callers which don't need
+    every path should use traverse() directly.
 
     :param start: the starting (source) vertex.
     :param adjacent: the adjacency(vertex) function, defaulting to graph.outgoing.
-    :param next_index: choose which index of the frontier to expand next.
-      (lambda _: 0) will be a BFS (default).
-      (lambda _:-1) will be a DFS.
-      (lambda _: min(range(len(_)), key=_.__getitem__) will be a uniform cost search.
+    :param next_index: choose which index of the frontier of paths to expand next, eg
+      (lambda _: 0) for a BFS or (lambda _:-1) for a DFS. Deprecated in favor of order, since it
+      needs every path in the frontier to be built up front.
     :param multistart: if True, treats 'start' as a list of sources, rather than a single source.
     :param cycle_handler: function(path, vertex) to call if a cycle is detected.
+    :param order: Graph.BFS (default), Graph.DFS or Graph.UNIFORM_COST; see traverse().
     """
+    if next_index:
+      for path, vertex in self._search_frontier(start, adjacent, next_index, multistart,
+                                                cycle_handler):
+        yield path, vertex
+      return
+    search = self.traverse(start, adjacent=adjacent, order=order, multistart=multistart,
+                           cycle_handler=cycle_handler)
+    for vertex in search:
+      yield search.path(vertex), vertex
+
+  def _search_frontier(self, start, adjacent, next_index, multistart, cycle_handler):
+    """The original search(), which keeps the whole path in each frontier entry for next_index."""
     # Default to forward-directed search.
     adjacent = adjacent or self.outgoing_vertices
-    # Default to queue-like behavior, resulting in BFS.
-    next_index = next_index or (lambda ls: 0)
     # Default to no-op.
     cycle_handler = cycle_handler or (lambda p,v: None)
 
@@ -147,7 +377,15 @@ class Graph(object):
 
   def search_set(self, *vargs, **kwargs):
     """Returns the set of vertices hit by the given graph.search() parameters."""
-    return set(vertex for path, vertex in self.search(*vargs, **kwargs))
+    if kwargs.get('next_index'):
+      return set(vertex for path, vertex in self.search(*vargs, **kwargs))
+    return set(self.traverse(*vargs, **kwargs))
+
+  def _live_ids(self):
+    """Returns the ids of the vertices which are in the graph, explicitly or as an edge endpoint."""
+    names, vertices, out, incoming = self._names, self._vertices, self._out, self._in
+    return [vertex_id for vertex_id in xrange(len(names))
+            if out[vertex_id] or incoming[vertex_id] or names[vertex_id] in vertices]
 
   def topological_ordering(self, stable=False):
     """Returns a topologically-ordered list of this graph's vertices.
@@ -156,47 +394,252 @@ class Graph(object):
 
     :param boolean stable: If true, the ordering will be stable even if orderings are ambiguous,
       by expanding leaf vertices in sorted order. This is only possible if the vertices are
-      comparable. Note that this is implemented by using a min-heap instead of a set, which means
+      comparable. Note that this is implemented by using a min-heap instead of a stack, which means
       the topsort runs in O(n log n) time rather than O(n) time for the stable version
       (where n = |vertices|+|edges|).
+    :raises: Graph.CycleError if the graph has a cycle. Its cycles attribute holds one complete
+      cycle from each strongly connected component, as returned by find_cycles().
     """
     # NB(gmalmquist): This could easily be converted to a generator, if we ever wanted to for some
     # reason.
-    ordering = []
-    leaves = {vertex for vertex in self.vertices if not self.incoming(vertex)}
+    names = self._names
+    offsets, targets = self._csr()
+    live = self._live_ids()
+    # Kahn's algorithm: a vertex becomes a leaf once all of its incoming edges have been removed.
+    in_degree = [len(incoming) for incoming in self._in]
     if stable:
-      leaves = list(leaves)
+      leaves = [(names[vertex_id], vertex_id) for vertex_id in live if not in_degree[vertex_id]]
       heapq.heapify(leaves)
-      push_vertex = functools.partial(heapq.heappush, leaves)
-      pop_vertex = functools.partial(heapq.heappop, leaves)
+      push_vertex = lambda vertex_id: heapq.heappush(leaves, (names[vertex_id], vertex_id))
+      pop_vertex = lambda: heapq.heappop(leaves)[1]
     else:
-      push_vertex, pop_vertex = leaves.add, leaves.pop
-    removed_edges = set()
+      leaves = [vertex_id for vertex_id in live if not in_degree[vertex_id]]
+      push_vertex, pop_vertex = leaves.append, leaves.pop
+    ordering = []
     while leaves:
-      leaf = pop_vertex()
-      ordering.append(leaf)
-      for edge in self.outgoing(leaf):
-        if edge in removed_edges:
-          continue
-        removed_edges.add(edge)
-        if self.incoming(edge.dst) <= removed_edges:
-          push_vertex(edge.dst)
-    remaining_edges = self.edges - removed_edges
-    if remaining_edges:
-      raise self.CycleError('Cycle detected involving edges:{}'.format(''.join(
-        '\n  {} -> {}'.format(edge.src, edge.dst) for edge in sorted(remaining_edges),
-      )))
+      src = pop_vertex()
+      ordering.append(names[src])
+      for dst in targets[offsets[src]:offsets[src + 1]]:
+        in_degree[dst] -= 1
+        if not in_degree[dst]:
+          push_vertex(dst)
+    if len(ordering) < len(live):
+      cycles = self.find_cycles()
+      raise self.CycleError('Cycle detected:{}'.format(''.join(
+        '\n  {}'.format(' -> '.join(str(vertex) for vertex in cycle)) for cycle in cycles
+      )), cycles)
     return ordering
 
+  def _components(self):
+    """Finds the strongly connected components, using an iterative version of Tarjan's algorithm.
+
+    :return: a (component_of, components) pair, where components is a list of lists of vertex ids
+      in topological order (each component before the components it has edges to), and
+      component_of maps a vertex id to the index of its component, or -1 if it isn't live.
+    """
+    offsets, targets = self._csr()
+    size = len(self._names)
+    index = [-1] * size
+    lowlink = [0] * size
+    on_stack = [False] * size
+    stack = []
+    components = []
+    counter = 0
+    for root in self._live_ids():
+      if index[root] >= 0:
+        continue
+      index[root] = lowlink[root] = counter
+      counter += 1
+      stack.append(root)
+      on_stack[root] = True
+      # Each frame is (vertex id, position of the next edge to follow in targets).
+      frames = [(root, offsets[root])]
+      while frames:
+        vertex_id, position = frames[-1]
+        end = offsets[vertex_id + 1]
+        while position < end:
+          neighbor = targets[position]
+          position += 1
+          if index[neighbor] < 0:
+            frames[-1] = (vertex_id, position)
+            index[neighbor] = lowlink[neighbor] = counter
+            counter += 1
+            stack.append(neighbor)
+            on_stack[neighbor] = True
+            frames.append((neighbor, offsets[neighbor]))
+            break
+          elif on_stack[neighbor] and index[neighbor] < lowlink[vertex_id]:
+            lowlink[vertex_id] = index[neighbor]
+        else:
+          frames.pop()
+          if frames:
+            parent = frames[-1][0]
+            if lowlink[vertex_id] < lowlink[parent]:
+              lowlink[parent] = lowlink[vertex_id]
+          if lowlink[vertex_id] == index[vertex_id]:
+            component = []
+            while True:
+              member = stack.pop()
+              on_stack[member] = False
+              component.append(member)
+              if member == vertex_id:
+                break
+            components.append(component)
+    # Tarjan's algorithm finds each component only after everything it reaches.
+    components.reverse()
+    component_of = [-1] * size
+    for component_index, component in enumerate(components):
+      for vertex_id in component:
+        component_of[vertex_id] = component_index
+    return component_of, components
+
+  def _component_successors(self, component_of, components):
+    """Returns, for each component from _components(), the set of other components it has edges to."""
+    offsets, targets = self._csr()
+    successors = []
+    for component_index, component in enumerate(components):
+      direct = set()
+      for vertex_id in component:
+        for dst in targets[offsets[vertex_id]:offsets[vertex_id + 1]]:
+          direct.add(component_of[dst])
+      direct.discard(component_index)
+      successors.append(direct)
+    return successors
+
+  def strongly_connected_components(self):
+    """Returns the strongly connected components of this graph, as a list of lists of vertices.
+
+    Components are in topological order: a component comes before any component it has edges to.
+    A graph without cycles has one single-vertex component per vertex.
+    """
+    names = self._names
+    return [[names[vertex_id] for vertex_id in component] for component in self._components()[1]]
+
+  def condensation(self):
+    """Returns the condensation of this graph, which has a vertex per strongly connected component.
+
+    :return: a (components, dag) pair. components is the list of strongly connected components,
+      as returned by strongly_connected_components(), and dag is an acyclic Graph whose vertices are
+      indices into components, with an edge i -> j if any vertex in components[i] has an edge to one
+      in components[j].
+    """
+    component_of, components = self._components()
+    dag = Graph(vertices=xrange(len(components)))
+    for src_component, direct in enumerate(self._component_successors(component_of, components)):
+      for dst_component in direct:
+        dag.add_edge(Graph.Edge(src_component, dst_component))
+    names = self._names
+    return [[names[vertex_id] for vertex_id in component] for component in components], dag
+
+  def transitive_reduction(self):
+    """Returns a copy of this graph without the edges which are implied by longer paths.
+
+    An edge u -> v between different strongly connected components is dropped if the component of v
+    is reachable from the component of u through some other component. So for an acyclic graph this
+    is the usual (unique) transitive reduction. Edges within a component are always kept, since
+    which of them are redundant depends on which ones are picked to keep the component connected.
+
+    Reachability is computed once per component over the condensation in reverse topological order,
+    as an int used as a bitset of component indices. A component's bitset is dropped as soon as all
+    of its predecessors have been reduced, which bounds memory by the width of the graph rather than
+    its size.
+    """
+    offsets, targets = self._csr()
+    component_of, components = self._components()
+    successors = self._component_successors(component_of, components)
+    predecessor_count = [0] * len(components)
+    for direct in successors:
+      for dst_component in direct:
+        predecessor_count[dst_component] += 1
+
+    # Components are in topological order, so walking them backwards sees successors first.
+    reach = [0] * len(components)
+    redundant = [()] * len(components)
+    for component_index in xrange(len(components) - 1, -1, -1):
+      direct = successors[component_index]
+      indirect = 0
+      for dst_component in direct:
+        indirect |= reach[dst_component]
+      redundant[component_index] = {dst_component for dst_component in direct
+                                    if indirect & (1 << dst_component)}
+      for dst_component in direct:
+        indirect |= 1 << dst_component
+        predecessor_count[dst_component] -= 1
+        if not predecessor_count[dst_component]:
+          reach[dst_component] = 0
+      if predecessor_count[component_index]:
+        reach[component_index] = indirect
+
+    reduced = self._copy()
+    for component_index, component in enumerate(components):
+      if not redundant[component_index]:
+        continue
+      for vertex_id in component:
+        for dst in targets[offsets[vertex_id]:offsets[vertex_id + 1]]:
+          if component_of[dst] in redundant[component_index]:
+            del reduced._out[vertex_id][dst]
+            del reduced._in[dst][vertex_id]
+    return reduced
+
+  def find_cycles(self):
+    """Returns one complete cycle from each strongly connected component which has one.
+
+    Each cycle is a list of vertices starting and ending with the same (smallest) vertex of its
+    component, eg ['a', 'b', 'c', 'a']. It is the shortest cycle through that vertex. Every other
+    vertex in the component is on some cycle too, but isn't necessarily on this one.
+    """
+    names = self._names
+    offsets, targets = self._csr()
+    component_of, components = self._components()
+    cycles = []
+    for component_index, component in enumerate(components):
+      start = min(component, key=names.__getitem__)
+      if len(component) == 1 and start not in self._out[start]:
+        continue
+      # Breadth-first search within the component for the shortest path back to start.
+      parents = {start: None}
+      frontier = [start]
+      closing = None
+      while closing is None:
+        next_frontier = []
+        for vertex_id in frontier:
+          for neighbor in targets[offsets[vertex_id]:offsets[vertex_id + 1]]:
+            if neighbor == start:
+              closing = vertex_id
+              break
+            if component_of[neighbor] == component_index and neighbor not in parents:
+              parents[neighbor] = vertex_id
+              next_frontier.append(neighbor)
+          if closing is not None:
+            break
+        frontier = next_frontier
+      cycle = [start]
+      vertex_id = closing
+      while vertex_id is not None:
+        cycle.append(vertex_id)
+        vertex_id = parents[vertex_id]
+      cycles.append([names[vertex_id] for vertex_id in reversed(cycle)])
+    return cycles
+
+  def _copy(self, transpose=False):
+    graph = Graph()
+    graph._ids = dict(self._ids)
+    graph._names = list(self._names)
+    out, incoming = (self._in, self._out) if transpose else (self._out, self._in)
+    graph._out = [dict(neighbors) for neighbors in out]
+    graph._in = [dict(neighbors) for neighbors in incoming]
+    graph._vertices = set(self._vertices)
+    return graph
+
   @property
   def copied(self):
     """Returns a copy of the graph."""
-    return Graph(self.vertices, self.edges)
+    return self._copy()
 
   @property
   def transposed(self):
     """Returns a transpose graph."""
-    return Graph(self.vertices, [edge.reversed for edge in self.edges])
+    return self._copy(transpose=True)
 
   def __str__(self):
     vertex_strings = sorted(str(v) for v in self.vertices)
@@ -205,3 +648,91 @@ class Graph(object):
       vertex_text='\n'.join('  {}'.format(vertex) for vertex in vertex_strings),
       edges_text='\n'.join('  {}'.format(edge) for edge in edge_strings)
     )
+
+
+class ReachabilityIndex(object):
+  """Answers transitive reachability queries about a graph, from bitsets computed up front.
+
+  The graph is condensed into its strongly connected components, and each component gets an int
+  used as a bitset of the components reachable from it, computed in a single pass over the
+  condensation in reverse topological order. After that, reaches() is a single bit test, and
+  closure() and reverse_closure() cost time proportional to the size of their answer. The bitsets
+  for reverse_closure() are only computed the first time it is called.
+
+  The index is a snapshot: it doesn't see changes made to the graph after it is built.
+
+  Reachability follows at least one edge, so a vertex only reaches itself if it is on a cycle.
+  """
+
+  def __init__(self, graph):
+    """:param Graph graph: the graph to index."""
+    self._ids = dict(graph._ids)
+    component_of, components = graph._components()
+    self._component_of = component_of
+    self._members = [[graph._names[vertex_id] for vertex_id in component]
+                     for component in components]
+    self._successors = graph._component_successors(component_of, components)
+    # Components on a cycle reach themselves.
+    self._cyclic = [len(component) > 1 or component[0] in graph._out[component[0]]
+                    for component in components]
+    self._forward = self._propagate(self._successors,
+                                    xrange(len(components) - 1, -1, -1))
+    self._backward = None
+
+  def _propagate(self, adjacent, order):
+    """Returns a bitset per component of the components reachable through adjacent.
+
+    :param list adjacent: for each component, the set of components it has edges to.
+    :param order: the component indices, ordered so that each comes after everything it has edges
+      to.
+    """
+    reach = [0] * len(adjacent)
+    for component_index in order:
+      bits = (1 << component_index) if self._cyclic[component_index] else 0
+      for other in adjacent[component_index]:
+        bits |= reach[other] | (1 << other)
+      reach[component_index] = bits
+    return reach
+
+  def _component(self, vertex):
+    vertex_id = self._ids.get(vertex)
+    if vertex_id is None:
+      return -1
+    return self._component_of[vertex_id]
+
+  def _vertices(self, bits):
+    """Returns the set of vertices in the components whose bits are set."""
+    vertices = set()
+    while bits:
+      low = bits & -bits  # The lowest set bit.
+      vertices.update(self._members[low.bit_length() - 1])
+      bits ^= low
+    return vertices
+
+  def reaches(self, src, dst):
+    """Returns True if there is a path of one or more edges from src to dst."""
+    src_component = self._component(src)
+    dst_component = self._component(dst)
+    if src_component < 0 or dst_component < 0:
+      return False
+    return bool(self._forward[src_component] >> dst_component & 1)
+
+  def closure(self, vertex):
+    """Returns the set of vertices reachable from vertex by following one or more edges."""
+    component = self._component(vertex)
+    if component < 0:
+      return set()
+    return self._vertices(self._forward[component])
+
+  def reverse_closure(self, vertex):
+    """Returns the set of vertices which can reach vertex by following one or more edges."""
+    component = self._component(vertex)
+    if component < 0:
+      return set()
+    if self._backward is None:
+      predecessors = [set() for _ in self._successors]
+      for component_index, direct in enumerate(self._successors):
+        for other in direct:
+          predecessors[other].add(component_index)
+      self._backward = self._propagate(predecessors, xrange(len(predecessors)))
+    return self._vertices(self._backward[component])
@@ -15,7 +15,7 @@
 #
 # Notes:
 # This script has two disjoint tasks:
-# -- Produce an application/json-seq report
+# -- Produce an application/json-seq report (or a JSON array or JSON lines, see --format)
 # -- Succeed if (and only if) there were failures and they were flakey.
 # These tasks are conflated, for now, because they both involve
 # reading the XML output from JUnit. It is possible they will be unconflated
@@ -25,14 +25,16 @@ from __future__ import unicode_literals, print_function
 
 import argparse
 import collections
-import functools
 import glob
+import gzip
+import io
 import itertools
 import json
 import logging
+import multiprocessing
 import os
 
-from xml.etree import ElementTree as ET
+import xml.etree.cElementTree as ET
 
 
 logger = logging.getLogger(__name__)
@@ -48,58 +50,162 @@ class State(object):
 def getText(elem):
   return (elem.text or '').strip()
 
-def getAllText(elem):
-  pieces = [getText(elem)]
-  for subelem in elem.iter():
-    pieces.append(getText(subelem))
-  return ''.join(pieces)
+# Elements in a testcase which mark it as failed, and ones which don't, whatever text they hold.
+# Anything else in a testcase with text in it is also treated as a failure.
+_FAILURE_TAGS = frozenset(['failure', 'error'])
+_PASSING_TAGS = frozenset(['skipped', 'system-out', 'system-err'])
 
-def parse_string(data):
-  tree = ET.fromstring(data)
-  for suite in tree.iter('testsuite'):
-    errors = int(suite.get('errors')) + int(suite.get('failures'))
-    for test in suite.iter('testcase'):
+def _case_time(test, full_name):
+  if test.get('time') is None:
+    logger.error('Junit test-case missing time field! {}'.format(full_name))
+    return 0.0
+  try:
+    return float(test.get('time'))
+  except:
+    logger.error('Junit test-case has malformed time field: {} ({})'.format(test.get('time'),
+                                                                            full_name))
+    return 0.0
+
+def parse_stream(source):
+  """Yields a TestCase for each testcase in a JUnit XML report, as the report is read.
+
+  Each element is discarded once it has been looked at, so at most one testcase is held in memory
+  however much output the report captured.
+
+  :param source: file name or binary file object to read the report from.
+  """
+  open_elems = []
+  suite_errors = []  # Failures reported by each open testsuite not yet matched to a testcase.
+  test, failed = None, False
+  for event, elem in ET.iterparse(source, events=(b'start', b'end')):
+    if event == 'start':
+      if elem.tag == 'testsuite':
+        suite_errors.append(int(elem.get('errors')) + int(elem.get('failures')))
+      elif elem.tag == 'testcase' and suite_errors and test is None:
+        test, failed = elem, False
+      open_elems.append(elem)
+      continue
+    open_elems.pop()
+    if elem is test:
       basename = test.get('name')
       classname = test.get('classname')
       full_name = '{}.{}'.format(classname, basename)
-      tm = 0.0
-      if test.get('time') is None:
-        logger.error('Junit test-case missing time field! {}'.format(full_name))
-      else:
-        try:
-          tm = float(test.get('time'))
-        except:
-          logger.error('Junit test-case has malformed time field: {} ({})'.format(test.get('time'),
-                                                                                  full_name))
       ## Successful tests are all the same.
       ## Each failing tests puts the text in its own unique element --
       ##   Tolstoy, if he wrote parsers for JUnit output
-      if getAllText(test) != '':
-        errors -= 1
+      if failed or getText(test) != '':
+        suite_errors[-1] -= 1
         state = State.FAILURE
       else:
         state = State.SUCCESS
       yield TestCase(state=state,
                      full_name=full_name,
-                     time=tm)
-    if errors > 0:
-      ## Oh, my! The heuristic for finding
-      ## a failed test failed to work.
-      ## Let's generate a failure just in case
-      classname = suite.get('name')
-      full_name = classname + '.DUMMY_TEST'
-      yield TestCase(state=State.FAILURE,
-                     full_name=full_name,
-                     time=0.0)
+                     time=_case_time(test, full_name))
+      test = None
+    elif test is not None:
+      if elem.tag in _FAILURE_TAGS or (elem.tag not in _PASSING_TAGS and getText(elem) != ''):
+        failed = True
+    elif elem.tag == 'testsuite':
+      if suite_errors.pop() > 0:
+        ## Oh, my! The heuristic for finding
+        ## a failed test failed to work.
+        ## Let's generate a failure just in case
+        classname = elem.get('name')
+        full_name = classname + '.DUMMY_TEST'
+        yield TestCase(state=State.FAILURE,
+                       full_name=full_name,
+                       time=0.0)
+    elem.clear()
+    if open_elems:
+      open_elems[-1].remove(elem)
 
+def parse_string(data):
+  if isinstance(data, unicode):
+    data = data.encode('utf-8')
+  return parse_stream(io.BytesIO(data))
+
+def parse_file(fname):
+  """Yields the TestCases in a JUnit XML report file.
+
+  :raises: ValueError naming the file if it isn't well formed.
+  """
+  try:
+    for case in parse_stream(fname):
+      yield case
+  except ET.ParseError as e:
+    # ParseError can't be sent back from a worker process, so it's replaced with a plain error.
+    raise ValueError('Unable to parse {}: {}'.format(fname, e))
 
-def rfc7464_record_from_case(case):
-  dct = {
+def _parse_file_cases(fname):
+  """Parses a report in a worker process of get_test_cases()."""
+  return list(parse_file(fname))
+
+
+def record_from_case(case):
+  return {
     'state': 'success' if case.state == State.SUCCESS else 'failure',
     'full-name': case.full_name,
     'time': case.time,
   }
-  return b'\x1e' + json.dumps(dct).encode('utf-8') + b'\n'
+
+
+class RecordWriter(object):
+  """Writes JSON records to a file as they are produced, so that they never have to be held in
+  memory together.
+  """
+
+  # 'json': a single JSON array of the records.
+  # 'jsonl': a line of JSON for each record.
+  # 'json-seq': an RFC 7464 (application/json-seq) record for each record.
+  FORMATS = ('json', 'jsonl', 'json-seq')
+
+  # Records of a JSON array are encoded this many at a time, as encoding a list is much faster
+  # than encoding its items one by one.
+  _BATCH_SIZE = 1000
+
+  def __init__(self, fp, output_format):
+    """
+    :param fp: binary file object to write to.
+    :param string output_format: one of FORMATS.
+    """
+    if output_format not in self.FORMATS:
+      raise ValueError('Unknown format {}, expected one of {}'.format(output_format,
+                                                                      ', '.join(self.FORMATS)))
+    self._fp = fp
+    self._format = output_format
+    self._batch = []
+    self._started = False
+
+  def write(self, record):
+    if self._format == 'jsonl':
+      self._fp.write(json.dumps(record).encode('utf-8') + b'\n')
+    elif self._format == 'json-seq':
+      self._fp.write(b'\x1e' + json.dumps(record).encode('utf-8') + b'\n')
+    else:
+      self._batch.append(record)
+      if len(self._batch) >= self._BATCH_SIZE:
+        self._flush()
+
+  def _flush(self):
+    if self._batch:
+      # Strip the brackets, to continue the array started by the first batch.
+      data = json.dumps(self._batch).encode('utf-8')[1:-1]
+      self._fp.write((b', ' if self._started else b'[') + data)
+      self._started = True
+      self._batch = []
+
+  def close(self):
+    """Finishes the output; the file itself is left open."""
+    if self._format == 'json':
+      self._flush()
+      self._fp.write(b']' if self._started else b'[]')
+
+
+def open_output(fname, compress=False):
+  """:return: a binary file object writing to fname, gzip compressed if compress is True."""
+  if compress:
+    return gzip.open(fname, 'wb')
+  return open(fname, 'wb')
 
 
 def find_true_failures(is_flake, cases, exc):
@@ -116,16 +222,46 @@ def find_true_failures(is_flake, cases, exc):
     raise exc
 
 
-def get_test_cases(directory):
-  blobs = itertools.imap(read_file, glob.glob(os.path.join(directory, '*.xml')))
-  cases = itertools.chain.from_iterable(itertools.imap(parse_string, blobs))
-  return cases
+def load_flakes(directory):
+  """:return: set of the names of the tests marked flaky in the directory; empty if it is missing."""
+  try:
+    return frozenset(os.listdir(directory))
+  except OSError:
+    return frozenset()
+
+
+def get_test_cases(directory, jobs=None):
+  """Yields the TestCases in every report in the directory, ordered by report file name.
+
+  :param int jobs: the number of processes to parse reports with; defaults to the number of cpus.
+  """
+  fnames = sorted(glob.glob(os.path.join(directory, '*.xml')))
+  jobs = min(jobs or multiprocessing.cpu_count(), len(fnames))
+  if jobs <= 1:
+    for case in itertools.chain.from_iterable(itertools.imap(parse_file, fnames)):
+      yield case
+    return
+  pool = multiprocessing.Pool(jobs)
+  try:
+    # imap() returns each report's cases in the order the reports were submitted.
+    for cases in pool.imap(_parse_file_cases, fnames):
+      for case in cases:
+        yield case
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
 
 
 PARSER = argparse.ArgumentParser('Process JUnit report')
 PARSER.add_argument('--output', help="Output file", required=True)
 PARSER.add_argument('--dir', help="Directory with reports", required=True)
 PARSER.add_argument('--flakes', help="Directory with flake indicators", required=True)
+PARSER.add_argument('--jobs', help="Number of processes to parse reports with", type=int,
+                    default=None)
+PARSER.add_argument('--format', help="Output format", choices=RecordWriter.FORMATS,
+                    default='json-seq')
+PARSER.add_argument('--gzip', help="Compress the output with gzip", action='store_true')
 
 
 ## Utility routines that are testable
@@ -138,22 +274,22 @@ def flow_and_process(process, inputs):
     process(piece)
     yield piece
 
-
-def read_file(fname):
-  with open(fname) as input:
-    return input.read()
 ## End utility routines
 
 
 def main():
   logging.basicConfig()
   ns = PARSER.parse_args()
-  cases = get_test_cases(ns.dir)
-  is_flake = compose(os.path.exists, functools.partial(os.path.join, ns.flakes))
-  with open(ns.output, 'w') as fp:
-    process = compose(fp.write, rfc7464_record_from_case)
+  cases = get_test_cases(ns.dir, jobs=ns.jobs)
+  is_flake = load_flakes(ns.flakes).__contains__
+  with open_output(ns.output, ns.gzip) as fp:
+    writer = RecordWriter(fp, ns.format)
+    process = compose(writer.write, record_from_case)
     exc = SystemExit('REAL FAILURE DETECTED')
-    find_true_failures(is_flake, flow_and_process(process, cases), exc)
+    try:
+      find_true_failures(is_flake, flow_and_process(process, cases), exc)
+    finally:
+      writer.close()
 
 if __name__ == '__main__':
   main()
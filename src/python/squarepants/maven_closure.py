@@ -0,0 +1,392 @@
+# Computes the transitive closure of 3rdparty artifacts from a local Maven repository, offline.
+#
+# Reads the POMs of the managed artifacts (and of everything they depend on) from ~/.m2/repository,
+# or any directory laid out like one, applying parent inheritance, properties, dependencyManagement
+# (including imported BOMs), exclusions and Maven's nearest-wins version mediation. Released POMs
+# never change, so each one's direct dependencies are cached on disk and only recomputed if the POM
+# file itself changes.
+
+from collections import deque
+import json
+import logging
+import os
+import xml.etree.cElementTree as ElementTree
+
+from generation_utils import GenerationUtils
+
+
+logger = logging.getLogger(__name__)
+
+
+_GRAPH_CACHE_VERSION = 1
+_LOCKFILE_VERSION = 1
+# Scopes whose dependencies end up on the runtime classpath of whatever depends on the artifact.
+_TRANSITIVE_SCOPES = ('compile', 'runtime')
+
+
+def _local_name(tag):
+  return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(element, name):
+  for child in element:
+    if _local_name(child.tag) == name:
+      return (child.text or '').strip()
+  return None
+
+
+def _children(element, *path):
+  """Yields the descendants of element at the given path of local tag names."""
+  if not path:
+    yield element
+    return
+  for child in element:
+    if _local_name(child.tag) == path[0]:
+      for descendant in _children(child, *path[1:]):
+        yield descendant
+
+
+def _parse_dependency(element):
+  dep = {}
+  for name in ('groupId', 'artifactId', 'version', 'classifier', 'type', 'scope', 'optional'):
+    value = _child_text(element, name)
+    if value:
+      dep[name] = value
+  exclusions = [{'groupId': _child_text(exclusion, 'groupId') or '*',
+                 'artifactId': _child_text(exclusion, 'artifactId') or '*'}
+                for exclusion in _children(element, 'exclusions', 'exclusion')]
+  if exclusions:
+    dep['exclusions'] = exclusions
+  return dep
+
+
+def _dependency_key(dep):
+  return (dep['groupId'], dep['artifactId'], dep.get('type', 'jar'), dep.get('classifier'))
+
+
+def node_name(group_id, artifact_id, classifier=None):
+  """:return: the name used for an artifact in closures and lockfiles, eg org.foo:bar[:classifier]"""
+  if classifier:
+    return '{0}:{1}:{2}'.format(group_id, artifact_id, classifier)
+  return '{0}:{1}'.format(group_id, artifact_id)
+
+
+def is_excluded(dep, exclusions):
+  """:return: True if any of the (groupId, artifactId) exclusions, which may be '*', match dep."""
+  for group_id, artifact_id in exclusions:
+    if (group_id in ('*', dep['groupId'])) and (artifact_id in ('*', dep['artifactId'])):
+      return True
+  return False
+
+
+class LocalMavenRepository(object):
+  """Reads effective POMs out of a directory laid out like ~/.m2/repository."""
+
+  class MissingPomError(Exception):
+    """Raised when a POM isn't in the repository."""
+
+  def __init__(self, root=None):
+    """:param string root: the repository directory; defaults to ~/.m2/repository."""
+    self.root = root or os.path.expanduser(os.path.join('~', '.m2', 'repository'))
+    self._raw = {}
+    self._effective = {}
+
+  def pom_path(self, group_id, artifact_id, version):
+    return os.path.join(self.root, group_id.replace('.', os.sep), artifact_id, version,
+                        '{0}-{1}.pom'.format(artifact_id, version))
+
+  def _read(self, group_id, artifact_id, version):
+    """Parses a POM without interpreting it."""
+    key = (group_id, artifact_id, version)
+    if key not in self._raw:
+      path = self.pom_path(*key)
+      try:
+        project = ElementTree.parse(path).getroot()
+      except (IOError, OSError):
+        raise self.MissingPomError('No POM for {0}:{1}:{2} at {3}'.format(group_id, artifact_id,
+                                                                          version, path))
+      except SyntaxError as e:
+        raise self.MissingPomError('Unable to parse {0}: {1}'.format(path, e))
+      parent = None
+      for element in _children(project, 'parent'):
+        parent = (_child_text(element, 'groupId'), _child_text(element, 'artifactId'),
+                  _child_text(element, 'version'))
+      properties = {}
+      for element in _children(project, 'properties'):
+        for prop in element:
+          properties[_local_name(prop.tag)] = (prop.text or '').strip()
+      self._raw[key] = {
+        'groupId': _child_text(project, 'groupId') or (parent and parent[0]),
+        'artifactId': _child_text(project, 'artifactId'),
+        'version': _child_text(project, 'version') or (parent and parent[2]),
+        'parent': parent,
+        'properties': properties,
+        'managed': [_parse_dependency(element) for element in
+                    _children(project, 'dependencyManagement', 'dependencies', 'dependency')],
+        'dependencies': [_parse_dependency(element) for element in
+                         _children(project, 'dependencies', 'dependency')],
+      }
+    return self._raw[key]
+
+  def _substitute(self, properties, dep):
+    resolved = {}
+    for name, value in dep.items():
+      if name == 'exclusions':
+        resolved[name] = value
+      else:
+        resolved[name] = GenerationUtils.symbol_substitution(properties, value)
+    return resolved
+
+  def effective_pom(self, group_id, artifact_id, version, _importing=()):
+    """Interprets a POM along with its parents.
+
+    :return: dict with the merged 'properties', the 'managed' dependencies (dependencyManagement,
+      with imported BOMs expanded) keyed by (groupId, artifactId, type, classifier), and the
+      'dependencies', with their versions and scopes filled in from the managed ones.
+    :raises: MissingPomError if the POM or one of its parents isn't in the repository.
+    """
+    key = (group_id, artifact_id, version)
+    if key in self._effective:
+      return self._effective[key]
+    raw = self._read(*key)
+    if raw['parent']:
+      parent = self.effective_pom(*raw['parent'], _importing=_importing)
+      properties = dict(parent['properties'])
+      managed = dict(parent['managed'])
+      dependencies = list(parent['dependencies'])
+    else:
+      properties, managed, dependencies = {}, {}, []
+
+    properties.update(raw['properties'])
+    for prefix in ('project.', 'pom.'):
+      properties[prefix + 'groupId'] = raw['groupId']
+      properties[prefix + 'artifactId'] = raw['artifactId']
+      properties[prefix + 'version'] = raw['version']
+    if raw['parent']:
+      properties['project.parent.groupId'] = raw['parent'][0]
+      properties['project.parent.version'] = raw['parent'][2]
+
+    for dep in raw['managed']:
+      dep = self._substitute(properties, dep)
+      if dep.get('scope') == 'import' and dep.get('type') == 'pom':
+        bom = (dep['groupId'], dep['artifactId'], dep.get('version'))
+        if bom in _importing:
+          continue # An import cycle; Maven would reject it, we just stop following it.
+        try:
+          imported = self.effective_pom(*bom, _importing=_importing + (key,))
+        except self.MissingPomError as e:
+          logger.warn('Skipping imported dependencyManagement: {0}'.format(e))
+          continue
+        for imported_key, imported_dep in imported['managed'].items():
+          managed.setdefault(imported_key, imported_dep)
+      else:
+        managed[_dependency_key(dep)] = dep
+
+    # Dependencies declared in the child override those inherited from the parent.
+    own = [self._substitute(properties, dep) for dep in raw['dependencies']]
+    own_keys = set(_dependency_key(dep) for dep in own)
+    merged = [dep for dep in dependencies if _dependency_key(dep) not in own_keys] + own
+    resolved = []
+    for dep in merged:
+      dep = dict(dep)
+      management = managed.get(_dependency_key(dep), {})
+      for name in ('version', 'scope', 'exclusions'):
+        if name not in dep and name in management:
+          dep[name] = management[name]
+      resolved.append(dep)
+
+    self._effective[key] = {'properties': properties, 'managed': managed, 'dependencies': resolved}
+    return self._effective[key]
+
+
+class DependencyGraph(object):
+  """The direct dependencies of artifacts in a LocalMavenRepository, cached on disk."""
+
+  def __init__(self, repository, cache_file=None):
+    """
+    :param LocalMavenRepository repository: where to read POMs from.
+    :param string cache_file: where to keep the cache; if None, nothing is cached on disk.
+    """
+    self.repository = repository
+    self.cache_file = cache_file
+    self._entries = {}
+    self._dirty = False
+    if cache_file:
+      self._load()
+
+  def _load(self):
+    try:
+      with open(self.cache_file, 'r') as f:
+        data = json.load(f)
+    except (IOError, ValueError):
+      return
+    if (isinstance(data, dict) and data.get('version') == _GRAPH_CACHE_VERSION
+        and data.get('root') == self.repository.root):
+      self._entries = data.get('poms', {})
+
+  def save(self):
+    """Writes out the cache, if anything was added to it."""
+    if not self.cache_file or not self._dirty:
+      return
+    if not os.path.isdir(os.path.dirname(self.cache_file)):
+      os.makedirs(os.path.dirname(self.cache_file))
+    tmp_path = '{0}.{1}.tmp'.format(self.cache_file, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump({'version': _GRAPH_CACHE_VERSION, 'root': self.repository.root,
+                 'poms': self._entries}, f, sort_keys=True)
+    os.rename(tmp_path, self.cache_file)
+    self._dirty = False
+
+  def _stat(self, group_id, artifact_id, version):
+    try:
+      st = os.stat(self.repository.pom_path(group_id, artifact_id, version))
+    except OSError:
+      return None
+    return [st.st_size, st.st_mtime]
+
+  def dependencies(self, group_id, artifact_id, version):
+    """Lists the dependencies that an artifact brings onto the runtime classpath.
+
+    :return: list of dependency dicts, with groupId, artifactId, version and optionally classifier,
+      type and exclusions; or None if the artifact's POM isn't in the repository.
+    """
+    key = ':'.join((group_id, artifact_id, version))
+    stat = self._stat(group_id, artifact_id, version)
+    entry = self._entries.get(key)
+    if entry is not None and entry['stat'] == stat:
+      return entry['dependencies']
+    if stat is None:
+      dependencies = None
+    else:
+      try:
+        pom = self.repository.effective_pom(group_id, artifact_id, version)
+      except LocalMavenRepository.MissingPomError as e:
+        logger.warn(str(e))
+        dependencies = None
+      else:
+        dependencies = []
+        for dep in pom['dependencies']:
+          if dep.get('scope', 'compile') not in _TRANSITIVE_SCOPES:
+            continue
+          if dep.get('optional') == 'true':
+            continue
+          dependencies.append(dict((name, value) for name, value in dep.items()
+                                   if name not in ('scope', 'optional')))
+    self._entries[key] = {'stat': stat, 'dependencies': dependencies}
+    self._dirty = True
+    return dependencies
+
+
+class Closure(object):
+  """The mediated transitive closure of a set of root artifacts."""
+
+  def __init__(self, versions, dependencies, types, missing):
+    """
+    :param dict versions: groupId:artifactId -> the version every path resolves to.
+    :param dict dependencies: root node name -> sorted node names of its transitive dependencies.
+    :param dict types: node name -> artifact type, for nodes that aren't jars.
+    :param list missing: sorted groupId:artifactId:version of artifacts without a POM.
+    """
+    self.versions = versions
+    self.dependencies = dependencies
+    self.types = types
+    self.missing = missing
+
+  def to_lockfile(self):
+    """:return: the closure as lockfile-style JSON."""
+    return json.dumps({
+      'version': _LOCKFILE_VERSION,
+      'resolved': self.versions,
+      'artifacts': self.dependencies,
+      'types': self.types,
+      'missing': self.missing,
+    }, indent=2, sort_keys=True) + '\n'
+
+  @classmethod
+  def resolve(cls, roots, graph):
+    """Computes the transitive closure of the roots.
+
+    Versions are mediated across the whole closure at once, so that every library pins the same
+    version of a shared dependency: the roots' own versions always win, and otherwise the version
+    declared nearest to a root wins, with ties going to the first declaration. Each root's set of
+    dependencies then honours the exclusions along the paths to it: an artifact excluded on one
+    path is still reached through any other path which doesn't exclude it.
+
+    :param list roots: dependency dicts with groupId, artifactId, version and optionally
+      classifier, type and exclusions, as read from a dependencyManagement section.
+    :param DependencyGraph graph: where to read dependencies from.
+    :return: Closure
+    """
+    versions = {}
+    for root in roots:
+      versions.setdefault(node_name(root['groupId'], root['artifactId']), root['version'])
+
+    missing = set()
+    types = {}
+    edges_by_coordinate = {}
+
+    def edges(coordinate):
+      if coordinate not in edges_by_coordinate:
+        group_id, artifact_id = coordinate.split(':')
+        dependencies = graph.dependencies(group_id, artifact_id, versions[coordinate])
+        if dependencies is None:
+          missing.add('{0}:{1}'.format(coordinate, versions[coordinate]))
+        edges_by_coordinate[coordinate] = dependencies or ()
+      return edges_by_coordinate[coordinate]
+
+    def with_exclusions(exclusions, dep):
+      return exclusions | frozenset((e['groupId'], e['artifactId'])
+                                    for e in dep.get('exclusions') or ())
+
+    def already_expanded(expanded, coordinate, exclusions):
+      """Records that the coordinate is expanded with the exclusions, unless it already was with a
+      subset of them, in which case everything this path could reach has been reached already.
+      """
+      previous = expanded.setdefault(coordinate, [])
+      if any(earlier <= exclusions for earlier in previous):
+        return True
+      previous.append(exclusions)
+      return False
+
+    # Breadth first from all the roots at once, so the nearest declaration is seen first. An
+    # artifact is expanded again when a path reaches it excluding less than the paths before it,
+    # so that one root's exclusions don't hide dependencies from another root.
+    queue = deque((root, with_exclusions(frozenset(), root)) for root in roots)
+    expanded = {}
+    while queue:
+      dep, exclusions = queue.popleft()
+      coordinate = node_name(dep['groupId'], dep['artifactId'])
+      if already_expanded(expanded, coordinate, exclusions):
+        continue
+      for child in edges(coordinate):
+        if is_excluded(child, exclusions) or not child.get('version'):
+          continue
+        child_coordinate = node_name(child['groupId'], child['artifactId'])
+        if child_coordinate not in versions:
+          versions[child_coordinate] = child['version']
+        queue.append((child, with_exclusions(exclusions, child)))
+
+    dependencies = {}
+    for root in roots:
+      root_coordinate = node_name(root['groupId'], root['artifactId'])
+      reached = set()
+      queue = deque([(root_coordinate, with_exclusions(frozenset(), root))])
+      expanded = {}
+      while queue:
+        coordinate, exclusions = queue.popleft()
+        if already_expanded(expanded, coordinate, exclusions):
+          continue
+        for child in edges(coordinate):
+          child_coordinate = node_name(child['groupId'], child['artifactId'])
+          if (child_coordinate == root_coordinate or child_coordinate not in versions
+              or is_excluded(child, exclusions)):
+            continue
+          name = node_name(child['groupId'], child['artifactId'], child.get('classifier'))
+          reached.add(name)
+          if child.get('type', 'jar') != 'jar':
+            types[name] = child['type']
+          queue.append((child_coordinate, with_exclusions(exclusions, child)))
+      dependencies[node_name(root['groupId'], root['artifactId'], root.get('classifier'))] = \
+        sorted(reached)
+    graph.save()
+    return cls(versions, dependencies, types, sorted(missing))
@@ -0,0 +1,168 @@
+# Graph of the maven modules in a repo, used to decide which modules' generated BUILD files are
+# affected by a change.
+#
+# A module's generated BUILD file depends on its own pom.xml and directory layout, on every parent
+# pom it inherits from, and on the coordinates and layout of the local modules it depends on.
+
+import json
+import logging
+import os
+
+from graph_util import Graph
+from pom_handlers import CachedDependencyInfos
+from pom_utils import PomUtils
+
+
+logger = logging.getLogger(__name__)
+
+
+class ModuleGraph(object):
+  """The modules of a repo, linked by their parent poms and by their local dependencies.
+
+  Vertices are directories relative to the repo root: one for each module listed in the top
+  pom.xml, and one for each parent pom (eg, parents/base) those modules inherit from.
+  """
+
+  class FormatError(Exception):
+    """Raised when a saved module graph can't be parsed."""
+
+  _VERSION = 1
+
+  def __init__(self, modules, parents=None, dependencies=None):
+    """
+    :param modules: module directories.
+    :param dict parents: map of module or parent pom directory -> directory of its parent pom.
+    :param dict dependencies: map of module directory -> module directories it depends on.
+    """
+    self.modules = set(os.path.normpath(module) for module in modules)
+    self.parents = dict(parents or {})
+    self.dependencies = dict((module, set(deps)) for module, deps in (dependencies or {}).items())
+    self._vertices = self.modules | set(self.parents) | set(self.parents.values())
+    self._children = Graph(self._vertices)
+    for child, parent in self.parents.items():
+      self._children.add_edge(Graph.Edge(parent, child))
+    self._dependents = Graph(self._vertices)
+    for module, deps in self.dependencies.items():
+      for dep in deps:
+        self._dependents.add_edge(Graph.Edge(dep, module))
+
+  @classmethod
+  def from_poms(cls, rootdir=None):
+    """Parses the module poms (and their parent poms) listed in the top pom.xml.
+
+    :param string rootdir: root directory of the repo; defaults to the working directory.
+    """
+    modules = [os.path.normpath(module) for module in PomUtils.get_modules(rootdir=rootdir)]
+    infos = dict((module, CachedDependencyInfos.get(os.path.join(module, 'pom.xml'),
+                                                    rootdir=rootdir))
+                 for module in modules)
+
+    # Like PomProvidesTarget, the first module to provide an artifact wins.
+    providers = {}
+    for module in modules:
+      info = infos[module]
+      providers.setdefault('{0}.{1}'.format(info.groupId, info.artifactId), module)
+
+    parents, dependencies = {}, {}
+    for module in modules:
+      child, info = module, infos[module]
+      while info.parent_path and child not in parents:
+        parent = os.path.dirname(info.parent_path)
+        if not parent or parent.startswith('..'):
+          break # The top pom.xml, or outside the repo.
+        parents[child] = parent
+        child, info = parent, CachedDependencyInfos.get(info.parent_path, rootdir=rootdir)
+      deps = set()
+      for dep in infos[module].dependencies:
+        provider = providers.get('{0}.{1}'.format(dep['groupId'], dep['artifactId']))
+        if provider and provider != module:
+          deps.add(provider)
+      dependencies[module] = deps
+    return cls(modules, parents, dependencies)
+
+  @classmethod
+  def load(cls, path):
+    """Reads a graph written by save().
+
+    :raises: IOError if the file can't be read, or FormatError if it can't be parsed.
+    """
+    with open(path, 'r') as f:
+      try:
+        data = json.load(f)
+      except ValueError as e:
+        raise cls.FormatError('Unable to parse {0}: {1}'.format(path, e))
+    if not isinstance(data, dict) or data.get('version') != cls._VERSION:
+      raise cls.FormatError('Unexpected module graph version in {0}'.format(path))
+    return cls(data['modules'], data['parents'], data['dependencies'])
+
+  def save(self, path):
+    """Writes the graph to path, replacing (rather than writing through) any existing file."""
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    data = {
+      'version': self._VERSION,
+      'modules': sorted(self.modules),
+      'parents': self.parents,
+      'dependencies': dict((module, sorted(deps)) for module, deps in self.dependencies.items()),
+    }
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+  def owner(self, relpath):
+    """Finds the module or parent pom directory which contains the given path.
+
+    :param string relpath: path relative to the repo root.
+    :return: the innermost module or parent pom directory containing relpath, or None.
+    """
+    directory = os.path.dirname(os.path.normpath(relpath))
+    while directory:
+      if directory in self._vertices:
+        return directory
+      directory = os.path.dirname(directory)
+    return None
+
+  def affected(self, changed, previous=None, transitive=False):
+    """Expands a set of changed modules and parent poms to every module whose output they affect.
+
+    Changes propagate to all modules which inherit from a changed parent pom, however indirectly,
+    and then to the modules which directly depend on any of those.
+
+    :param dict changed: map of changed module or parent pom directory -> reason it changed.
+    :param ModuleGraph previous: the graph as of the last generation. Its edges are followed too,
+      so modules which used to inherit from or depend on a changed module are included.
+    :param bool transitive: if True, changes also propagate to the modules which depend on an
+      affected module indirectly, eg to find every module whose tests a change could break.
+    :return: map of affected module directory -> reason it is affected. This includes modules
+      which only exist in the previous graph.
+    """
+    graphs = [self] + ([previous] if previous else [])
+
+    def children(vertex):
+      return set.union(*[graph._children.outgoing_vertices(vertex) for graph in graphs])
+
+    def dependents(vertex):
+      return set.union(*[graph._dependents.outgoing_vertices(vertex) for graph in graphs])
+
+    reasons = dict(changed)
+    if transitive:
+      search = self._children.traverse(sorted(changed), multistart=True,
+                                       adjacent=lambda vertex: children(vertex) | dependents(vertex))
+      for vertex in search:
+        if vertex not in reasons:
+          via = search.path(vertex)[-1]
+          relation = 'inherits from' if vertex in children(via) else 'depends on'
+          reasons[vertex] = '{0} {1}'.format(relation, via)
+    else:
+      search = self._children.traverse(sorted(changed), adjacent=children, multistart=True)
+      for vertex in search:
+        if vertex not in reasons:
+          reasons[vertex] = 'inherits from {0}'.format(search.path(vertex)[0])
+      for vertex in sorted(reasons):
+        for dependent in sorted(dependents(vertex)):
+          if dependent not in reasons:
+            reasons[dependent] = 'depends on {0}'.format(vertex)
+
+    modules = set.union(*[graph.modules for graph in graphs])
+    return dict((vertex, reason) for vertex, reason in reasons.items() if vertex in modules)
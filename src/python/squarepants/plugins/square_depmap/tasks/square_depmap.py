@@ -44,7 +44,10 @@ class SquareDepmap(Task):
              help='Assigns arbitrary colors to projects to aid readability.',)
     register('--reduce-transitive', action='store_true', default=True,
              help='Simplify the graph by removing edges already implied by transitive '
-                  'dependencies. Requires graphviz commandline tools. ',)
+                  'dependencies.',)
+    register('--use-tred', action='store_true', default=False,
+             help='Reduce transitive dependencies by running graphviz tred on the generated '
+                  'graph, rather than in-process. Requires graphviz commandline tools.',)
     register('--run-dot', action='store_true', default=True,
              help='Automatically runs dot on the generated graph to produce an svg. '
                   'Requires graphviz commandline tools.',)
@@ -151,7 +154,7 @@ class SquareDepmap(Task):
         except Exception as e:
           raise TaskError('Error generating graphviz data: {}.'.format(e))
 
-      if self.get_options().reduce_transitive:
+      if self.get_options().reduce_transitive and self.get_options().use_tred:
         with self._work_block('Reducing transitive dependencies with tred.'):
           tred = Popen(['tred', gv_path], stdout=PIPE, stderr=PIPE)
           out, err = tred.communicate()
@@ -218,6 +221,10 @@ class SquareDepmap(Task):
       with self._work_block('Calculating target project groups.'):
         target_to_project, project_to_targets = self._get_target_project_maps(targets)
 
+    if self.get_options().reduce_transitive and not self.get_options().use_tred:
+      with self._work_block('Reducing transitive dependencies.'):
+        graph = graph.transitive_reduction()
+
     with self._work_block('Finding subgraphs.'):
       groups = sorted(map(sorted, project_to_targets.values()))
 
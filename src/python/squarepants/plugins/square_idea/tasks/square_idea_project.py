@@ -20,7 +20,7 @@ from pants.util.dirutil import safe_mkdir
 from pants.util.memo import memoized_method, memoized_property
 from pants.util.osutil import get_os_name, known_os_names, normalize_os_name, OS_ALIASES
 
-from squarepants.graph_util import Graph
+from squarepants.graph_util import Graph, ReachabilityIndex
 
 
 logger = logging.getLogger(__name__)
@@ -202,24 +202,14 @@ class IdeaProject(object):
     def annotation_processing_test_sources_dir(self):
       return self.annotation_processing_output(self.project.annotation_processing.test_sources_dir)
 
-    def _transitive_graph_search(self, adjacency_func):
-      frontier = list(adjacency_func(self))
-      visited = set()
-      while frontier:
-        vertex = frontier.pop()
-        if vertex in visited:
-          continue
-        visited.add(vertex)
-        for adjacent in adjacency_func(self.project.modules_by_name[vertex]):
-          if adjacent not in visited:
-            frontier.append(adjacent)
-      return visited
+    def _transitive_graph_search(self, relation):
+      return self.project._module_reachability(relation).closure(self.name)
 
     def transitive_dependees(self):
-      return self._transitive_graph_search(lambda module: module.dependees)
+      return self._transitive_graph_search('dependees')
 
     def transitive_dependencies(self):
-      return self._transitive_graph_search(lambda module: module.dependencies)
+      return self._transitive_graph_search('dependencies')
 
     def dependencies_template_data(self):
       return [TemplateData(
@@ -357,24 +347,22 @@ class IdeaProject(object):
     for module in modules:
       edges.update(Graph.Edge(module.name, dependency) for dependency in module.dependencies)
     graph = Graph(vertices={module.name for module in modules}, edges=edges)
-    dependency_closure = {}
+    # Removing redundant dependencies doesn't change what each module reaches, so the index stays
+    # accurate while we remove them.
+    reachability = ReachabilityIndex(graph)
     # Process dependencies before dependees.
     for module_name in reversed(graph.topological_ordering(stable=True)):
       module = modules_by_name[module_name]
-      dependency_closure[module_name] = set()
       direct_dependencies = sorted(module.dependencies) # Sort for stability.
       # Remove any direct dependencies which are already pulled in by our transitive dependencies.
       for dependency in direct_dependencies:
-        if any(dependency in dependency_closure[other] for other in module.dependencies):
+        if any(reachability.reaches(other, dependency) for other in module.dependencies):
           logger.debug('Removing redundant dependency {} -> {}.'.format(module_name, dependency))
           module.dependencies.remove(dependency)
-        else:
-          dependency_closure[module_name].update(dependency_closure[dependency])
-          dependency_closure[module_name].add(dependency)
       if prune_libraries:
         # Remove any libraries which are already pulled in by our transitive dependencies.
         transitive_libraries = defaultdict(set)
-        for dep_name in dependency_closure[module_name]:
+        for dep_name in reachability.closure(module_name):
           dependency = modules_by_name[dep_name]
           for conf, jars in dependency.libraries.items():
             transitive_libraries[conf].update(jars)
@@ -403,6 +391,8 @@ class IdeaProject(object):
     self.annotation_processing_jars = set()
     self.debug_port = debug_port
     self.provided_module_dependencies = provided_module_dependencies or {}
+    # Module relation ('dependencies' or 'dependees') -> ReachabilityIndex over it.
+    self._reachability = {}
     self._setup_modules()
 
   def _setup_modules(self):
@@ -460,14 +450,32 @@ class IdeaProject(object):
     cycles at the fine-grained target level. And this really isn't a problem in IntelliJ either,
     because as far as IntelliJ is concerned, the raw-protos directories don't *do* anything. So we
     can safely break these cycles and not worry about them any further.
+
+    Longer cycles aren't expected, and aren't safe to break arbitrarily, so they fail the task with
+    each complete cycle listed.
     """
+    modules_by_name = self.modules_by_name
+    graph = Graph(vertices=modules_by_name)
     for module in self.modules:
-      for dependency in tuple(module.dependencies):
-        if module.name in self.modules_by_name[dependency].dependencies:
-          self.context.log.warn('Direct dependency cycle detected between {} and {}; breaking it. '
-                                'This is expected and probably harmless for raw-protos modules.'
-                                .format(module.name, dependency))
-          module.dependencies.remove(dependency)
+      for dependency in module.dependencies:
+        graph.add_edge(Graph.Edge(module.name, dependency))
+    # Only modules in the same strongly connected component can be part of a cycle.
+    for component in graph.strongly_connected_components():
+      if len(component) == 1 and component[0] not in modules_by_name[component[0]].dependencies:
+        continue
+      for module_name in sorted(component):
+        module = modules_by_name[module_name]
+        for dependency in sorted(module.dependencies):
+          if module.name in modules_by_name[dependency].dependencies:
+            self.context.log.warn('Direct dependency cycle detected between {} and {}; breaking it. '
+                                  'This is expected and probably harmless for raw-protos modules.'
+                                  .format(module.name, dependency))
+            module.dependencies.remove(dependency)
+            graph.remove_edge(Graph.Edge(module.name, dependency))
+    cycles = graph.find_cycles()
+    if cycles:
+      raise TaskError('Dependency cycles detected between modules:{}'.format(''.join(
+        '\n  {}'.format(' -> '.join(cycle)) for cycle in cycles)))
 
   def _handle_system_specific_libraries(self, libraries):
     general_confs = {'default', 'sources', 'javadoc'}
@@ -573,6 +581,23 @@ class IdeaProject(object):
           module.libraries['default'].add(dep.jar_path)
           self.annotation_processing_jars.add(dep.jar_path)
 
+  def _module_reachability(self, relation):
+    """Returns a ReachabilityIndex over the modules, following the given Module attribute.
+
+    The index is built on first use. Anything that changes the relation afterwards must drop the
+    cached index from self._reachability.
+
+    :param string relation: 'dependencies' or 'dependees'.
+    """
+    index = self._reachability.get(relation)
+    if index is None:
+      graph = Graph(vertices=self.modules_by_name)
+      for module in self.modules:
+        for other in getattr(module, relation):
+          graph.add_edge(Graph.Edge(module.name, other))
+      index = self._reachability[relation] = ReachabilityIndex(graph)
+    return index
+
   @memoized_property
   def modules_by_name(self):
     return {module.name: module for module in self.modules}
@@ -771,6 +796,8 @@ class IdeaProject(object):
 
     annotation_processing_code = self.modules_by_name['annotation-processing-code']
     annotation_processing_code.dependencies.update(codegenerators)
+    # Dependencies change here and again below, so drop any index built over the old ones.
+    self._reachability.pop('dependencies', None)
 
     transitive_codegenerators = set()
     for name in codegenerators:
@@ -783,6 +810,7 @@ class IdeaProject(object):
     for module in self.modules:
       if module != annotation_processing_code and module.name not in transitive_codegenerators:
         module.dependencies.add(annotation_processing_code.name)
+    self._reachability.pop('dependencies', None)
     return annotation_processing_code
 
   def _generate_module_templates(self):
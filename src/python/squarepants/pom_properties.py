@@ -3,38 +3,130 @@
 # Print properties from the pom.xml file as BASH variable settings.
 # Note that the '.' characters in property names are re-written as '_'
 #
+# Can also print the properties of many modules in one run, as a single stream keyed by module or
+# as one file per module, and as NUL-delimited or JSON-lines records instead of shell text.
+#
 
+import json
 import os
 import re
 import sys
 
 
-from pom_handlers import DependencyInfo
+from file_utils import read_lines
+from pom_handlers import CachedDependencyInfos
 from pom_utils import PomUtils
 
 
 class PomProperties(object):
 
+  FORMATS = ('shell', 'null', 'jsonl')
+
+  # Extension of the file written for each module by write_all(), by format.
+  _EXTENSIONS = {'shell': 'sh', 'null': 'nul', 'jsonl': 'json'}
+
   def safe_property_name(self, property_name):
     """Replace characters that aren't safe for bash variables with an underscore"""
     return re.sub(r'\W', '_', property_name)
 
-
-  def write_properties(self, pom_file_path, output_stream, rootdir=None):
-    di = DependencyInfo(pom_file_path, rootdir)
-    for property_name, value in di.properties.iteritems():
-      output_stream.write('{0}="{1}"\n'.format(self.safe_property_name(property_name), value))
-
-    # Print out some other things.  These are useful for script/pants_kochiku_build_wrapper
-    output_stream.write('project_artifactId="{0}"\n'.format(di.artifactId))
-    output_stream.write('project_groupId="{0}"\n'.format(di.groupId))
+  def properties(self, pom_file_path, rootdir=None):
+    """:return: list of (name, value) pairs for the properties of the pom.xml, including the ones it
+    inherits, with names made safe for bash.
+
+    Parent poms are parsed once and shared by every module which inherits from them.
+    """
+    di = CachedDependencyInfos.get(pom_file_path, rootdir)
+    properties = [(self.safe_property_name(property_name), value)
+                  for property_name, value in di.properties.iteritems()]
+    # Some other things.  These are useful for script/pants_kochiku_build_wrapper
+    properties.append(('project_artifactId', di.artifactId))
+    properties.append(('project_groupId', di.groupId))
+    return properties
+
+  @classmethod
+  def _encode(cls, value):
+    if isinstance(value, unicode):
+      return value.encode('utf-8')
+    return str(value)
+
+  def format_properties(self, properties, output_format='shell', module=None):
+    """Formats properties for output.
+
+    :param properties: list of (name, value) pairs, as returned by properties().
+    :param string output_format: one of
+      'shell': a line of name="value" for each property. If module is given, it's preceded by a
+        comment naming the module.
+      'null': name and value, each terminated by a NUL character. If module is given, each name
+        is preceded by the module, also terminated by a NUL.
+      'jsonl': a single line with a JSON object of the properties, under 'properties', along with
+        the 'module' if it is given.
+    :param string module: module the properties belong to, when writing several modules' properties
+      to one stream.
+    """
+    if output_format == 'shell':
+      lines = ['# {0}\n'.format(module)] if module is not None else []
+      lines.extend('{0}="{1}"\n'.format(name, value) for name, value in properties)
+      return ''.join(lines)
+    elif output_format == 'null':
+      prefix = self._encode(module) + '\0' if module is not None else ''
+      return ''.join('{0}{1}\0{2}\0'.format(prefix, name, self._encode(value))
+                     for name, value in properties)
+    elif output_format == 'jsonl':
+      record = {'properties': dict(properties)}
+      if module is not None:
+        record['module'] = module
+      return json.dumps(record, sort_keys=True) + '\n'
+    raise ValueError('Unknown format {0}, expected one of {1}'.format(output_format,
+                                                                      ', '.join(self.FORMATS)))
+
+  def write_properties(self, pom_file_path, output_stream, rootdir=None, output_format='shell'):
+    output_stream.write(self.format_properties(self.properties(pom_file_path, rootdir),
+                                               output_format))
+
+  def write_all(self, modules, output_stream=None, output_dir=None, rootdir=None,
+                output_format='shell'):
+    """Writes the properties of many modules in one pass.
+
+    :param modules: module directories, relative to rootdir.
+    :param output_stream: stream to write every module's properties to, keyed by module.
+    :param string output_dir: if given, each module's properties are written to
+      <output_dir>/<module>/pom_properties.<sh|nul|json> instead. Absolute module paths are made
+      relative to rootdir first.
+    :raises: ValueError if writing to output_dir and a module isn't under rootdir.
+    """
+    root = rootdir or os.getcwd()
+    for module in modules:
+      if output_dir is not None:
+        relpath = os.path.relpath(os.path.join(root, module), root)
+        if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+          raise ValueError('Module {0} is outside of {1}, not writing its properties to {2}'
+                           .format(module, root, output_dir))
+      properties = self.properties(os.path.join(module, 'pom.xml'), rootdir)
+      if output_dir is None:
+        output_stream.write(self.format_properties(properties, output_format, module=module))
+        continue
+      path = os.path.join(output_dir, relpath,
+                          'pom_properties.{0}'.format(self._EXTENSIONS[output_format]))
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      with open(path, 'w') as f:
+        f.write(self.format_properties(properties, output_format))
 
 
 def usage():
-  print "usage: {0} [args] ".format(sys.argv[0])
+  print "usage: {0} [args] path/to/project [path/to/project ...]".format(sys.argv[0])
   print "Prints all the properties defined in a pom.xml in bash variable syntax."
   print ""
-  print "-?,-h         Show this message"
+  print "-?,-h                   Show this message"
+  print "--all                   Print the properties of every module in the top pom.xml. Invoke"
+  print "                        from the root of the repo."
+  print "--modules-from=<file>   Print the properties of the modules listed in <file>, one per line,"
+  print "                        or from stdin if <file> is -"
+  print "--format=<format>       shell (the default), null for NUL-delimited name and value fields,"
+  print "                        or jsonl for a JSON object per line. With more than one project,"
+  print "                        each record is keyed by its project."
+  print "--output-dir=<dir>      Write each project's properties to"
+  print "                        <dir>/<project>/pom_properties.<sh|nul|json> instead of stdout"
   PomUtils.common_usage()
   sys.exit(1)
 
@@ -43,27 +135,60 @@ def main():
   arguments = PomUtils.parse_common_args(sys.argv[1:])
   flags = set(arg for arg in arguments if arg.startswith('-'))
 
+  modules = []
+  batch = False
+  output_format = 'shell'
+  output_dir = None
   for f in flags:
     if f == '-h' or f == '-?':
       usage()
       return
+    elif f == '--all':
+      batch = True
+      modules.extend(PomUtils.get_modules())
+    elif f.startswith('--modules-from='):
+      batch = True
+      modules.extend(read_lines(f[len('--modules-from='):]))
+    elif f.startswith('--format='):
+      output_format = f[len('--format='):]
+      if output_format not in PomProperties.FORMATS:
+        print ("Unknown format {0}".format(output_format))
+        usage()
+    elif f.startswith('--output-dir='):
+      batch = True
+      output_dir = f[len('--output-dir='):]
     else:
       print ("Unknown flag {0}".format(f))
       usage()
       return
 
-  path_args = list(set(arguments) - flags)
-  if len(path_args) != 1 :
-    print("Expected a single project path that contains a pom.xml file.")
-    usage()
+  path_args = [arg for arg in arguments if arg not in flags]
+  if not batch and len(path_args) == 1:
+    pom_file_path = os.path.join(os.path.realpath(path_args[0]), 'pom.xml')
+
+    if not os.path.exists(pom_file_path):
+      print ("Couldn't find {0}".format(pom_file_path))
+      usage()
 
-  pom_file_path = os.path.join(os.path.realpath(path_args[0]), 'pom.xml')
+    PomProperties().write_properties(pom_file_path, sys.stdout, output_format=output_format)
+    return
 
-  if not os.path.exists(pom_file_path):
-    print ("Couldn't find {0}".format(pom_file_path))
+  modules.extend(path_args)
+  if not modules:
+    print("Expected a project path that contains a pom.xml file.")
     usage()
+  modules = [os.path.normpath(module) for module in modules]
+  for module in modules:
+    if not os.path.exists(os.path.join(module, 'pom.xml')):
+      print ("Couldn't find {0}".format(os.path.join(module, 'pom.xml')))
+      usage()
 
-  PomProperties().write_properties(pom_file_path, sys.stdout)
+  try:
+    PomProperties().write_all(modules, output_stream=sys.stdout, output_dir=output_dir,
+                              output_format=output_format)
+  except ValueError as e:
+    print (e)
+    usage()
 
 
 if __name__ == '__main__':
@@ -8,16 +8,20 @@ import os
 import sys
 import time
 
+from pom_file import PomFile
 from pom_handlers import JavaHomesInfo
 from pom_utils import PomUtils
 from pom_to_build import PomToBuild
-from generate_3rdparty import ThirdPartyBuildGenerator
+from repo_model import RepoModelWriter, generated_targets
+from generate_3rdparty import format_update, update_build_files
 from generate_external_protos import ExternalProtosBuildGenerator
 from generation_context import GenerationContext
 
 logger = logging.getLogger(__name__)
 
 _MODULES_TO_SKIP = set(['parents/external-protos'])
+# Model of the repo written while converting the poms, for other tools to load (see repo_model.py).
+_REPO_MODEL_FILE = '.pants.d/pom-gen/repo-model.jsonl'
 
 class Task(object):
   """Basically a souped-up lambda function which times itself running."""
@@ -58,9 +62,13 @@ class RegenerateAll(object):
   def _clean_generated_builds(self):
     """Removes all generated BUILD files from the source diretory"""
     logger.debug('Removing old generated BUILD.gen and BUILD.aux files')
+    # 3rdparty is left alone: _regenerate_3rdparty() only rewrites it if the managed dependencies
+    # changed.
     os.system(
       "find {root} \( -path '*/.pants.d/*' -prune -path '*/target/*' -prune \) "
-      " -o \( -name BUILD.gen -o -name BUILD.aux -o -name jooq_config.gen.xml \) | xargs rm -f"
+      " -o -path '{root}/3rdparty' -prune "
+      " -o \( -name BUILD.gen -o -name BUILD.aux -o -name jooq_config.gen.xml \) -print"
+      " | xargs rm -f"
       .format(root=self.baseroot))
 
   def _generate_module_list_file(self):
@@ -78,10 +86,24 @@ class RegenerateAll(object):
     logger.debug('Re-generating {count} modules'.format(count=len(modules)))
     # Convert pom files to BUILD files
     context = GenerationContext()
-    for module_name in modules:
-      if not module_name in _MODULES_TO_SKIP:
-        pom_file_name = os.path.join(module_name, 'pom.xml')
-        PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot, generation_context=context)
+    context.written_build_files = []
+    model = RepoModelWriter(os.path.join(self.baseroot, _REPO_MODEL_FILE))
+    pom_provides_target = PomUtils.pom_provides_target(rootdir=self.baseroot)
+    third_party_targets = set(PomUtils.third_party_dep_targets(rootdir=self.baseroot))
+    try:
+      for module_name in modules:
+        if not module_name in _MODULES_TO_SKIP:
+          pom_file_name = os.path.join(module_name, 'pom.xml')
+          PomToBuild().convert_pom(pom_file_name, rootdir=self.baseroot, generation_context=context)
+          build_files = dict((os.path.normpath(path), generated_targets(contents))
+                             for path, contents in context.written_build_files)
+          del context.written_build_files[:]
+          model.write_module(PomFile.find(pom_file_name, self.baseroot, context), context,
+                             build_files, pom_provides_target, third_party_targets)
+    except:
+      model.abort()
+      raise
+    model.close()
     context.os_to_java_homes = JavaHomesInfo.from_pom('parents/base/pom.xml',
                                                       self.baseroot).home_map
     # Write jvm platforms and distributions.
@@ -115,8 +137,8 @@ class RegenerateAll(object):
 
   def _regenerate_3rdparty(self):
     logger.debug('Re-generating 3rdparty/BUILD.gen')
-    with open('3rdparty/BUILD.gen', 'w') as build_file:
-      build_file.write(ThirdPartyBuildGenerator().generate())
+    for line in format_update(update_build_files()):
+      logger.debug(line)
 
   def execute(self):
     Task('clean_build_gen', self._clean_generated_builds)()
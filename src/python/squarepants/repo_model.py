@@ -0,0 +1,180 @@
+# A machine-readable model of the repo, written by regenerate_all.py as it converts each module, so
+# that other tools can load the modules, their parents, properties, dependencies and generated
+# targets without parsing every pom.xml again.
+#
+# The model is a JSON-lines file. The first line is a header with the format version, followed by
+# a 'parent' record for each parent pom and a 'module' record for each module, and an 'end' record
+# with the number of modules. A file without the 'end' record was not completely written.
+
+import json
+import logging
+import os
+import re
+
+from pom_handlers import LocalTargets
+
+
+logger = logging.getLogger(__name__)
+
+
+# Matches the type and name of each target in a generated BUILD file, eg "java_library(name='lib',".
+_TARGET_PATTERN = re.compile(r'''^(\w+)\(name\s*=\s*['"]([^'"]+)['"]''', re.MULTILINE)
+
+
+def generated_targets(contents):
+  """:return: list of {'type', 'name'} dicts for the targets defined in a generated BUILD file."""
+  return [{'type': target_type, 'name': name}
+          for target_type, name in _TARGET_PATTERN.findall(contents)]
+
+
+class RepoModel(object):
+  """The records of a repo model file, keyed by module directory."""
+
+  class FormatError(Exception):
+    """Raised when a repo model file can't be parsed."""
+
+  VERSION = 1
+
+  def __init__(self, modules, parents):
+    """
+    :param dict modules: map of module directory -> 'module' record.
+    :param dict parents: map of parent pom directory -> 'parent' record.
+    """
+    self.modules = modules
+    self.parents = parents
+
+  @classmethod
+  def load(cls, path):
+    """Reads a model written by RepoModelWriter.
+
+    :raises: IOError if the file can't be read, or FormatError if it can't be parsed or is
+      incomplete.
+    """
+    modules, parents = {}, {}
+    complete = False
+    with open(path, 'r') as f:
+      for line_number, line in enumerate(f, 1):
+        try:
+          record = json.loads(line)
+        except ValueError as e:
+          raise cls.FormatError('Unable to parse {0}:{1}: {2}'.format(path, line_number, e))
+        kind = record.get('record')
+        if line_number == 1:
+          if kind != 'header' or record.get('version') != cls.VERSION:
+            raise cls.FormatError('Unexpected repo model version in {0}'.format(path))
+        elif kind == 'module':
+          modules[record['module']] = record
+        elif kind == 'parent':
+          parents[record['module']] = record
+        elif kind == 'end':
+          complete = record.get('modules') == len(modules)
+    if not complete:
+      raise cls.FormatError('{0} is incomplete.'.format(path))
+    return cls(modules, parents)
+
+
+class RepoModelWriter(object):
+  """Writes a repo model one record at a time, as the modules are converted.
+
+  Records go to a temporary file which replaces the model when close() is called, so readers never
+  see a partially written model.
+  """
+
+  def __init__(self, path):
+    self._path = path
+    self._tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    if not os.path.isdir(os.path.dirname(path) or '.'):
+      os.makedirs(os.path.dirname(path))
+    self._file = open(self._tmp_path, 'w')
+    self._modules = 0
+    self._parents = set()
+    self._write({'record': 'header', 'version': RepoModel.VERSION})
+
+  def _write(self, record):
+    self._file.write(json.dumps(record, sort_keys=True, separators=(',', ':')))
+    self._file.write('\n')
+
+  @classmethod
+  def _coordinates(cls, pom_file):
+    return {
+      'module': pom_file.directory,
+      'group_id': pom_file.deps_from_pom.group_id,
+      'artifact_id': pom_file.deps_from_pom.artifact_id,
+      'parent': pom_file.parent.directory if pom_file.parent else None,
+      'properties': pom_file.deps_from_pom.properties,
+    }
+
+  @classmethod
+  def _dependencies(cls, pom_file, pom_provides_target, third_party_targets):
+    """Classifies the module's dependencies as 'local' (provided by a module in the repo),
+    '3rdparty' (defined in 3rdparty/BUILD.gen) or 'external' (a jar declared in the module).
+    """
+    lib_deps, test_deps = pom_file.deps_from_pom.get(pom_file.path, raw_deps=True)
+    dependencies = []
+    for dep in lib_deps + test_deps:
+      target = '{0}.{1}'.format(dep['groupId'], dep['artifactId'])
+      poms = pom_provides_target.find_target(target)
+      if poms:
+        kind = 'local'
+      elif target in third_party_targets:
+        kind = '3rdparty'
+      else:
+        kind = 'external'
+      dependencies.append({
+        'group_id': dep['groupId'],
+        'artifact_id': dep['artifactId'],
+        'version': dep.get('version'),
+        'scope': dep.get('scope', 'compile'),
+        'type': dep.get('type', 'jar'),
+        'classifier': dep.get('classifier'),
+        'kind': kind,
+        'module': os.path.dirname(poms[0]) if poms else None,
+      })
+    return dependencies
+
+  @classmethod
+  def _layout(cls, pom_file, generation_context):
+    directory = pom_file.directory
+    return {
+      'source_dirs': sorted(path for path in LocalTargets._types
+                            if os.path.isdir(os.path.join(directory, path))
+                            and os.listdir(os.path.join(directory, path))),
+      'hand_written_build': generation_context.is_aux(directory),
+      'main_class': pom_file.mainclass or None,
+    }
+
+  def write_module(self, pom_file, generation_context, build_files, pom_provides_target,
+                   third_party_targets):
+    """Writes the records for a converted module, and for any parent poms not written yet.
+
+    :param PomFile pom_file: the module's parsed pom.xml.
+    :param GenerationContext generation_context: the context the module was converted with.
+    :param dict build_files: map of each BUILD file generated for the module -> list of targets, as
+      returned by generated_targets().
+    :param PomProvidesTarget pom_provides_target: the modules in the repo, by artifact.
+    :param third_party_targets: set of <groupId>.<artifactId> targets defined in 3rdparty.
+    """
+    for parent in pom_file.walk_pom_parents()[1:]:
+      if parent.directory not in self._parents:
+        self._parents.add(parent.directory)
+        self._write(dict(self._coordinates(parent), record='parent'))
+    record = self._coordinates(pom_file)
+    record.update({
+      'record': 'module',
+      'dependencies': self._dependencies(pom_file, pom_provides_target, third_party_targets),
+      'build_files': build_files,
+      'layout': self._layout(pom_file, generation_context),
+    })
+    self._write(record)
+    self._modules += 1
+
+  def close(self):
+    """Finishes the model, and replaces any previous one with it."""
+    self._write({'record': 'end', 'modules': self._modules})
+    self._file.close()
+    os.rename(self._tmp_path, self._path)
+
+  def abort(self):
+    """Discards the model written so far, leaving any previous one in place."""
+    self._file.close()
+    os.remove(self._tmp_path)
@@ -0,0 +1,44 @@
+# Base class of the stores which keep their data in a SQLite database, eg the test times in
+# timing_history.py and the test results in flake_history.py.
+
+from __future__ import unicode_literals
+
+import os
+import sqlite3
+
+
+class SQLiteStore(object):
+  """A SQLite database whose schema is created on first use and versioned with PRAGMA user_version.
+
+  Subclasses set _VERSION and _SCHEMA, and query the connection in self._db.
+  """
+
+  class FormatError(Exception):
+    """Raised when the database was written by an incompatible version of the store."""
+
+  # Version of the schema, bumped whenever _SCHEMA changes incompatibly. Must not be 0, which is
+  # the user_version of a new database.
+  _VERSION = None
+  # Statements creating the tables and indexes of a new database.
+  _SCHEMA = ()
+
+  def __init__(self, path):
+    """
+    :param string path: the database file, created along with its directory if it doesn't exist,
+      or ':memory:' for a database which isn't saved.
+    """
+    if path != ':memory:' and not os.path.isdir(os.path.dirname(path) or '.'):
+      os.makedirs(os.path.dirname(path))
+    self._db = sqlite3.connect(path)
+    version = self._db.execute('PRAGMA user_version').fetchone()[0]
+    if version == 0:
+      with self._db:
+        for statement in self._SCHEMA:
+          self._db.execute(statement)
+        self._db.execute('PRAGMA user_version = {}'.format(self._VERSION))
+    elif version != self._VERSION:
+      self._db.close()
+      raise self.FormatError('{} has version {}, expected {}'.format(path, version, self._VERSION))
+
+  def close(self):
+    self._db.close()
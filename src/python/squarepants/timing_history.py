@@ -0,0 +1,226 @@
+#!/usr/bin/env python2.7
+#
+# Keeps a history of how long each JUnit test class takes to run, and uses it to split test targets
+# into shards for CI whose expected run times are balanced, since the slowest shard decides how long
+# CI takes.
+#
+# Called from script/ci after the tests run to record their times from the JUnit .xml reports:
+#
+#   timing_history record --dir=<reports>
+#
+# and before they run to assign the test targets to shards:
+#
+#   timing_history plan --shards=<n> --output=<file> <target> [<target> ...]
+#
+# The times are kept in a SQLite database, with a row of rolling statistics per test class.
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import time
+
+from squarepants.file_utils import read_lines
+from squarepants.junit_report import get_test_cases
+from squarepants.sqlite_store import SQLiteStore
+
+
+logger = logging.getLogger(__name__)
+
+
+_DEFAULT_DB = '.pants.d/test-timings/timings.db'
+# Extensions of the source files of test classes.
+_TEST_SOURCE_EXTENSIONS = ('.java', '.scala')
+
+
+def class_of_test(full_name):
+  """:return: the class of a test case, from its full name as reported by junit_report."""
+  return full_name.rsplit('.', 1)[0]
+
+
+class TimingHistory(SQLiteStore):
+  """Rolling statistics of how long each test class takes to run, stored in a SQLite database."""
+
+  _VERSION = 1
+  _SCHEMA = (
+    'CREATE TABLE test_classes ('
+    '  name TEXT PRIMARY KEY,'
+    '  runs INTEGER NOT NULL,'
+    '  mean REAL NOT NULL,'
+    '  m2 REAL NOT NULL,'  # Sum of squared differences from the mean.
+    '  rolling REAL NOT NULL,'
+    '  last REAL NOT NULL,'
+    '  updated REAL NOT NULL)',
+  )
+  # Weight of the latest run in a class's rolling average time, so that the estimate follows
+  # changes to the tests within a few runs.
+  _ROLLING_WEIGHT = 0.3
+
+  def __init__(self, path=_DEFAULT_DB):
+    super(TimingHistory, self).__init__(path)
+
+  def record_run(self, cases, recorded_at=None):
+    """Adds the times of a test run to the history.
+
+    :param cases: the TestCases of the run, as returned by junit_report.get_test_cases().
+    :param float recorded_at: when the run happened, in seconds since the epoch; defaults to now.
+    :return: the number of test classes recorded.
+    """
+    recorded_at = time.time() if recorded_at is None else recorded_at
+    class_times = {}
+    for case in cases:
+      name = class_of_test(case.full_name)
+      class_times[name] = class_times.get(name, 0.0) + case.time
+    with self._db:
+      rows = []
+      for name, seconds in class_times.items():
+        row = self._db.execute('SELECT runs, mean, m2, rolling FROM test_classes WHERE name = ?',
+                               (name,)).fetchone()
+        if row is None:
+          runs, mean, m2, rolling = 1, seconds, 0.0, seconds
+        else:
+          # Welford's update of the mean and variance.
+          runs, mean, m2, rolling = row
+          runs += 1
+          delta = seconds - mean
+          mean += delta / runs
+          m2 += delta * (seconds - mean)
+          rolling += self._ROLLING_WEIGHT * (seconds - rolling)
+        rows.append((name, runs, mean, m2, rolling, seconds, recorded_at))
+      self._db.executemany('INSERT OR REPLACE INTO test_classes VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    return len(rows)
+
+  def statistics(self, name):
+    """:return: dict of the 'runs', 'mean', 'stddev', 'rolling' average and 'last' time of a test
+    class, or None if it has never been recorded.
+    """
+    row = self._db.execute('SELECT runs, mean, m2, rolling, last FROM test_classes WHERE name = ?',
+                           (name,)).fetchone()
+    if row is None:
+      return None
+    runs, mean, m2, rolling, last = row
+    return {
+      'runs': runs,
+      'mean': mean,
+      'stddev': (m2 / (runs - 1)) ** 0.5 if runs > 1 else 0.0,
+      'rolling': rolling,
+      'last': last,
+    }
+
+  def expected_times(self):
+    """:return: map of every recorded test class -> its rolling average time in seconds."""
+    return dict(self._db.execute('SELECT name, rolling FROM test_classes'))
+
+
+def target_test_classes(target):
+  """:return: the classes whose sources are in a test target's directory, eg the classes in
+  module/src/test/java for module/src/test/java:test.
+  """
+  source_dir = target.split(':', 1)[0]
+  classes = []
+  for dirpath, dirnames, filenames in os.walk(source_dir):
+    for filename in filenames:
+      base, extension = os.path.splitext(filename)
+      if extension in _TEST_SOURCE_EXTENSIONS:
+        package = os.path.relpath(dirpath, source_dir)
+        classes.append(base if package == '.' else '{}.{}'.format(package.replace(os.sep, '.'),
+                                                                   base))
+  return sorted(classes)
+
+
+def estimate_target_times(targets, expected_times, classes=target_test_classes):
+  """Estimates how long each test target takes to run, from the times of its test classes.
+
+  Targets without any recorded classes, eg new ones, are estimated to take the median time of the
+  targets which have them.
+
+  :param targets: the test targets.
+  :param dict expected_times: map of test class -> expected seconds, as returned by
+    TimingHistory.expected_times().
+  :param classes: function returning the test classes of a target.
+  :return: a tuple of (map of target -> expected seconds, sorted list of the estimated targets).
+  """
+  times = {}
+  for target in targets:
+    known = [expected_times[name] for name in classes(target) if name in expected_times]
+    if known:
+      times[target] = sum(known)
+  estimated = sorted(set(targets) - set(times))
+  known_times = sorted(times.values())
+  median = known_times[len(known_times) // 2] if known_times else 1.0
+  for target in estimated:
+    times[target] = median
+  return times, estimated
+
+
+def plan_shards(target_times, shards):
+  """Splits test targets into shards with balanced expected run times.
+
+  Targets are assigned longest first to the shard with the least expected time so far.
+
+  :param dict target_times: map of test target -> expected seconds.
+  :param int shards: the number of shards.
+  :return: list of shards, each a dict of its sorted 'targets' and their 'expected_seconds'.
+  """
+  if shards < 1:
+    raise ValueError('At least one shard is needed, not {}'.format(shards))
+  loads = [(0.0, shard) for shard in range(shards)]
+  assigned = [[] for _ in range(shards)]
+  for target in sorted(target_times, key=lambda t: (-target_times[t], t)):
+    load, shard = heapq.heappop(loads)
+    assigned[shard].append(target)
+    heapq.heappush(loads, (load + target_times[target], shard))
+  loads = dict((shard, load) for load, shard in loads)
+  return [{'targets': sorted(assigned[shard]), 'expected_seconds': loads[shard]}
+          for shard in range(shards)]
+
+
+PARSER = argparse.ArgumentParser('Record JUnit test times and plan balanced test shards')
+PARSER.add_argument('--db', help="SQLite database of test times", default=_DEFAULT_DB)
+SUBPARSERS = PARSER.add_subparsers(dest='command')
+RECORD_PARSER = SUBPARSERS.add_parser('record', help="Record the test times in JUnit reports")
+RECORD_PARSER.add_argument('--dir', help="Directory with reports", required=True)
+PLAN_PARSER = SUBPARSERS.add_parser('plan', help="Split test targets into shards")
+PLAN_PARSER.add_argument('--shards', help="Number of shards", type=int, required=True)
+PLAN_PARSER.add_argument('--targets-from', help="File with one target per line, or - for stdin")
+PLAN_PARSER.add_argument('--output', help="File to write the shards to as JSON; default stdout")
+PLAN_PARSER.add_argument('targets', nargs='*', help="Test targets, eg module/src/test/java:test")
+
+
+def main():
+  logging.basicConfig()
+  ns = PARSER.parse_args()
+  timings = TimingHistory(ns.db)
+  try:
+    if ns.command == 'record':
+      count = timings.record_run(get_test_cases(ns.dir))
+      print('Recorded the times of {} test classes in {}'.format(count, ns.db))
+      return
+    targets = list(ns.targets)
+    if ns.targets_from:
+      targets.extend(read_lines(ns.targets_from))
+    if not targets:
+      PARSER.error('No test targets to plan.')
+    target_times, estimated = estimate_target_times(sorted(set(targets)), timings.expected_times())
+  finally:
+    timings.close()
+  if estimated:
+    logger.warning('No recorded times for {} targets, estimating them.'.format(len(estimated)))
+  shards = plan_shards(target_times, ns.shards)
+  plan = json.dumps({
+    'shards': shards,
+    'estimated': estimated,
+    'makespan': max(shard['expected_seconds'] for shard in shards),
+  }, indent=2, sort_keys=True)
+  if ns.output:
+    with open(ns.output, 'w') as fp:
+      fp.write(plan + '\n')
+  else:
+    print(plan)
+
+
+if __name__ == '__main__':
+  main()
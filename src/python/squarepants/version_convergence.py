@@ -0,0 +1,180 @@
+#!/usr/bin/env python2.7
+#
+# Reports 3rdparty artifacts whose versions don't converge across the repo: modules that pin a
+# version other than the one managed in parents/base, or that depend on the same artifact at
+# different versions.
+#
+# usage: version_convergence.py [--json] [path/to/repo]
+#
+
+import json
+import logging
+import os
+import re
+import sys
+from collections import defaultdict, namedtuple
+
+from pom_handlers import CachedDependencyInfos
+from pom_utils import PomUtils
+
+
+logger = logging.getLogger(__name__)
+
+
+def version_key(version):
+  """Sort key which orders Maven-style version strings numerically where it can, eg 1.9 < 1.10."""
+  parts = []
+  for part in re.split(r'[.-]', version or ''):
+    if part.isdigit():
+      parts.append((1, int(part), ''))
+    else:
+      # Qualifiers like 'beta' sort before any number in the same position.
+      parts.append((0, 0, part))
+  # Ends the version so that it sorts after itself with a qualifier, eg 2.0-beta < 2.0 < 2.0.1.
+  parts.append((0, 1, ''))
+  return parts
+
+
+class Divergence(namedtuple('Divergence', ['coordinate', 'managed_version', 'effective_version',
+                                           'modules_by_version'])):
+  """An artifact the repo depends on at more than one version.
+
+  :param string coordinate: groupId:artifactId
+  :param string managed_version: the version in parents/base's dependencyManagement, or None.
+  :param string effective_version: the version that ends up on the classpath: the managed version
+    if there is one, otherwise the newest one, as ivy's default conflict manager would pick.
+  :param dict modules_by_version: version -> sorted list of modules depending on that version.
+  """
+
+  @property
+  def causes(self):
+    """:return: sorted list of the modules which pin a version other than the effective one."""
+    return sorted(module for version, modules in self.modules_by_version.items()
+                  if version != self.effective_version for module in modules)
+
+  def to_dict(self):
+    return {
+      'coordinate': self.coordinate,
+      'managed_version': self.managed_version,
+      'effective_version': self.effective_version,
+      'modules_by_version': self.modules_by_version,
+      'causes': self.causes,
+    }
+
+
+class VersionConvergence(object):
+  """Finds the divergent versions of 3rdparty artifacts depended on by the modules in a repo."""
+
+  def __init__(self, rootdir=None):
+    """:param string rootdir: root directory of the repo to analyze; defaults to the working dir."""
+    self._rootdir = rootdir
+
+  def _managed_versions(self):
+    managed = {}
+    for dep in PomUtils.dependency_management_finder(rootdir=self._rootdir).find_dependencies(
+        'parents/base/pom.xml'):
+      managed['{0}:{1}'.format(dep['groupId'], dep['artifactId'])] = dep.get('version')
+    return managed
+
+  def _versions_by_coordinate(self, managed):
+    """Groups every 3rdparty dependency of every module by coordinate and effective version.
+
+    :return: dict of coordinate -> version -> set of modules.
+    """
+    local_targets = set(PomUtils.local_dep_targets(rootdir=self._rootdir))
+    versions = defaultdict(lambda: defaultdict(set))
+    for module in PomUtils.get_modules(rootdir=self._rootdir):
+      module = os.path.normpath(module)
+      info = CachedDependencyInfos.get(os.path.join(module, 'pom.xml'), rootdir=self._rootdir)
+      for dep in info.dependencies:
+        if '{0}.{1}'.format(dep['groupId'], dep['artifactId']) in local_targets:
+          continue
+        coordinate = '{0}:{1}'.format(dep['groupId'], dep['artifactId'])
+        # Like pom_handlers, a dependency without a version gets the managed one.
+        version = dep.get('version') or managed.get(coordinate)
+        versions[coordinate][version].add(module)
+    return versions
+
+  def analyze(self):
+    """:return: list of Divergences, sorted by coordinate."""
+    managed = self._managed_versions()
+    divergences = []
+    for coordinate, modules_by_version in sorted(self._versions_by_coordinate(managed).items()):
+      managed_version = managed.get(coordinate)
+      versions = set(modules_by_version)
+      if managed_version is not None:
+        effective_version = managed_version
+      else:
+        effective_version = max(versions, key=version_key)
+      if versions == set([effective_version]):
+        continue
+      divergences.append(Divergence(
+        coordinate=coordinate,
+        managed_version=managed_version,
+        effective_version=effective_version,
+        modules_by_version=dict((version, sorted(modules))
+                                for version, modules in modules_by_version.items()),
+      ))
+    return divergences
+
+  @classmethod
+  def format_text(cls, divergences):
+    """:return: list of lines describing the divergences for people to read."""
+    lines = []
+    for divergence in divergences:
+      lines.append('{0} (effective version {1}{2})'.format(
+        divergence.coordinate, divergence.effective_version,
+        ', managed' if divergence.managed_version is not None else ''))
+      for version in sorted(divergence.modules_by_version, key=version_key):
+        marker = '*' if version == divergence.effective_version else ' '
+        lines.append('  {0} {1}: {2}'.format(
+          marker, version, ', '.join(divergence.modules_by_version[version])))
+    lines.append('{0} divergent artifacts.'.format(len(divergences)))
+    return lines
+
+  @classmethod
+  def format_json(cls, divergences):
+    return json.dumps([divergence.to_dict() for divergence in divergences], indent=2,
+                      sort_keys=True)
+
+
+def usage():
+  print "usage: {0} [args] [path/to/repo]".format(sys.argv[0])
+  print "Reports 3rdparty artifacts the repo's modules depend on at divergent versions."
+  print ""
+  print "-?,-h         Show this message"
+  print "--json        Print the report as JSON"
+  PomUtils.common_usage()
+
+
+def main():
+  arguments = PomUtils.parse_common_args(sys.argv[1:])
+  flags = set(arg for arg in arguments if arg.startswith('-'))
+  paths = list(set(arguments) - flags)
+  if len(paths) > 1:
+    logger.error('Multiple repo root paths not supported.')
+    return
+
+  for f in flags:
+    if f == '-h' or f == '-?':
+      usage()
+      return
+    elif f == '--json':
+      pass
+    else:
+      print ("Unknown flag {0}".format(f))
+      usage()
+      return
+
+  if paths:
+    # Parts of the pom parsing only understand paths relative to the repo root.
+    os.chdir(paths[0])
+  divergences = VersionConvergence().analyze()
+  if '--json' in flags:
+    print VersionConvergence.format_json(divergences)
+  else:
+    print '\n'.join(VersionConvergence.format_text(divergences))
+
+
+if __name__ == '__main__':
+  main()
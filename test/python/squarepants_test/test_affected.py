@@ -0,0 +1,58 @@
+# Tests for code in squarepants/src/main/python/squarepants/affected.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:affected
+
+import json
+import os
+import unittest2 as unittest
+
+from squarepants.affected import AffectedModules
+from squarepants.file_utils import temporary_dir
+from squarepants.module_graph import ModuleGraph
+from squarepants.pom_utils import PomUtils
+
+
+class AffectedModulesTest(unittest.TestCase):
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _graph(self):
+    # c/nested -> b -test-jar-> a, and c/nested inherits from parents/child.
+    return ModuleGraph(['a', 'b', 'c/nested', 'd'],
+                       parents={'a': 'parents/base', 'b': 'parents/base',
+                                'c/nested': 'parents/child', 'd': 'parents/base',
+                                'parents/child': 'parents/base'},
+                       dependencies={'b': ['a'], 'c/nested': ['b']})
+
+  def test_analyze(self):
+    analysis = AffectedModules(self._graph())
+    self.assertEquals(({'a': 'changed a/src/main/java/A.java',
+                        'b': 'depends on a',
+                        'c/nested': 'depends on b'}, []),
+                      analysis.analyze(['a/src/main/java/A.java']))
+    self.assertEquals(({'c/nested': 'inherits from parents/child'}, ['3rdparty/BUILD']),
+                      analysis.analyze(['parents/child/pom.xml', '3rdparty/BUILD']))
+    affected, unowned = analysis.analyze(['d/pom.xml', 'd/src/test/java/DTest.java'])
+    self.assertEquals({'d': 'changed d/pom.xml and 1 other files'}, affected)
+    affected, unowned = analysis.analyze(['pom.xml'])
+    self.assertEquals(set(['a', 'b', 'c/nested', 'd']), set(affected))
+
+  def test_test_targets(self):
+    with temporary_dir() as root:
+      os.chdir(root)
+      os.makedirs('b/src/test/java')
+      with open('b/src/test/java/BTest.java', 'w') as f:
+        f.write('class BTest {}')
+      self.assertEquals(['b/src/test/java:test'], AffectedModules.test_targets('b'))
+      self.assertEquals([], AffectedModules.test_targets('a'))
+      affected, unowned = AffectedModules(self._graph()).analyze(['a/pom.xml'])
+      report = json.loads(AffectedModules.format_json(affected, unowned))
+      self.assertEquals({'reason': 'depends on a', 'test_targets': ['b/src/test/java:test']},
+                        report['modules']['b'])
@@ -9,7 +9,8 @@ import os
 import subprocess
 import unittest2 as unittest
 
-from squarepants.artifact_dependency_analysis import ArtifactDependencyAnalysis
+from squarepants.artifact_dependency_analysis import (AnalysisSession, ArtifactDependencyAnalysis,
+                                                      RepoDetails)
 from squarepants.pom_utils import PomUtils
 from squarepants.file_utils import temporary_dir
 
@@ -216,5 +217,41 @@ class ArtifactDependencyAnalysisTest(unittest.TestCase):
         self.assertEquals(0, run_result.returncode, msg=run_result.stderr)
         self.assertIn("com.squareup.foo, foo-service", run_result.stdout)
 
+  def test_session_analyzes_several_repos(self):
+    with self.make_sample_repo() as sample_repo:
+      with self.make_other_repo() as other_repo:
+        session = AnalysisSession()
+        sample = session.analyze(sample_repo)
+        other = session.analyze(other_repo)
+        # Analyzing the other repo doesn't disturb the first one.
+        self.assertIn(('com.squareup.foo', 'foo-service'), sample.produced_artifacts)
+        self.assertNotIn(('com.squareup.foo', 'bar-base'), sample.produced_artifacts)
+        self.assertIn(('com.squareup.foo', 'bar-base'), other.produced_artifacts)
+
+  def test_repo_matrix(self):
+    with self.make_sample_repo() as sample_repo:
+      with self.make_other_repo() as other_repo:
+        repos = AnalysisSession(jobs=2).capture_all([sample_repo, other_repo])
+        sample_name, other_name = [repo.repo_name for repo in repos]
+        self.assertEquals({sample_name: {other_name: [('com.squareup.foo', 'foo-service')]}},
+                          ArtifactDependencyAnalysis.repo_matrix(repos))
 
-
+  def test_snapshots(self):
+    with self.make_sample_repo() as sample_repo:
+      with temporary_dir() as snapshot_dir:
+        expected = AnalysisSession(snapshot_dir=snapshot_dir).capture(sample_repo)
+
+        class UnparsedSession(AnalysisSession):
+          def parse_pom(self, path, handler_type=None):
+            raise AssertionError('{0} should have been read from the snapshot.'.format(path))
+
+        details = UnparsedSession(snapshot_dir=snapshot_dir).capture(sample_repo)
+        self.assertEquals(expected.produced_artifacts, details.produced_artifacts)
+        self.assertEquals(expected.consumed_artifacts, details.consumed_artifacts)
+
+        with open(os.path.join(sample_repo, 'foo-service', 'pom.xml'), 'a') as pom_file:
+          pom_file.write('\n')
+        self.assertFalse(RepoDetails.load(
+          AnalysisSession(snapshot_dir=snapshot_dir)._snapshot_path(sample_repo)).is_current())
+        with self.assertRaises(AssertionError):
+          UnparsedSession(snapshot_dir=snapshot_dir).capture(sample_repo)
@@ -0,0 +1,83 @@
+# Tests for code in squarepants/src/main/python/squarepants/build_planner.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:build_planner
+
+import json
+import os
+import unittest2 as unittest
+
+from squarepants.build_planner import BuildPlanner, estimate_costs, module_size
+from squarepants.file_utils import temporary_dir
+from squarepants.module_graph import ModuleGraph
+from squarepants.pom_utils import PomUtils
+
+
+class BuildPlannerTest(unittest.TestCase):
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _graph(self):
+    # core <- api <- {service, client}; tools stands alone.
+    return ModuleGraph(['core', 'api', 'service', 'client', 'tools'],
+                       dependencies={'api': ['core'], 'service': ['api'], 'client': ['api']})
+
+  def test_plan(self):
+    costs = {'core': 10, 'api': 5, 'service': 20, 'client': 3, 'tools': 8}
+    plan = BuildPlanner(self._graph(), costs).plan(workers=2)
+    self.assertEquals([
+      [{'modules': ['core'], 'cost': 10}, {'modules': ['tools'], 'cost': 8}],
+      [{'modules': ['api'], 'cost': 5}],
+      [{'modules': ['service'], 'cost': 20}, {'modules': ['client'], 'cost': 3}],
+    ], plan['waves'])
+    self.assertEquals(['core', 'api', 'service'], plan['critical_path'])
+    self.assertEquals(46, plan['total_cost'])
+    self.assertEquals(35, plan['makespan'])
+
+  def test_plan_packs_longest_first(self):
+    graph = ModuleGraph(['a', 'b', 'c', 'd', 'e'])
+    costs = {'a': 7, 'b': 5, 'c': 4, 'd': 3, 'e': 1}
+    plan = BuildPlanner(graph, costs).plan(workers=2)
+    self.assertEquals([[{'modules': ['a', 'd'], 'cost': 10},
+                       {'modules': ['b', 'c', 'e'], 'cost': 10}]], plan['waves'])
+
+  def test_plan_subset_keeps_indirect_order(self):
+    costs = dict((module, 1) for module in self._graph().modules)
+    plan = BuildPlanner(self._graph(), costs, modules=['core', 'service']).plan(workers=4)
+    # api isn't scheduled, but service still has to wait for core.
+    self.assertEquals([[{'modules': ['core'], 'cost': 1}], [{'modules': ['service'], 'cost': 1}]],
+                      plan['waves'])
+    self.assertEquals(['core', 'service'], plan['critical_path'])
+
+  def test_plan_schedules_cycles_together(self):
+    graph = ModuleGraph(['a', 'b', 'c'], dependencies={'a': ['b'], 'b': ['a'], 'c': ['a']})
+    plan = BuildPlanner(graph, {'a': 1, 'b': 2, 'c': 1}).plan(workers=2)
+    self.assertEquals([[{'modules': ['a', 'b'], 'cost': 3}], [{'modules': ['c'], 'cost': 1}]],
+                      plan['waves'])
+
+  def test_estimate_costs(self):
+    sizes = {'a': 100, 'b': 300, 'c': 0}
+    self.assertEquals(({'a': 100, 'b': 300, 'c': 1}, 'bytes'),
+                      estimate_costs(['a', 'b', 'c'], size=sizes.get))
+    self.assertEquals(({'a': 2.0, 'b': 6.0, 'c': 0.0}, 'seconds'),
+                      estimate_costs(['a', 'b', 'c'], times={'a': 2, 'other': 5}, size=sizes.get))
+
+  def test_format_json(self):
+    with temporary_dir() as root:
+      os.chdir(root)
+      os.makedirs('core/src/main/java')
+      with open('core/src/main/java/Core.java', 'w') as f:
+        f.write('class Core {}')
+      self.assertEquals(len('class Core {}'), module_size('core'))
+      graph = ModuleGraph(['core'])
+      costs, cost_unit = estimate_costs(graph.modules)
+      plan = json.loads(BuildPlanner.format_json(BuildPlanner(graph, costs).plan(1), 1, cost_unit))
+      self.assertEquals(['core/src/main/java:lib', 'core:lib'], plan['waves'][0][0]['targets'])
+      self.assertEquals('bytes', plan['cost_unit'])
+      self.assertEquals(1, plan['workers'])
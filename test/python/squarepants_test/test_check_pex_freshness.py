@@ -0,0 +1,101 @@
+# Tests for code in squarepants/src/main/python/squarepants/check_pex_freshness.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:check_pex_freshness
+
+import json
+import os
+from textwrap import dedent
+import unittest2 as unittest
+from zipfile import ZipFile
+
+from squarepants.check_pex_freshness import (changed_components, check_pex_health,
+                                             pex_fingerprint, pex_file_path, task_workdirs)
+from squarepants.file_utils import temporary_dir
+
+
+DEPMAP_REGISTER = dedent('''
+    def register_goals():
+      Goal.register('sq-depmap', 'Generates a visualization of the dependency graph.')
+      task(name='sq-depmap', action=SquareDepmap).install('sq-depmap')
+    ''')
+
+
+class CheckPexFreshnessTest(unittest.TestCase):
+
+  def _write_pex(self, path, entries):
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with ZipFile(path, 'w') as pex:
+      pex.writestr('PEX-INFO', json.dumps(entries.keys()))
+      for name, contents in entries.items():
+        pex.writestr(name, contents)
+
+  def _entries(self, **overrides):
+    entries = {
+      '.deps/pantsbuild.pants-1.0.0-py2-none-any.whl/pants/__init__.py': '',
+      'squarepants/__init__.py': '',
+      'squarepants/plugins/square_depmap/register.py': DEPMAP_REGISTER,
+      'squarepants/plugins/findbugs/register.py':
+        "task(name='findbugs', action=FindBugs).install()\n",
+      'squarepants/plugins/square_idea/register.py':
+        "task(\n  name='idea',\n  action=SquareIdea,\n).install('square-idea')\n",
+    }
+    entries.update(overrides)
+    return entries
+
+  def test_task_workdirs(self):
+    self.assertEquals(['sq-depmap'], task_workdirs(DEPMAP_REGISTER))
+    self.assertEquals(['square-idea/idea', 'findbugs'], task_workdirs(
+      "task(\n  name='idea',\n  action=SquareIdea,\n).install('square-idea')\n"
+      "task(name='findbugs', action=FindBugs).install()\n"))
+
+  def test_fingerprint_components(self):
+    with temporary_dir() as tmpdir:
+      pex = os.path.join(tmpdir, 'pants.pex')
+      self._write_pex(pex, self._entries())
+      old = pex_fingerprint(pex)
+      self.assertEquals(set(['pantsbuild.pants', 'squarepants',
+                             'squarepants.plugins.findbugs',
+                             'squarepants.plugins.square_depmap',
+                             'squarepants.plugins.square_idea']),
+                        set(old['components']))
+      self._write_pex(pex, self._entries(**{
+        'squarepants/plugins/square_depmap/register.py': DEPMAP_REGISTER + '\n',
+        'squarepants/plugins/jax_ws/register.py': '',
+      }))
+      new = pex_fingerprint(pex, old)
+      self.assertNotEqual(old['sha1'], new['sha1'])
+      self.assertEquals(['squarepants.plugins.jax_ws', 'squarepants.plugins.square_depmap'],
+                        changed_components(old, new))
+
+  def test_fingerprint_reused_when_stat_matches(self):
+    with temporary_dir() as tmpdir:
+      pex = os.path.join(tmpdir, 'pants.pex')
+      self._write_pex(pex, self._entries())
+      fingerprint = pex_fingerprint(pex)
+      fingerprint['sha1'] = 'not read again'
+      self.assertIs(fingerprint, pex_fingerprint(pex, fingerprint))
+      os.utime(pex, (1, 1))
+      self.assertNotEqual('not read again', pex_fingerprint(pex, fingerprint)['sha1'])
+
+  def test_selective_clean(self):
+    with temporary_dir() as baseroot:
+      pex = pex_file_path(baseroot)
+      self._write_pex(pex, self._entries())
+      check_pex_health(baseroot, ['--selective-clean'])
+      self.assertTrue(os.path.exists(os.path.join(baseroot, '.pants.d', 'pom-gen',
+                                                  'pex-fingerprint.json')))
+      workdirs = ['sq-depmap', 'findbugs', 'compile/jvm']
+      for workdir in workdirs:
+        os.makedirs(os.path.join(baseroot, '.pants.d', workdir))
+
+      self._write_pex(pex, self._entries(**{
+        'squarepants/plugins/square_depmap/register.py': DEPMAP_REGISTER + '\n',
+      }))
+      check_pex_health(baseroot, ['--selective-clean'])
+      self.assertEquals([False, True, True],
+                        [os.path.isdir(os.path.join(baseroot, '.pants.d', workdir))
+                         for workdir in workdirs])
+      # No changes, nothing more to do.
+      check_pex_health(baseroot, ['--selective-clean'])
@@ -0,0 +1,230 @@
+# Tests for code in squarepants/src/main/python/squarepants/checkpoms.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:checkpoms
+
+import os
+import signal
+import subprocess
+from textwrap import dedent
+import unittest2 as unittest
+
+from squarepants import checkpoms
+from squarepants.checkpoms import CheckPoms
+from squarepants.file_utils import temporary_dir
+from squarepants.pom_utils import PomUtils
+
+
+POM_TEMPLATE = dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    <project>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      {parent}
+      <dependencies>
+        {dependencies}
+      </dependencies>
+    </project>
+    ''')
+
+PARENT_TEMPLATE = dedent('''
+    <parent>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      <relativePath>{path}</relativePath>
+    </parent>
+    ''')
+
+DEPENDENCY_TEMPLATE = dedent('''
+    <dependency>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+    </dependency>
+    ''')
+
+
+class Interrupted(Exception):
+  """Stands in for checkpoms being killed part way through generating."""
+
+
+class FakePomToBuild(object):
+  """Writes a BUILD.gen naming the pom it was generated from, instead of running the generator."""
+
+  converted = []
+  interrupt_at = None
+
+  def convert_pom(self, pom_file_name, rootdir=None):
+    module = os.path.dirname(pom_file_name)
+    if module == self.interrupt_at:
+      raise Interrupted(module)
+    self.converted.append(module)
+    with open(os.path.join(rootdir, module, 'BUILD.gen'), 'w') as f:
+      f.write('# Generated from {0}\n'.format(pom_file_name))
+
+
+class FakeCheckPoms(CheckPoms):
+  """Records when 3rdparty/BUILD.gen is regenerated, instead of resolving its dependencies."""
+
+  third_party_generated = 0
+
+  def _generate_third_party(self):
+    FakeCheckPoms.third_party_generated += 1
+    with open(os.path.join(self.baseroot, '3rdparty', 'BUILD.gen'), 'w') as f:
+      f.write('# Generated\n')
+
+
+class CheckPomsTest(unittest.TestCase):
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    self._sigint_handler = signal.getsignal(signal.SIGINT)
+    self._pom_to_build = checkpoms.PomToBuild
+    checkpoms.PomToBuild = FakePomToBuild
+    FakePomToBuild.interrupt_at = None
+
+  def tearDown(self):
+    checkpoms.PomToBuild = self._pom_to_build
+    signal.signal(signal.SIGINT, self._sigint_handler)
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _write_pom(self, root, directory, artifact_id, parent=None, dependencies=()):
+    parent_xml = ''
+    if parent:
+      parent_xml = PARENT_TEMPLATE.format(artifact_id=os.path.basename(parent),
+                                          path=os.path.relpath(os.path.join(parent, 'pom.xml'),
+                                                               directory))
+    dependencies_xml = ''.join(DEPENDENCY_TEMPLATE.format(artifact_id=artifact_id)
+                               for artifact_id in dependencies)
+    path = os.path.join(root, directory, 'pom.xml')
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(POM_TEMPLATE.format(artifact_id=artifact_id, parent=parent_xml,
+                                  dependencies=dependencies_xml))
+
+  def _make_repo(self, root):
+    """Lays out a repo whose modules a, b and d inherit from parents/base, c/nested inherits from
+    parents/child, b depends on a and c/nested depends on b.
+    """
+    with open(os.path.join(root, 'pom.xml'), 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>all</artifactId>
+            <modules>
+              <module>a</module>
+              <module>b</module>
+              <module>c/nested</module>
+              <module>d</module>
+            </modules>
+          </project>
+          '''))
+    self._write_pom(root, 'parents/base', 'base')
+    self._write_pom(root, 'parents/child', 'child', parent='parents/base')
+    self._write_pom(root, 'a', 'a', parent='parents/base')
+    self._write_pom(root, 'b', 'b', parent='parents/base', dependencies=['a'])
+    self._write_pom(root, 'c/nested', 'c', parent='parents/child', dependencies=['b'])
+    self._write_pom(root, 'd', 'd', parent='parents/base')
+    os.makedirs(os.path.join(root, '3rdparty'))
+    # Generator sources are looked for relative to the working directory.
+    os.makedirs(os.path.join(root, 'squarepants'))
+    os.chdir(root)
+    # The index is kept per branch.
+    subprocess.check_call(['git', 'init', '-q', root])
+
+  def _run(self, root, flags=()):
+    """Runs checkpoms up to regenerating the BUILD.* files and writing the index.
+
+    :return: the sorted modules whose BUILD.gen was regenerated.
+    """
+    PomUtils.reset_caches()
+    del FakePomToBuild.converted[:]
+    FakeCheckPoms.third_party_generated = 0
+    checker = FakeCheckPoms(root, set(flags))
+    checker._find_dependencies()
+    checker._find_dependency_differences()
+    checker._regenerate_if_necessary_and_reindex()
+    return sorted(FakePomToBuild.converted)
+
+  def _generated(self, root):
+    """:return: the sorted relative paths of the BUILD.gen files in the repo."""
+    return sorted(os.path.relpath(os.path.join(directory, 'BUILD.gen'), root)
+                  for directory, _, files in os.walk(root)
+                  if 'BUILD.gen' in files and '.pants.d' not in directory)
+
+  def test_first_run_regenerates_everything(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      self.assertEquals(['a', 'b', 'c/nested', 'd'], self._run(root))
+      self.assertEquals(1, FakeCheckPoms.third_party_generated)
+      self.assertEquals(['3rdparty/BUILD.gen', 'a/BUILD.gen', 'b/BUILD.gen',
+                         'c/nested/BUILD.gen', 'd/BUILD.gen'], self._generated(root))
+      # Nothing changed since.
+      self.assertEquals([], self._run(root))
+
+  def test_changed_module_regenerates_affected_modules(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      self._run(root)
+      self._write_pom(root, 'a', 'a', parent='parents/base', dependencies=['d'])
+      # Only a and the modules that depend on it; c/nested only references b's targets.
+      self.assertEquals(['a', 'b'], self._run(root))
+      self.assertEquals(0, FakeCheckPoms.third_party_generated)
+      # The generated files of the modules which weren't affected are kept.
+      self.assertEquals(['3rdparty/BUILD.gen', 'a/BUILD.gen', 'b/BUILD.gen',
+                         'c/nested/BUILD.gen', 'd/BUILD.gen'], self._generated(root))
+
+  def test_changed_base_parent_regenerates_third_party(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      self._run(root)
+      self._write_pom(root, 'parents/child', 'child', parent='parents/base', dependencies=['a'])
+      self.assertEquals(['c/nested'], self._run(root))
+      self.assertEquals(0, FakeCheckPoms.third_party_generated)
+      self._write_pom(root, 'parents/base', 'base', dependencies=['a'])
+      self.assertEquals(['a', 'b', 'c/nested', 'd'], self._run(root))
+      self.assertEquals(1, FakeCheckPoms.third_party_generated)
+
+  def test_stray_generated_files_removed(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      self._run(root)
+      os.makedirs(os.path.join(root, 'orphan'))
+      with open(os.path.join(root, 'orphan', 'BUILD.gen'), 'w') as f:
+        f.write('# Not part of any module\n')
+      self.assertEquals([], self._run(root))
+      self.assertFalse(os.path.exists(os.path.join(root, 'orphan', 'BUILD.gen')))
+      self.assertTrue(os.path.exists(os.path.join(root, 'a', 'BUILD.gen')))
+
+  def test_regenerates_everything_without_module_graph(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      self._run(root)
+      for directory, _, files in os.walk(os.path.join(root, '.pants.d')):
+        if checkpoms._MODULE_GRAPH_FILE in files:
+          os.remove(os.path.join(directory, checkpoms._MODULE_GRAPH_FILE))
+      self._write_pom(root, 'd', 'd', parent='parents/base', dependencies=['a'])
+      self.assertEquals(['a', 'b', 'c/nested', 'd'], self._run(root))
+      self.assertEquals(1, FakeCheckPoms.third_party_generated)
+
+  def test_regenerates_everything_when_pom_outside_modules_changes(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      self._run(root)
+      self._write_pom(root, 'unlisted', 'unlisted')
+      self.assertEquals(['a', 'b', 'c/nested', 'd'], self._run(root))
+
+  def test_resumes_interrupted_run(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      self._run(root)
+      self._write_pom(root, 'a', 'a', parent='parents/base', dependencies=['d'])
+      FakePomToBuild.interrupt_at = 'b'
+      with self.assertRaises(Interrupted):
+        self._run(root)
+      self.assertEquals(['a'], FakePomToBuild.converted)
+      FakePomToBuild.interrupt_at = None
+      # a was finished before the interruption, so only b is left.
+      self.assertEquals(['b'], self._run(root))
+      self.assertEquals(['3rdparty/BUILD.gen', 'a/BUILD.gen', 'b/BUILD.gen',
+                         'c/nested/BUILD.gen', 'd/BUILD.gen'], self._generated(root))
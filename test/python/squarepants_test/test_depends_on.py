@@ -0,0 +1,149 @@
+# Tests for code in squarepants/src/main/python/squarepants/depends_on.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:depends_on
+
+import json
+import os
+from textwrap import dedent
+import unittest2 as unittest
+
+from squarepants.depends_on import DependencyIndex
+from squarepants.file_utils import temporary_dir
+from squarepants.pom_utils import PomUtils
+
+
+POM_TEMPLATE = dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    <project>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      <parent>
+        <groupId>com.example</groupId>
+        <artifactId>base</artifactId>
+        <relativePath>../parents/base/pom.xml</relativePath>
+      </parent>
+      <dependencies>
+        {dependencies}
+      </dependencies>
+    </project>
+    ''')
+
+DEPENDENCY_TEMPLATE = dedent('''
+    <dependency>
+      <groupId>com.example</groupId>
+      <artifactId>{0}</artifactId>
+    </dependency>
+    ''')
+
+
+class DependsOnTest(unittest.TestCase):
+
+  INDEX_FILE = '.pants.d/pom-gen/depends-on-index.json'
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _write_pom(self, module, dependencies):
+    if not os.path.exists(module):
+      os.makedirs(module)
+    with open(os.path.join(module, 'pom.xml'), 'w') as f:
+      f.write(POM_TEMPLATE.format(artifact_id=module, dependencies=''.join(
+        DEPENDENCY_TEMPLATE.format(dep) for dep in dependencies)))
+
+  def _make_repo(self, root):
+    """Lays out a repo where a -> b -> c, and d -> c. Every module also depends on its parent."""
+    os.chdir(root)
+    with open('pom.xml', 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>all</artifactId>
+            <modules>
+              <module>a</module>
+              <module>b</module>
+              <module>c</module>
+              <module>d</module>
+            </modules>
+          </project>
+          '''))
+    os.makedirs('parents/base')
+    with open('parents/base/pom.xml', 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>base</artifactId>
+          </project>
+          '''))
+    self._write_pom('a', ['b'])
+    self._write_pom('b', ['c'])
+    self._write_pom('c', [])
+    self._write_pom('d', ['c'])
+
+  def test_queries(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      index = DependencyIndex.load(self.INDEX_FILE)
+      self.assertEquals('com.example.a', index.target_for('a/pom.xml'))
+      self.assertEquals('com.example.a', index.target_for('a'))
+      self.assertEquals('com.example.a', index.target_for('com.example.a'))
+      self.assertEquals('com.example.base', index.target_for('parents/base/pom.xml'))
+      self.assertEquals(set(['com.example.b', 'com.example.c', 'com.example.base']),
+                        index.depends_on('com.example.a'))
+      self.assertEquals(set(['com.example.a', 'com.example.b', 'com.example.d']),
+                        index.depended_on_by('com.example.c'))
+      self.assertEquals({
+        'query': 'b',
+        'target': 'com.example.b',
+        'depends_on': ['com.example.base', 'com.example.c'],
+        'depended_on_by': ['com.example.a'],
+      }, index.query('b', ('depends_on', 'depended_on_by')))
+
+  def test_index_reused(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      DependencyIndex.load(self.INDEX_FILE)
+      with open(self.INDEX_FILE) as f:
+        self.assertEquals(4, len(json.load(f)['modules']))
+      PomUtils.reset_caches()
+
+      class UnparsedIndex(DependencyIndex):
+        @classmethod
+        def _module_entry(cls, module, fingerprints):
+          raise AssertionError('{0} should have been read from the index.'.format(module))
+
+      index = UnparsedIndex.load(self.INDEX_FILE)
+      self.assertEquals(set(['com.example.b', 'com.example.c', 'com.example.base']),
+                        index.depends_on('com.example.a'))
+
+  def test_index_invalidated(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      DependencyIndex.load(self.INDEX_FILE)
+      self._write_pom('d', [])
+      PomUtils.reset_caches()
+
+      reparsed = []
+
+      class RecordingIndex(DependencyIndex):
+        @classmethod
+        def _module_entry(cls, module, fingerprints):
+          reparsed.append(module)
+          return super(RecordingIndex, cls)._module_entry(module, fingerprints)
+
+      index = RecordingIndex.load(self.INDEX_FILE)
+      self.assertEquals(['d'], reparsed)
+      self.assertEquals(set(['com.example.a', 'com.example.b']),
+                        index.depended_on_by('com.example.c'))
+
+      # Changing the parent pom invalidates every module which inherits from it.
+      with open('parents/base/pom.xml', 'a') as f:
+        f.write('\n')
+      PomUtils.reset_caches()
+      del reparsed[:]
+      RecordingIndex.load(self.INDEX_FILE)
+      self.assertEquals(['a', 'b', 'c', 'd'], sorted(reparsed))
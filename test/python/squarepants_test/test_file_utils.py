@@ -7,7 +7,7 @@ import os
 import re
 import unittest2 as unittest
 
-from squarepants.file_utils import file_pattern_exists_in_subdir, temporary_dir, touch
+from squarepants.file_utils import file_pattern_exists_in_subdir, read_lines, temporary_dir, touch
 
 class PomToBuildTest(unittest.TestCase):
 
@@ -28,3 +28,10 @@ class PomToBuildTest(unittest.TestCase):
       touch(os.path.join(nested_dir, 'bogus.java'))
       touch(os.path.join(nested_dir, 'AnotherTest.java'))
       self.assertTrue(file_pattern_exists_in_subdir(tmpdir, pattern))
+
+  def test_read_lines(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'modules')
+      with open(path, 'w') as f:
+        f.write('foo\n\n  bar/baz \n')
+      self.assertEquals(['foo', 'bar/baz'], read_lines(path))
@@ -0,0 +1,47 @@
+# Tests for code in squarepants/src/main/python/squarepants/flake_history.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:flake_history
+from __future__ import unicode_literals
+
+import unittest2 as unittest
+
+from squarepants import junit_report
+from squarepants.flake_history import FlakeHistory
+
+
+def cases(failures, passes):
+  return ([junit_report.TestCase(full_name=name, time=0.1, state=junit_report.State.FAILURE)
+           for name in failures] +
+          [junit_report.TestCase(full_name=name, time=0.1, state=junit_report.State.SUCCESS)
+           for name in passes])
+
+
+class FlakeHistoryTest(unittest.TestCase):
+
+  def test_record_run(self):
+    history = FlakeHistory(':memory:')
+    history.record_run(cases(['a.B.c'], ['a.B.d']), label='build-1')
+    # A test which is retried counts as failed if any attempt failed.
+    history.record_run(cases(['a.B.d'], ['a.B.c', 'a.B.d']), label='build-2')
+    self.assertEquals([('build-2', False), ('build-1', True)], history.test_history('a.B.c'))
+    self.assertEquals([('build-2', True)], history.test_history('a.B.d', runs=1))
+    self.assertEquals({'a.B.c': (2, 1), 'a.B.d': (2, 1)}, history.failure_rates(window=5))
+    self.assertEquals({'a.B.c': (1, 0), 'a.B.d': (1, 1)}, history.failure_rates(window=1))
+
+  def test_propose(self):
+    history = FlakeHistory(':memory:')
+    for run in range(20):
+      failures = ['Broken.test']
+      if run in (3, 11):
+        failures.append('Flaky.test')
+      if run == 5:
+        failures.append('Rare.test')
+      history.record_run(cases(failures, ['Flaky.test', 'Rare.test', 'Fixed.test', 'Stable.test']))
+    history.record_run(cases([], ['New.test']))
+    proposal = history.propose(set(['Fixed.test', 'Rare.test', 'Gone.test']), window=30,
+                               threshold=0.05, min_runs=10)
+    self.assertEquals([{'test': 'Flaky.test', 'runs': 20, 'failures': 2, 'rate': 0.1}],
+                      proposal['quarantine'])
+    self.assertEquals(['Fixed.test'], [stats['test'] for stats in proposal['release']])
+    self.assertEquals({'quarantine': [], 'release': []}, FlakeHistory(':memory:').propose(set()))
@@ -0,0 +1,176 @@
+# Tests for code in squarepants/src/main/python/squarepants/gen_cache.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:gen_cache
+
+import os
+import time
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.gen_cache import GenCache
+
+
+class GenCacheTest(unittest.TestCase):
+
+  def _write(self, root, relpath, contents):
+    path = os.path.join(root, relpath)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(contents)
+
+  def _read(self, root, relpath):
+    with open(os.path.join(root, relpath)) as f:
+      return f.read()
+
+  def test_fingerprint_ignores_order(self):
+    pairs = [('a/pom.xml', '1234'), ('b/pom.xml', '5678')]
+    self.assertEquals(GenCache.fingerprint(pairs), GenCache.fingerprint(reversed(pairs)))
+    self.assertNotEqual(GenCache.fingerprint(pairs), GenCache.fingerprint(pairs[:1]))
+    self.assertNotEqual(GenCache.fingerprint(pairs, salt='1.7'),
+                        GenCache.fingerprint(pairs, salt='1.8'))
+
+  def test_store_and_lookup(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      cache = GenCache(store_dir)
+      self.assertIsNone(cache.lookup('abc'))
+      self._write(root, 'foo/BUILD.gen', 'target(name="foo")\n')
+      self._write(root, 'bar/BUILD.gen', 'target(name="foo")\n')
+      self._write(root, 'bar/src/BUILD.aux', 'target(name="aux-bar")\n')
+      manifest = cache.store('abc', root, ['foo/BUILD.gen', 'bar/BUILD.gen', 'bar/src/BUILD.aux'])
+      self.assertEquals(sorted(manifest), sorted(cache.lookup('abc')))
+      self.assertEquals(['bar/BUILD.gen', 'bar/src/BUILD.aux', 'foo/BUILD.gen'],
+                        sorted(relpath for _, relpath in manifest))
+
+      stats = cache.stats
+      self.assertEquals(1, stats['hits'])
+      self.assertEquals(1, stats['misses'])
+      # foo/BUILD.gen and bar/BUILD.gen have the same contents, so one copy is deduplicated.
+      self.assertEquals(len('target(name="foo")\n'), stats['bytes_saved'])
+      self.assertEquals(2, len(cache._object_sizes()))
+
+      cache.save_stats()
+      self.assertEquals(1, GenCache(store_dir).stats['hits'])
+
+  def test_entries_shared_between_stores(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      self._write(root, 'foo/BUILD.gen', 'one')
+      GenCache(store_dir).store('abc', root, ['foo/BUILD.gen'])
+      self.assertIsNotNone(GenCache(store_dir).lookup('abc'))
+
+  def test_lookup_with_missing_object(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      cache = GenCache(store_dir)
+      self._write(root, 'foo/BUILD.gen', 'one')
+      manifest = cache.store('abc', root, ['foo/BUILD.gen'])
+      os.remove(cache.object_path(manifest[0][0]))
+      self.assertIsNone(cache.lookup('abc'))
+      self.assertFalse(cache.has_entry('abc'))
+
+  def test_lookup_with_corrupt_entry(self):
+    with temporary_dir() as store_dir:
+      cache = GenCache(store_dir)
+      self._write(store_dir, cache.entry_path('abc'), 'garbage\n')
+      self.assertIsNone(cache.lookup('abc'))
+      self.assertFalse(cache.has_entry('abc'))
+      self.assertEquals(1, cache.stats['misses'])
+
+  def test_restore(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      cache = GenCache(store_dir)
+      self._write(root, 'foo/BUILD.gen', 'one')
+      self._write(root, 'bar/BUILD.gen', 'two')
+      manifest = cache.store('abc', root, ['foo/BUILD.gen', 'bar/BUILD.gen'])
+      self._write(root, 'foo/BUILD.gen', 'changed')
+      os.remove(os.path.join(root, 'bar', 'BUILD.gen'))
+      result = cache.restore(manifest, root)
+      self.assertEquals(2, result.files)
+      self.assertEquals(len('one') + len('two'), result.bytes)
+      self.assertEquals('one', self._read(root, 'foo/BUILD.gen'))
+      self.assertEquals('two', self._read(root, 'bar/BUILD.gen'))
+      self.assertEquals(0, cache.restore(manifest, root).files)
+
+  def test_restore_trusts_current_hashes(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      cache = GenCache(store_dir)
+      self._write(root, 'foo/BUILD.gen', 'one')
+      self._write(root, 'bar/BUILD.gen', 'two')
+      manifest = cache.store('abc', root, ['foo/BUILD.gen', 'bar/BUILD.gen'])
+      self._write(root, 'foo/BUILD.gen', 'changed')
+      current_hashes = dict((relpath, content_hash) for content_hash, relpath in manifest)
+      # The file isn't re-read, so the stale hash hides the change.
+      self.assertEquals(0, cache.restore(manifest, root, current_hashes=current_hashes).files)
+      self.assertEquals('changed', self._read(root, 'foo/BUILD.gen'))
+      del current_hashes['foo/BUILD.gen']
+      self.assertEquals(1, cache.restore(manifest, root, current_hashes=current_hashes).files)
+      self.assertEquals('one', self._read(root, 'foo/BUILD.gen'))
+
+  def test_restore_methods(self):
+    for method in ('hardlink', 'copy'):
+      with temporary_dir() as store_dir, temporary_dir() as root:
+        self._write(root, 'foo/BUILD.gen', 'one')
+        self._write(root, 'bar/BUILD.gen', 'two')
+        cache = GenCache(store_dir, methods=[method])
+        manifest = cache.store('abc', root, ['foo/BUILD.gen', 'bar/BUILD.gen'])
+        os.remove(os.path.join(root, 'foo', 'BUILD.gen'))
+        os.remove(os.path.join(root, 'bar', 'BUILD.gen'))
+        result = cache.restore(manifest, root)
+        self.assertEquals({method: 2}, result.methods)
+        self.assertEquals('one', self._read(root, 'foo/BUILD.gen'))
+        linked = os.path.samefile(os.path.join(root, 'foo', 'BUILD.gen'),
+                                  cache.object_path(manifest[1][0]))
+        self.assertEquals(method == 'hardlink', linked)
+
+  def test_restore_detects_modified_object(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      cache = GenCache(store_dir, methods=['hardlink'])
+      self._write(root, 'foo/BUILD.gen', 'one')
+      manifest = cache.store('abc', root, ['foo/BUILD.gen'])
+      os.remove(os.path.join(root, 'foo', 'BUILD.gen'))
+      cache.restore(manifest, root)
+      # Writing through the hardlink modifies the stored object too.
+      with open(os.path.join(root, 'foo', 'BUILD.gen'), 'a') as f:
+        f.write('more')
+      with self.assertRaises(GenCache.CorruptObjectError):
+        cache.restore(manifest, root)
+      self.assertIsNone(cache.lookup('abc'))
+
+  def test_format_restore_result(self):
+    result = GenCache.RestoreResult(files=4, bytes=2097152, seconds=2.0,
+                                    methods={'hardlink': 3, 'copy': 1})
+    self.assertEquals('Restored 4 files (2.00 MB) in 2.000 seconds, 2 files/s, 1.0 MB/s '
+                      '(1 copy, 3 hardlink).', GenCache.format_restore_result(result))
+    self.assertIn('nothing to do',
+                  GenCache.format_restore_result(GenCache.RestoreResult(0, 0, 0.0, {})))
+
+  def test_gc_by_age(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      cache = GenCache(store_dir)
+      self._write(root, 'foo/BUILD.gen', 'old')
+      cache.store('old', root, ['foo/BUILD.gen'])
+      self._write(root, 'foo/BUILD.gen', 'new')
+      cache.store('new', root, ['foo/BUILD.gen'])
+      now = time.time()
+      os.utime(cache.entry_path('old'), (now - 100, now - 100))
+      self.assertEquals((1, 3), cache.gc(max_age=50, now=now))
+      self.assertFalse(cache.has_entry('old'))
+      self.assertTrue(cache.has_entry('new'))
+      self.assertEquals(1, len(cache._object_sizes()))
+
+  def test_gc_by_size(self):
+    with temporary_dir() as store_dir, temporary_dir() as root:
+      cache = GenCache(store_dir)
+      now = time.time()
+      for age, name in enumerate(['newest', 'middle', 'oldest']):
+        self._write(root, 'foo/BUILD.gen', name * 10)
+        cache.store(name, root, ['foo/BUILD.gen'])
+        os.utime(cache.entry_path(name), (now - age, now - age))
+      removed, freed = cache.gc(max_bytes=len('newest' * 10) + len('middle' * 10))
+      self.assertEquals((1, len('oldest' * 10)), (removed, freed))
+      self.assertTrue(cache.has_entry('newest'))
+      self.assertTrue(cache.has_entry('middle'))
+      self.assertFalse(cache.has_entry('oldest'))
+      # The most recently used entry is always kept, even if it alone is over the limit.
+      self.assertEquals(1, cache.gc(max_bytes=1)[0])
+      self.assertTrue(cache.has_entry('newest'))
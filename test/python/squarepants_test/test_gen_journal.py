@@ -0,0 +1,69 @@
+# Tests for code in squarepants/src/main/python/squarepants/gen_journal.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:gen_journal
+
+import os
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.gen_journal import GenerationJournal
+
+
+class GenerationJournalTest(unittest.TestCase):
+
+  def test_no_journal(self):
+    with temporary_dir() as tmpdir:
+      self.assertIsNone(GenerationJournal(os.path.join(tmpdir, 'journal')).read())
+
+  def test_interrupted_run(self):
+    with temporary_dir() as tmpdir:
+      journal = GenerationJournal(os.path.join(tmpdir, 'index', 'journal'))
+      journal.begin('abc', ['a', 'b', 'c', '3rdparty/BUILD.gen'])
+      journal.done('a', 'a/BUILD.gen', '1111')
+      journal.done('b')
+
+      state = GenerationJournal(journal.path).read()
+      self.assertEquals('abc', state.fingerprint)
+      self.assertEquals(['a', 'b', 'c', '3rdparty/BUILD.gen'], state.planned)
+      self.assertEquals({'a': ('a/BUILD.gen', '1111'), 'b': (None, None)}, state.done)
+      self.assertEquals(['c', '3rdparty/BUILD.gen'], state.pending({'a/BUILD.gen': '1111'}))
+      # a's file was changed or removed after it was generated, so it has to be redone.
+      self.assertEquals(['a', 'c', '3rdparty/BUILD.gen'], state.pending({}))
+
+  def test_clear(self):
+    with temporary_dir() as tmpdir:
+      journal = GenerationJournal(os.path.join(tmpdir, 'journal'))
+      journal.begin('abc', ['a'])
+      journal.done('a', 'a/BUILD.gen', '1111')
+      self.assertIsNotNone(journal.read())
+      journal.clear()
+      self.assertIsNone(journal.read())
+      journal.clear()
+
+  def test_begin_replaces_previous_run(self):
+    with temporary_dir() as tmpdir:
+      journal = GenerationJournal(os.path.join(tmpdir, 'journal'))
+      journal.begin('abc', ['a', 'b'])
+      journal.done('a')
+      journal.begin('def', ['b'])
+      state = journal.read()
+      self.assertEquals('def', state.fingerprint)
+      self.assertEquals(['b'], state.pending({}))
+
+  def test_partial_record_ignored(self):
+    with temporary_dir() as tmpdir:
+      journal = GenerationJournal(os.path.join(tmpdir, 'journal'))
+      journal.begin('abc', ['a', 'b'])
+      journal.done('a')
+      with open(journal.path, 'a') as f:
+        f.write('done\tb\tb/BUI')
+      self.assertEquals(['b'], journal.read().pending({}))
+
+  def test_bad_journal(self):
+    with temporary_dir() as tmpdir:
+      journal = GenerationJournal(os.path.join(tmpdir, 'journal'))
+      with open(journal.path, 'w') as f:
+        f.write('garbage\n')
+      with self.assertRaises(GenerationJournal.FormatError):
+        journal.read()
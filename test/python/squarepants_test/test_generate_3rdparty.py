@@ -3,10 +3,16 @@
 # Run with:
 # ./pants test squarepants/src/test/python/squarepants_test:generate_3rdparty
 
+import json
+import os
 import unittest2 as unittest
 from collections import namedtuple
+from textwrap import dedent
 
-from squarepants.generate_3rdparty import ThirdPartyBuildGenerator
+from squarepants.file_utils import temporary_dir
+from squarepants.generate_3rdparty import (ArtifactId, ArtifactSetIndex, ThirdPartyBuildGenerator,
+                                           format_update, update_build_files, write_build_files)
+from squarepants.pom_utils import PomUtils
 
 
 DependencySet = namedtuple('DependencySet', ['dependency_list', 'dependency_string'])
@@ -141,3 +147,231 @@ class GenerateThirdPartyTest(unittest.TestCase):
         managed_dependencies=':managed',
       )
     ''')
+
+
+class ArtifactSetIndexTest(unittest.TestCase):
+
+  def test_lookup(self):
+    index = ArtifactSetIndex({
+      'managed-hbase': [ArtifactId('org.apache.hbase', None, None),
+                        ArtifactId('org.apache.hadoop', None, None)],
+      'managed-grpc': [ArtifactId('io.grpc', 'grpc-core', None),
+                       ArtifactId(None, 'protobuf-java', '3.0.0')],
+    })
+    self.assertEquals('managed-hbase', index.lookup(ArtifactId('org.apache.hbase', 'hbase', '1.0')))
+    self.assertEquals('managed-grpc', index.lookup(ArtifactId('io.grpc', 'grpc-core', '1.0')))
+    self.assertIsNone(index.lookup(ArtifactId('io.grpc', 'grpc-netty', '1.0')))
+    self.assertEquals('managed-grpc',
+                      index.lookup(ArtifactId('com.google.protobuf', 'protobuf-java', '3.0.0')))
+    self.assertIsNone(index.lookup(ArtifactId('com.google.protobuf', 'protobuf-java', '2.6.1')))
+    self.assertIsNone(index.lookup(ArtifactId('org.apache', 'hbase', '1.0')))
+
+  def test_most_specific_pattern_wins(self):
+    index = ArtifactSetIndex({
+      'managed-b': [ArtifactId('org.foobar', None, None)],
+      'managed-a': [ArtifactId('org.foobar', 'hello', None), ArtifactId(None, None, '1.0')],
+    })
+    self.assertEquals('managed-a', index.lookup(ArtifactId('org.foobar', 'hello', '2.0')))
+    self.assertEquals('managed-b', index.lookup(ArtifactId('org.foobar', 'goodbye', '1.0')))
+    self.assertEquals('managed-a', index.lookup(ArtifactId('org.other', 'goodbye', '1.0')))
+
+
+class ThirdPartyBuildFilesTest(unittest.TestCase):
+
+  DEPENDENCIES = [
+    {'groupId': 'com.squareup', 'artifactId': 'simple-example', 'version': '1.0'},
+    {'groupId': 'org.foobar', 'artifactId': 'hello', 'version': '1.2.3', 'classifier': 'one'},
+    {'groupId': 'org.foobar', 'artifactId': 'hello', 'version': '1.2.3', 'classifier': 'two'},
+  ]
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _make_repo(self, root, properties=''):
+    """Sets up the poms the generator reads symbols and settings from, and changes into the repo."""
+    os.chdir(root)
+    with open('pom.xml', 'w') as pom:
+      pom.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<project><groupId>com.example</groupId><artifactId>all</artifactId></project>\n')
+    os.makedirs('parents/base')
+    with open('parents/base/pom.xml', 'w') as pom:
+      pom.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>base</artifactId>
+            <properties>{properties}</properties>
+            <dependencyManagement>
+              <dependencies>
+                <dependency>
+                  <groupId>com.squareup</groupId>
+                  <artifactId>simple-example</artifactId>
+                  <version>1.0</version>
+                </dependency>
+              </dependencies>
+            </dependencyManagement>
+          </project>
+          ''').format(properties=properties))
+
+  def test_unsharded(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      generator = ThirdPartyBuildGenerator(self.DEPENDENCIES)
+      self.assertEquals({'3rdparty/BUILD.gen': generator.generate()}, generator.generate_files())
+
+  def test_shard_by_org(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      files = ThirdPartyBuildGenerator(self.DEPENDENCIES, shard_by='org').generate_files()
+      self.assertEquals(['3rdparty/BUILD.gen',
+                         '3rdparty/shards/com.squareup/BUILD.gen',
+                         '3rdparty/shards/org.foobar/BUILD.gen'], sorted(files))
+      self.assertEquals(set(_get_sanitized_blocks('''
+          managed_jar_dependencies(name='managed',
+            artifacts=[
+              '3rdparty/shards/com.squareup:com.squareup.simple-example',
+              '3rdparty/shards/org.foobar:org.foobar.hello',
+            ],
+          )
+
+          target(name='com.squareup.simple-example', dependencies=['3rdparty/shards/com.squareup:com.squareup.simple-example'])
+          target(name='org.foobar.hello', dependencies=['3rdparty/shards/org.foobar:org.foobar.hello'])
+          ''')), set(_get_sanitized_blocks(files['3rdparty/BUILD.gen'])))
+      self.assertEquals(set(_get_sanitized_blocks('''
+          jar_library(name='com.squareup.simple-example',
+            jars=[
+              sjar(org='com.squareup', name='simple-example', rev='1.0',),
+            ],
+            managed_dependencies='3rdparty:managed',
+          )
+          ''')), set(_get_sanitized_blocks(files['3rdparty/shards/com.squareup/BUILD.gen'])))
+
+  def test_shard_by_bucket_from_pom(self):
+    with temporary_dir() as root:
+      self._make_repo(root, properties='''
+          <squarepants.3rdparty.shard-by>bucket</squarepants.3rdparty.shard-by>
+          <squarepants.3rdparty.shard-buckets>1</squarepants.3rdparty.shard-buckets>
+          ''')
+      files = ThirdPartyBuildGenerator().generate_files()
+      self.assertEquals(['3rdparty/BUILD.gen', '3rdparty/shards/bucket-00/BUILD.gen'],
+                        sorted(files))
+
+  def test_bad_shard_type(self):
+    with self.assertRaises(ValueError):
+      ThirdPartyBuildGenerator(self.DEPENDENCIES, shard_by='name')
+
+  def test_version_change_only_rewrites_its_shard(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      files = ThirdPartyBuildGenerator(self.DEPENDENCIES, shard_by='org').generate_files()
+      self.assertEquals((sorted(files), [], []), write_build_files(files, root))
+
+      bumped = [dict(dep) for dep in self.DEPENDENCIES]
+      bumped[0]['version'] = '1.1'
+      files = ThirdPartyBuildGenerator(bumped, shard_by='org').generate_files()
+      self.assertEquals((['3rdparty/shards/com.squareup/BUILD.gen'],
+                         ['3rdparty/BUILD.gen', '3rdparty/shards/org.foobar/BUILD.gen'],
+                         []),
+                        write_build_files(files, root))
+
+      files = ThirdPartyBuildGenerator(bumped[:1], shard_by='org').generate_files()
+      self.assertEquals((['3rdparty/BUILD.gen'],
+                         ['3rdparty/shards/com.squareup/BUILD.gen'],
+                         ['3rdparty/shards/org.foobar/BUILD.gen']),
+                        write_build_files(files, root))
+      self.assertFalse(os.path.exists(os.path.join(root, '3rdparty/shards/org.foobar')))
+
+  def test_update_skipped_when_unchanged(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      update = update_build_files(ThirdPartyBuildGenerator(self.DEPENDENCIES), root)
+      self.assertFalse(update.skipped)
+      self.assertEquals(['com.squareup.simple-example', 'org.foobar.hello.one',
+                         'org.foobar.hello.two'], [name for name, _ in update.added])
+      self.assertEquals(['3rdparty/BUILD.gen'], update.written)
+
+      update = update_build_files(ThirdPartyBuildGenerator(self.DEPENDENCIES), root)
+      self.assertTrue(update.skipped)
+      self.assertEquals(['3rdparty managed dependencies are unchanged, skipping generation.'],
+                        format_update(update))
+
+      # Someone else changed the generated file, so it has to be regenerated.
+      with open('3rdparty/BUILD.gen', 'a') as f:
+        f.write('# edited\n')
+      update = update_build_files(ThirdPartyBuildGenerator(self.DEPENDENCIES), root)
+      self.assertFalse(update.skipped)
+      self.assertEquals(([], [], []), (update.added, update.removed, update.changed))
+      self.assertEquals(['3rdparty/BUILD.gen'], update.written)
+
+  def test_update_reports_changes(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      update_build_files(ThirdPartyBuildGenerator(self.DEPENDENCIES, shard_by='org'), root)
+      dependencies = [dict(dep) for dep in self.DEPENDENCIES[:2]]
+      dependencies[0]['version'] = '1.1'
+      dependencies[1]['exclusions'] = [{'groupId': 'log4j', 'artifactId': 'log4j'}]
+      dependencies.append({'groupId': 'org.new', 'artifactId': 'thing', 'version': '2.0'})
+      update = update_build_files(ThirdPartyBuildGenerator(dependencies, shard_by='org'), root)
+      self.assertEquals([
+        '3rdparty managed dependencies: 1 added, 1 removed, 2 changed.',
+        '  + org.new.thing 2.0',
+        '  - org.foobar.hello.two 1.2.3',
+        '  * com.squareup.simple-example 1.0 -> 1.1',
+        '  * org.foobar.hello.one exclusions none -> log4j:log4j',
+        '  4 BUILD files rewritten, 0 unchanged, 0 removed.',
+      ], format_update(update))
+
+  def test_fingerprint_covers_sharding(self):
+    generator = ThirdPartyBuildGenerator(self.DEPENDENCIES)
+    self.assertEquals(generator.fingerprint(),
+                      ThirdPartyBuildGenerator(self.DEPENDENCIES).fingerprint())
+    self.assertNotEqual(generator.fingerprint(),
+                        ThirdPartyBuildGenerator(self.DEPENDENCIES, shard_by='org').fingerprint())
+
+  def _make_m2(self, m2):
+    """A local Maven repository where simple-example depends on org.dep:dep:2.0."""
+    for group_id, artifact_id, version, dependencies in [
+        ('com.squareup', 'simple-example', '1.0',
+         '<dependency><groupId>org.dep</groupId><artifactId>dep</artifactId>'
+         '<version>2.0</version></dependency>'),
+        ('org.dep', 'dep', '2.0', '')]:
+      path = os.path.join(m2, group_id.replace('.', '/'), artifact_id, version,
+                          '{0}-{1}.pom'.format(artifact_id, version))
+      os.makedirs(os.path.dirname(path))
+      with open(path, 'w') as pom:
+        pom.write('<project><groupId>{0}</groupId><artifactId>{1}</artifactId>'
+                  '<version>{2}</version><dependencies>{3}</dependencies></project>'
+                  .format(group_id, artifact_id, version, dependencies))
+
+  def test_closure_outputs(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      m2 = os.path.join(root, 'm2')
+      self._make_m2(m2)
+      generator = ThirdPartyBuildGenerator(self.DEPENDENCIES[:1], closure='intransitive',
+                                           m2_repository=m2)
+      files = generator.generate_files()
+      self.assertEquals(['3rdparty/BUILD.gen', '3rdparty/pinned/BUILD.gen'], sorted(files))
+      self.assertEquals(set(_get_sanitized_blocks('''
+          jar_library(name='com.squareup.simple-example',
+            jars=[
+              sjar(org='com.squareup', name='simple-example', rev='1.0', intransitive=True,),
+              sjar(org='org.dep', name='dep', rev='2.0', intransitive=True,),
+            ],
+          )
+          ''')), set(_get_sanitized_blocks(files['3rdparty/pinned/BUILD.gen'])))
+      self.assertTrue(os.path.exists('.pants.d/pom-gen/m2-graph.json'))
+
+      write_build_files(files, root)
+      generator = ThirdPartyBuildGenerator(self.DEPENDENCIES[:1], closure='lockfile',
+                                           m2_repository=m2)
+      files = generator.generate_files()
+      self.assertEquals({'com.squareup:simple-example': ['org.dep:dep']},
+                        json.loads(files['3rdparty/3rdparty.lock.json'])['artifacts'])
+      self.assertEquals((['3rdparty/3rdparty.lock.json'], ['3rdparty/BUILD.gen'],
+                         ['3rdparty/pinned/BUILD.gen']),
+                        write_build_files(files, root))
@@ -5,7 +5,7 @@
 
 import unittest2 as unittest
 
-from squarepants.graph_util import Graph
+from squarepants.graph_util import Graph, ReachabilityIndex
 
 class GraphUtilTest(unittest.TestCase):
 
@@ -86,3 +86,151 @@ Edges:
 
     with self.assertRaises(Graph.CycleError):
       self._char_graph('ab', ('ab', 'ba')).topological_ordering()
+
+  def test_add_and_remove(self):
+    graph = self._char_graph('abc', ('ab', 'bc', 'ca', 'bb'))
+    graph.add_edge(Graph.Edge('a', 'b', weight=2.0))
+    self.assertEquals([2.0], [edge.weight for edge in graph.outgoing('a')])
+    self.assertEquals(set(), graph.outgoing_vertices('z'))
+    self.assertEquals(set(), graph.incoming('z'))
+
+    graph.remove_vertex('b')
+    self.assertEquals(set('ac'), graph.vertices)
+    self.assertEquals({Graph.Edge('c', 'a')}, graph.edges)
+    self.assertEquals(set(), graph.outgoing_vertices('a'))
+    self.assertEquals(set(), graph.incoming_vertices('c'))
+
+    graph.add_edge(Graph.Edge('b', 'c'))
+    self.assertEquals({Graph.Edge('b', 'c'), Graph.Edge('c', 'a')}, graph.edges)
+    graph.remove_edge(Graph.Edge('c', 'a'))
+    graph.remove_edge(Graph.Edge('c', 'z'))
+    self.assertEquals({Graph.Edge('b', 'c')}, graph.edges)
+
+  def test_copied_and_transposed(self):
+    graph = self._char_graph('abc', ('ab', 'bc'))
+    transposed = graph.transposed
+    copied = graph.copied
+    graph.add_edge(Graph.Edge('c', 'a'))
+    self.assertEquals({Graph.Edge('b', 'a'), Graph.Edge('c', 'b')}, transposed.edges)
+    self.assertEquals(set('b'), transposed.incoming_vertices('a'))
+    self.assertEquals({Graph.Edge('a', 'b'), Graph.Edge('b', 'c')}, copied.edges)
+    self.assertEquals(set('abc'), copied.vertices)
+
+  def test_topological_ordering_long_chain(self):
+    vertices = range(50000)
+    graph = Graph(vertices=vertices,
+                  edges=[Graph.Edge(i, i + 1) for i in vertices[:-1]])
+    self.assertEquals(vertices, graph.topological_ordering())
+    self.assertEquals(vertices, graph.topological_ordering(stable=True))
+    graph.add_edge(Graph.Edge(49999, 0))
+    with self.assertRaises(Graph.CycleError) as cm:
+      graph.topological_ordering()
+    self.assertEquals([vertices + [0]], cm.exception.cycles)
+
+  def test_strongly_connected_components(self):
+    graph = self._char_graph('abcdefg', ('ab', 'bc', 'ca', 'cd', 'de', 'ed', 'ef', 'gg'))
+    components = graph.strongly_connected_components()
+    self.assertEquals({frozenset('abc'), frozenset('de'), frozenset('f'), frozenset('g')},
+                      set(map(frozenset, components)))
+    position = {vertex: index for index, component in enumerate(components)
+                for vertex in component}
+    self.assertLess(position['a'], position['d'])
+    self.assertLess(position['d'], position['f'])
+
+    components, dag = graph.condensation()
+    named_edges = {(frozenset(components[edge.src]), frozenset(components[edge.dst]))
+                   for edge in dag.edges}
+    self.assertEquals({(frozenset('abc'), frozenset('de')), (frozenset('de'), frozenset('f'))},
+                      named_edges)
+    self.assertTrue(all(edge.src < edge.dst for edge in dag.edges))
+
+    self.assertEquals([list('abca'), list('ded'), list('gg')],
+                      sorted(graph.find_cycles()))
+    with self.assertRaises(Graph.CycleError) as cm:
+      graph.topological_ordering()
+    self.assertIn('a -> b -> c -> a', str(cm.exception))
+
+  def test_topological_ordering_includes_edge_endpoints(self):
+    graph = Graph(vertices='b', edges=[Graph.Edge('a', 'b'), Graph.Edge('b', 'c')])
+    self.assertEquals(tuple('abc'), tuple(graph.topological_ordering()))
+    self.assertEquals([['a'], ['b'], ['c']], graph.strongly_connected_components())
+
+  def test_transitive_reduction(self):
+    graph = self._char_graph('abcde', ('ab', 'bc', 'ac', 'cd', 'ad', 'be', 'ae'))
+    graph.add_edge(Graph.Edge('c', 'd', weight=2.0))
+    reduced = graph.transitive_reduction()
+    self.assertEquals({Graph.Edge('a', 'b'), Graph.Edge('b', 'c'), Graph.Edge('c', 'd'),
+                       Graph.Edge('b', 'e')}, reduced.edges)
+    self.assertEquals([2.0], [edge.weight for edge in reduced.outgoing('c')])
+    self.assertEquals(set('abcde'), reduced.vertices)
+    # The original is untouched.
+    self.assertEquals(7, len(graph.edges))
+
+  def test_transitive_reduction_with_cycles(self):
+    # a -> b and a -> c both lead into the b <-> c cycle, so both are kept; a -> d isn't needed
+    # since d can be reached through the cycle.
+    graph = self._char_graph('abcd', ('ab', 'bc', 'cb', 'ac', 'cd', 'ad', 'dd'))
+    self.assertEquals({Graph.Edge('a', 'b'), Graph.Edge('b', 'c'), Graph.Edge('c', 'b'),
+                       Graph.Edge('a', 'c'), Graph.Edge('c', 'd'), Graph.Edge('d', 'd')},
+                      graph.transitive_reduction().edges)
+
+  def test_reachability_index(self):
+    graph = self._char_graph('abcdefg', ('ab', 'bc', 'cb', 'cd', 'ed', 'ff'))
+    index = ReachabilityIndex(graph)
+    self.assertEquals(set('bcd'), index.closure('a'))
+    self.assertEquals(set('bcd'), index.closure('b'))
+    self.assertEquals(set(), index.closure('d'))
+    self.assertEquals(set('f'), index.closure('f'))
+    self.assertEquals(set(), index.closure('g'))
+    self.assertEquals(set(), index.closure('z'))
+    self.assertEquals(set('abce'), index.reverse_closure('d'))
+    self.assertEquals(set('abc'), index.reverse_closure('b'))
+    self.assertEquals(set(), index.reverse_closure('a'))
+    self.assertTrue(index.reaches('a', 'd'))
+    self.assertTrue(index.reaches('c', 'b'))
+    self.assertTrue(index.reaches('b', 'b'))
+    self.assertFalse(index.reaches('a', 'a'))
+    self.assertFalse(index.reaches('d', 'a'))
+    self.assertFalse(index.reaches('a', 'e'))
+    self.assertFalse(index.reaches('a', 'z'))
+
+  def test_reachability_index_matches_search(self):
+    vertices = range(300)
+    graph = Graph(vertices=vertices, edges=[Graph.Edge(i, (i * 7 + j) % 300)
+                                            for i in vertices for j in (1, 13) if i % 5])
+    index = ReachabilityIndex(graph)
+    for vertex in vertices:
+      reachable = set()
+      for neighbor in graph.outgoing_vertices(vertex):
+        reachable.update(graph.search_set(neighbor))
+      self.assertEquals(reachable, index.closure(vertex))
+
+  def test_traverse(self):
+    graph = self._char_graph('abcde', ('ab', 'ac', 'bd', 'cd', 'de'))
+    adjacent = lambda vertex: sorted(graph.outgoing_vertices(vertex))
+    search = graph.traverse('a', adjacent=adjacent)
+    self.assertEquals(list('abcde'), list(search))
+    self.assertEquals(tuple('abd'), search.path('e'))
+    self.assertEquals((), search.path('a'))
+    self.assertEquals(3, search.distance('e'))
+
+    self.assertEquals(list('acdeb'), list(graph.traverse('a', adjacent=adjacent, order=Graph.DFS)))
+
+    graph.add_edge(Graph.Edge('a', 'b', weight=5.0))
+    search = graph.traverse('a', order=Graph.UNIFORM_COST)
+    self.assertEquals(list('acdeb'), list(search))
+    self.assertEquals(tuple('acd'), search.path('e'))
+    self.assertEquals(3, search.distance('e'))
+    self.assertEquals(5.0, search.distance('b'))
+
+    with self.assertRaises(ValueError):
+      graph.traverse('a', order='sideways')
+
+  def test_search_cycles(self):
+    graph = self._char_graph('abcd', ('ab', 'bc', 'ca', 'cd', 'dd'))
+    cycles = []
+    found = list(graph.search('a', cycle_handler=lambda path, vertex: cycles.append(path + (vertex,))))
+    self.assertEquals([((), 'a'), (('a',), 'b'), (('a', 'b'), 'c'), (('a', 'b', 'c'), 'd')], found)
+    self.assertEquals([tuple('abca'), tuple('abcdd')], cycles)
+    self.assertEquals(found, list(graph.search('a', next_index=lambda frontier: 0)))
+    self.assertEquals(set('abcd'), graph.search_set('b', order=Graph.DFS))
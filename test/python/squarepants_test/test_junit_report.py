@@ -4,6 +4,8 @@
 # ./pants test squarepants/src/test/python/squarepants_test:junit_report
 from __future__ import unicode_literals
 
+import gzip
+import io
 import json
 import os
 import tempfile
@@ -156,6 +158,41 @@ class TestJUnitReportParse(unittest.TestCase):
     self.assertEquals(len(lst), 1)
     self.assertEquals(lst[0].state, junit_report.State.FAILURE)
 
+  def test_classify_by_tag(self):
+    suite = """
+    <testsuite errors="1" failures="0" name="com.squareup.Test" tests="3" time="1.0">
+    <testcase classname="com.squareup.Test" name="skipped" time="0"><skipped/></testcase>
+    <testcase classname="com.squareup.Test" name="noisy" time="0.5">
+      <system-out>Lots of logging</system-out>
+      <system-err>and more</system-err>
+    </testcase>
+    <testcase classname="com.squareup.Test" name="error" time="0.5"><error type="java.lang.Error"/></testcase>
+    </testsuite>
+    """
+    lst = list(junit_report.parse_string(suite))
+    self.assertEquals([(case.full_name, case.state) for case in lst],
+                      [('com.squareup.Test.skipped', junit_report.State.SUCCESS),
+                       ('com.squareup.Test.noisy', junit_report.State.SUCCESS),
+                       ('com.squareup.Test.error', junit_report.State.FAILURE)])
+
+  def test_get_test_cases_in_report_order(self):
+    tmpdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tmpdir)
+    for i in range(5):
+      with open(os.path.join(tmpdir, 'TEST-{}.xml'.format(i)), 'w') as fp:
+        fp.write(GOOD_XML.strip().replace('PantsTestAppTest', 'Test{}'.format(i)))
+    for jobs in (1, 3):
+      self.assertEquals(['com.squareup.pants.Test{}.test'.format(i) for i in range(5)],
+                        [case.full_name for case in junit_report.get_test_cases(tmpdir, jobs=jobs)])
+
+  def test_get_test_cases_malformed(self):
+    tmpdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tmpdir)
+    with open(os.path.join(tmpdir, 'TEST-broken.xml'), 'w') as fp:
+      fp.write('<testsuite')
+    with self.assertRaises(ValueError):
+      list(junit_report.get_test_cases(tmpdir, jobs=1))
+
 
 class TestRFC7464Record(unittest.TestCase):
 
@@ -163,9 +200,17 @@ class TestRFC7464Record(unittest.TestCase):
     def decode(s):
         return json.loads(s[1:-1].decode('utf-8'))
 
+    @staticmethod
+    def encode(case):
+        fp = io.BytesIO()
+        writer = junit_report.RecordWriter(fp, 'json-seq')
+        writer.write(junit_report.record_from_case(case))
+        writer.close()
+        return fp.getvalue()
+
     def test_success(self):
         case = junit_report.TestCase(full_name='foo.bar', time=1.3, state=junit_report.State.SUCCESS)
-        res = junit_report.rfc7464_record_from_case(case)
+        res = self.encode(case)
         self.assertEquals(res[0], b'\x1e')
         self.assertEquals(res[-1], b'\n')
         dct = self.decode(res)
@@ -175,7 +220,7 @@ class TestRFC7464Record(unittest.TestCase):
 
     def test_success_with_unicode(self):
         case = junit_report.TestCase(full_name='foo\u2603bar', time=1.3, state=junit_report.State.SUCCESS)
-        res = junit_report.rfc7464_record_from_case(case)
+        res = self.encode(case)
         self.assertEquals(res[0], b'\x1e')
         self.assertEquals(res[-1], b'\n')
         dct = self.decode(res)
@@ -185,7 +230,7 @@ class TestRFC7464Record(unittest.TestCase):
 
     def test_failure(self):
         case = junit_report.TestCase(full_name='foo\u2603bar', time=1.3, state=junit_report.State.FAILURE)
-        res = junit_report.rfc7464_record_from_case(case)
+        res = self.encode(case)
         self.assertEquals(res[0], b'\x1e')
         self.assertEquals(res[-1], b'\n')
         dct = self.decode(res)
@@ -194,6 +239,45 @@ class TestRFC7464Record(unittest.TestCase):
         self.assertEquals(dct.pop('full-name'), 'foo\u2603bar', 'Go away, Anna!')
 
 
+class TestRecordWriter(unittest.TestCase):
+
+    def write(self, output_format, records):
+        fp = io.BytesIO()
+        writer = junit_report.RecordWriter(fp, output_format)
+        for record in records:
+            writer.write(record)
+        writer.close()
+        return fp.getvalue()
+
+    def test_json(self):
+        records = [{'n': i} for i in range(2500)]
+        self.assertEquals(self.write('json', records), json.dumps(records).encode('utf-8'))
+        self.assertEquals(json.loads(self.write('json', [])), [])
+
+    def test_jsonl(self):
+        res = self.write('jsonl', [{'n': 1}, {'n': '\u2603'}])
+        self.assertEquals([json.loads(line.decode('utf-8')) for line in res.splitlines()],
+                          [{'n': 1}, {'n': '\u2603'}])
+
+    def test_json_seq(self):
+        res = self.write('json-seq', [{'n': 1}, {'n': 2}])
+        self.assertEquals(res, b'\x1e{"n": 1}\n\x1e{"n": 2}\n')
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            junit_report.RecordWriter(io.BytesIO(), 'xml')
+
+    def test_gzip(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        fname = os.path.join(tmpdir, 'output.json.gz')
+        with junit_report.open_output(fname, compress=True) as fp:
+            writer = junit_report.RecordWriter(fp, 'json')
+            writer.write({'n': 1})
+            writer.close()
+        with gzip.open(fname, 'rb') as fp:
+            self.assertEquals(json.loads(fp.read().decode('utf-8')), [{'n': 1}])
+
 class TestFindTrueFailures(unittest.TestCase):
 
     exc = ValueError('hello there')
@@ -264,6 +348,14 @@ class TestUtility(unittest.TestCase):
         with self.assertRaises(StopIteration):
            next(it)
 
+    def test_load_flakes(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open(os.path.join(tmpdir, 'com.example.FooTest.bar'), 'w') as fp:
+            fp.write('Flakes due to timing issues.')
+        self.assertEquals(junit_report.load_flakes(tmpdir), frozenset(['com.example.FooTest.bar']))
+        self.assertEquals(junit_report.load_flakes(os.path.join(tmpdir, 'missing')), frozenset())
+
 GOOD_XML="""
 <?xml version="1.0" encoding="UTF-8" standalone="yes"?>
 <testsuite errors="0" failures="0" hostname="moshez-mac15.local" name="com.squareup.pants.PantsTestAppTest" tests="1" time="0.008724" timestamp="2015-10-16T21:52:32">
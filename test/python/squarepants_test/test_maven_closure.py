@@ -0,0 +1,166 @@
+# Tests for code in squarepants/src/main/python/squarepants/maven_closure.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:maven_closure
+
+import json
+import os
+from textwrap import dedent
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.maven_closure import Closure, DependencyGraph, LocalMavenRepository
+
+
+POM_TEMPLATE = dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    <project xmlns="http://maven.apache.org/POM/4.0.0">
+      {parent}
+      <groupId>{group_id}</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      <version>{version}</version>
+      {extra}
+    </project>
+    ''')
+
+
+def write_pom(m2, group_id, artifact_id, version, parent=None, extra=''):
+  """Writes a POM into a directory laid out like ~/.m2/repository."""
+  parent_xml = ''
+  if parent:
+    parent_xml = ('<parent><groupId>{0}</groupId><artifactId>{1}</artifactId>'
+                  '<version>{2}</version></parent>'.format(*parent))
+  path = LocalMavenRepository(m2).pom_path(group_id, artifact_id, version)
+  os.makedirs(os.path.dirname(path))
+  with open(path, 'w') as f:
+    f.write(POM_TEMPLATE.format(parent=parent_xml, group_id=group_id, artifact_id=artifact_id,
+                                version=version, extra=extra))
+
+
+def dependency(group_id, artifact_id, version=None, extra=''):
+  version_xml = '<version>{0}</version>'.format(version) if version else ''
+  return ('<dependency><groupId>{0}</groupId><artifactId>{1}</artifactId>{2}{3}</dependency>'
+          .format(group_id, artifact_id, version_xml, extra))
+
+
+def make_fixture_repository(m2):
+  """Lays out a small repository:
+
+    com.example:app:1.0 (parent com.example:parent:1, which imports com.example:bom:1)
+      -> lib-a ${a.version}=2.0, excluding lib-x
+           -> lib-c 1.0
+           -> lib-x 1.0
+      -> lib-b, version managed by the BOM = 1.0
+           -> lib-c 2.0
+           -> com.example:missing:1.0, which has no POM
+      -> junit (test scope) and lib-optional (optional), which aren't followed
+  """
+  write_pom(m2, 'com.example', 'bom', '1', extra='''
+      <packaging>pom</packaging>
+      <dependencyManagement><dependencies>{0}</dependencies></dependencyManagement>
+      '''.format(dependency('com.example', 'lib-b', '1.0')))
+  write_pom(m2, 'com.example', 'parent', '1', extra='''
+      <packaging>pom</packaging>
+      <properties><a.version>2.0</a.version></properties>
+      <dependencyManagement><dependencies>{0}{1}</dependencies></dependencyManagement>
+      '''.format(dependency('com.example', 'lib-a', '${a.version}'),
+                 dependency('com.example', 'bom', '1', '<type>pom</type><scope>import</scope>')))
+  write_pom(m2, 'com.example', 'app', '1.0', parent=('com.example', 'parent', '1'), extra='''
+      <dependencies>{0}{1}{2}{3}</dependencies>
+      '''.format(dependency('com.example', 'lib-a', extra='''
+                   <exclusions><exclusion>
+                     <groupId>com.example</groupId><artifactId>lib-x</artifactId>
+                   </exclusion></exclusions>'''),
+                 dependency('com.example', 'lib-b'),
+                 dependency('junit', 'junit', '4.12', '<scope>test</scope>'),
+                 dependency('com.example', 'lib-optional', '1.0', '<optional>true</optional>')))
+  write_pom(m2, 'com.example', 'lib-a', '2.0', extra='<dependencies>{0}{1}</dependencies>'.format(
+    dependency('com.example', 'lib-c', '1.0'), dependency('com.example', 'lib-x', '1.0')))
+  write_pom(m2, 'com.example', 'lib-b', '1.0', extra='<dependencies>{0}{1}</dependencies>'.format(
+    dependency('com.example', 'lib-c', '2.0'), dependency('com.example', 'missing', '1.0')))
+  for version in ('1.0', '2.0', '3.0'):
+    write_pom(m2, 'com.example', 'lib-c', version)
+  write_pom(m2, 'com.example', 'lib-x', '1.0')
+
+
+class MavenClosureTest(unittest.TestCase):
+
+  APP = {'groupId': 'com.example', 'artifactId': 'app', 'version': '1.0'}
+
+  def test_effective_pom(self):
+    with temporary_dir() as m2:
+      make_fixture_repository(m2)
+      graph = DependencyGraph(LocalMavenRepository(m2))
+      dependencies = graph.dependencies('com.example', 'app', '1.0')
+      self.assertEquals([('lib-a', '2.0'), ('lib-b', '1.0')],
+                        [(dep['artifactId'], dep['version']) for dep in dependencies])
+      self.assertEquals([{'groupId': 'com.example', 'artifactId': 'lib-x'}],
+                        dependencies[0]['exclusions'])
+      self.assertIsNone(graph.dependencies('com.example', 'missing', '1.0'))
+
+  def test_closure(self):
+    with temporary_dir() as m2:
+      make_fixture_repository(m2)
+      closure = Closure.resolve([self.APP], DependencyGraph(LocalMavenRepository(m2)))
+      self.assertEquals({
+        'com.example:app': '1.0',
+        'com.example:lib-a': '2.0',
+        'com.example:lib-b': '1.0',
+        # Nearest wins, and lib-a's declaration is seen before lib-b's at the same depth.
+        'com.example:lib-c': '1.0',
+        'com.example:missing': '1.0',
+      }, closure.versions)
+      self.assertEquals({'com.example:app': ['com.example:lib-a', 'com.example:lib-b',
+                                             'com.example:lib-c', 'com.example:missing']},
+                        closure.dependencies)
+      self.assertEquals(['com.example:missing:1.0'], closure.missing)
+
+  def test_roots_win_mediation(self):
+    with temporary_dir() as m2:
+      make_fixture_repository(m2)
+      lib_c = {'groupId': 'com.example', 'artifactId': 'lib-c', 'version': '3.0'}
+      lib_a = {'groupId': 'com.example', 'artifactId': 'lib-a', 'version': '2.0'}
+      closure = Closure.resolve([self.APP, lib_c, lib_a], DependencyGraph(LocalMavenRepository(m2)))
+      self.assertEquals('3.0', closure.versions['com.example:lib-c'])
+      # lib-x is only excluded on the path through app.
+      self.assertEquals('1.0', closure.versions['com.example:lib-x'])
+      self.assertEquals(['com.example:lib-c', 'com.example:lib-x'],
+                        closure.dependencies['com.example:lib-a'])
+      self.assertNotIn('com.example:lib-x', closure.dependencies['com.example:app'])
+      lockfile = json.loads(closure.to_lockfile())
+      self.assertEquals(closure.versions, lockfile['resolved'])
+      self.assertEquals(closure.dependencies, lockfile['artifacts'])
+
+  def test_exclusions_only_apply_to_their_root(self):
+    with temporary_dir() as m2:
+      write_pom(m2, 'o', 'a', '1', extra='<dependencies>{0}</dependencies>'.format(
+        dependency('o', 'x', '1')))
+      write_pom(m2, 'o', 'x', '1')
+      # r1 -> a, excluding x; r2 -> a; a -> x.
+      r1 = {'groupId': 'o', 'artifactId': 'r1', 'version': '1'}
+      r2 = {'groupId': 'o', 'artifactId': 'r2', 'version': '1'}
+      write_pom(m2, 'o', 'r1', '1', extra='<dependencies>{0}</dependencies>'.format(
+        dependency('o', 'a', '1', extra='''
+                   <exclusions><exclusion>
+                     <groupId>o</groupId><artifactId>x</artifactId>
+                   </exclusion></exclusions>''')))
+      write_pom(m2, 'o', 'r2', '1', extra='<dependencies>{0}</dependencies>'.format(
+        dependency('o', 'a', '1')))
+      for roots in ([r1, r2], [r2, r1]):
+        closure = Closure.resolve(roots, DependencyGraph(LocalMavenRepository(m2)))
+        self.assertEquals({'o:r1': ['o:a'], 'o:r2': ['o:a', 'o:x']}, closure.dependencies)
+        self.assertEquals('1', closure.versions['o:x'])
+
+  def test_graph_cached_on_disk(self):
+    with temporary_dir() as m2:
+      make_fixture_repository(m2)
+      cache_file = os.path.join(m2, 'cache', 'm2-graph.json')
+      expected = Closure.resolve([self.APP], DependencyGraph(LocalMavenRepository(m2), cache_file))
+      self.assertTrue(os.path.exists(cache_file))
+
+      class UnreadableRepository(LocalMavenRepository):
+        def effective_pom(self, *args, **kwargs):
+          raise AssertionError('POMs should have been read from the cache.')
+
+      closure = Closure.resolve([self.APP], DependencyGraph(UnreadableRepository(m2), cache_file))
+      self.assertEquals(expected.versions, closure.versions)
+      self.assertEquals(expected.dependencies, closure.dependencies)
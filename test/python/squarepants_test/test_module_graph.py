@@ -0,0 +1,157 @@
+# Tests for code in squarepants/src/main/python/squarepants/module_graph.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:module_graph
+
+import os
+from textwrap import dedent
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.module_graph import ModuleGraph
+from squarepants.pom_utils import PomUtils
+
+
+POM_TEMPLATE = dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    <project>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      {parent}
+      <dependencies>
+        {dependencies}
+      </dependencies>
+    </project>
+    ''')
+
+PARENT_TEMPLATE = dedent('''
+    <parent>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      <relativePath>{path}</relativePath>
+    </parent>
+    ''')
+
+DEPENDENCY_TEMPLATE = dedent('''
+    <dependency>
+      <groupId>{group_id}</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      {extra}
+    </dependency>
+    ''')
+
+
+class ModuleGraphTest(unittest.TestCase):
+
+  def setUp(self):
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    PomUtils.reset_caches()
+
+  def _write_pom(self, root, directory, artifact_id, parent=None, dependencies=()):
+    parent_xml = ''
+    if parent:
+      parent_xml = PARENT_TEMPLATE.format(artifact_id=os.path.basename(parent),
+                                          path=os.path.relpath(os.path.join(parent, 'pom.xml'),
+                                                               directory))
+    dependencies_xml = ''.join(DEPENDENCY_TEMPLATE.format(group_id=group_id,
+                                                          artifact_id=artifact_id,
+                                                          extra=extra)
+                               for group_id, artifact_id, extra in dependencies)
+    path = os.path.join(root, directory, 'pom.xml')
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(POM_TEMPLATE.format(artifact_id=artifact_id, parent=parent_xml,
+                                  dependencies=dependencies_xml))
+
+  def _make_repo(self, root):
+    with open(os.path.join(root, 'pom.xml'), 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>all</artifactId>
+            <modules>
+              <module>a</module>
+              <module>b</module>
+              <module>c/nested</module>
+              <module>d</module>
+            </modules>
+          </project>
+          '''))
+    self._write_pom(root, 'parents/base', 'base')
+    self._write_pom(root, 'parents/child', 'child', parent='parents/base')
+    self._write_pom(root, 'a', 'a', parent='parents/base',
+                    dependencies=[('com.google.guava', 'guava', '<version>18.0</version>')])
+    self._write_pom(root, 'b', 'b', parent='parents/base',
+                    dependencies=[('com.example', 'a', '<type>test-jar</type>')])
+    self._write_pom(root, 'c/nested', 'c', parent='parents/child',
+                    dependencies=[('com.example', 'b', '')])
+    self._write_pom(root, 'd', 'd', parent='parents/base')
+
+  def test_from_poms(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      graph = ModuleGraph.from_poms(rootdir=root)
+      self.assertEquals(set(['a', 'b', 'c/nested', 'd']), graph.modules)
+      self.assertEquals({'a': 'parents/base',
+                         'b': 'parents/base',
+                         'c/nested': 'parents/child',
+                         'd': 'parents/base',
+                         'parents/child': 'parents/base'}, graph.parents)
+      self.assertEquals({'a': set(), 'b': set(['a']), 'c/nested': set(['b']), 'd': set()},
+                        graph.dependencies)
+
+  def test_owner(self):
+    graph = ModuleGraph(['a', 'a/inner', 'b'], parents={'a': 'parents/base'})
+    self.assertEquals('a', graph.owner('a/pom.xml'))
+    self.assertEquals('a', graph.owner('a/src/main/java/BUILD'))
+    self.assertEquals('a/inner', graph.owner('a/inner/src/main/java'))
+    self.assertEquals('parents/base', graph.owner('parents/base/pom.xml'))
+    self.assertIsNone(graph.owner('pom.xml'))
+    self.assertIsNone(graph.owner('3rdparty/BUILD'))
+    self.assertIsNone(graph.owner('ab/pom.xml'))
+
+  def test_affected(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      graph = ModuleGraph.from_poms(rootdir=root)
+      self.assertEquals({'a': 'changed a/pom.xml', 'b': 'depends on a'},
+                        graph.affected({'a': 'changed a/pom.xml'}))
+      # Dependents are only followed one level: c/nested only references b's targets.
+      self.assertEquals({'b': 'changed b/pom.xml', 'c/nested': 'depends on b'},
+                        graph.affected({'b': 'changed b/pom.xml'}))
+      self.assertEquals({'c/nested': 'inherits from parents/child'},
+                        graph.affected({'parents/child': 'changed parents/child/pom.xml'}))
+      affected = graph.affected({'parents/base': 'changed parents/base/pom.xml'})
+      self.assertEquals(set(['a', 'b', 'c/nested', 'd']), set(affected))
+      self.assertEquals('inherits from parents/base', affected['c/nested'])
+
+  def test_affected_transitive(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      graph = ModuleGraph.from_poms(rootdir=root)
+      self.assertEquals({'a': 'changed a/pom.xml', 'b': 'depends on a', 'c/nested': 'depends on b'},
+                        graph.affected({'a': 'changed a/pom.xml'}, transitive=True))
+      affected = graph.affected({'parents/child': 'changed parents/child/pom.xml'}, transitive=True)
+      self.assertEquals({'c/nested': 'inherits from parents/child'}, affected)
+
+  def test_affected_follows_previous_graph(self):
+    previous = ModuleGraph(['a', 'b', 'old'], dependencies={'b': ['old']})
+    current = ModuleGraph(['a', 'b'])
+    self.assertEquals({'old': 'removed old/pom.xml', 'b': 'depends on old'},
+                      current.affected({'old': 'removed old/pom.xml'}, previous))
+
+  def test_save_and_load(self):
+    with temporary_dir() as tmpdir:
+      graph = ModuleGraph(['a', 'b'], parents={'a': 'parents/base'}, dependencies={'b': ['a']})
+      path = os.path.join(tmpdir, 'index', 'modules.graph')
+      graph.save(path)
+      loaded = ModuleGraph.load(path)
+      self.assertEquals(graph.modules, loaded.modules)
+      self.assertEquals(graph.parents, loaded.parents)
+      self.assertEquals(graph.dependencies, loaded.dependencies)
+      with open(path, 'w') as f:
+        f.write('garbage')
+      with self.assertRaises(ModuleGraph.FormatError):
+        ModuleGraph.load(path)
@@ -3,6 +3,7 @@
 # Run with:
 # ./pants test squarepants/src/test/python/squarepants_test:pom_handlers
 
+import json
 import os
 import StringIO
 from textwrap import dedent
@@ -23,10 +24,9 @@ class TestPomProperties(unittest.TestCase):
     self.assertEquals('foo_bar', pp.safe_property_name('foo-bar'))
     self.assertEquals('foo_bar', pp.safe_property_name('foo$bar'))
 
-  def test_pom_properties(self):
-    with temporary_dir() as tmpdir:
-      with open(os.path.join(tmpdir, 'pom.xml') , 'w') as pomfile:
-        pomfile.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+  def _make_poms(self, tmpdir):
+    with open(os.path.join(tmpdir, 'pom.xml') , 'w') as pomfile:
+      pomfile.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
   <project xmlns="http://maven.apache.org/POM/4.0.0"
   xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
   xsi:schemaLocation="http://maven.apache.org/POM/4.0.0
@@ -42,11 +42,11 @@ class TestPomProperties(unittest.TestCase):
     </properties>
   </project>
 '''))
-      child_path_name = os.path.join(tmpdir, 'child')
-      os.mkdir(child_path_name)
-      child_pom_name = os.path.join(child_path_name, 'pom.xml')
-      with open(child_pom_name, 'w') as child_pomfile:
-        child_pomfile.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    child_path_name = os.path.join(tmpdir, 'child')
+    os.mkdir(child_path_name)
+    child_pom_name = os.path.join(child_path_name, 'pom.xml')
+    with open(child_pom_name, 'w') as child_pomfile:
+      child_pomfile.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
 <project xmlns="http://maven.apache.org/POM/4.0.0"
 xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
 xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd">
@@ -71,6 +71,10 @@ xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xs
 
 </project>
 '''))
+
+  def test_pom_properties(self):
+    with temporary_dir() as tmpdir:
+      self._make_poms(tmpdir)
       buffer = StringIO.StringIO()
 
       PomProperties().write_properties('child/pom.xml', buffer, rootdir=tmpdir)
@@ -84,3 +88,60 @@ xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xs
       self.assertIn('base_overridden="CHILD"', properties)
       self.assertIn('project_artifactId="child"', properties)
       self.assertIn('project_groupId="com.example"', properties)
+
+  def test_formats(self):
+    pp = PomProperties()
+    properties = [('a_b', 'x y'), ('project_groupId', 'com.example')]
+    self.assertEquals('a_b="x y"\nproject_groupId="com.example"\n', pp.format_properties(properties))
+    self.assertEquals('a_b\0x y\0project_groupId\0com.example\0',
+                      pp.format_properties(properties, 'null'))
+    self.assertEquals('child\0a_b\0x y\0child\0project_groupId\0com.example\0',
+                      pp.format_properties(properties, 'null', module='child'))
+    self.assertEquals({'module': 'child', 'properties': {'a_b': 'x y',
+                                                         'project_groupId': 'com.example'}},
+                      json.loads(pp.format_properties(properties, 'jsonl', module='child')))
+    with self.assertRaises(ValueError):
+      pp.format_properties(properties, 'xml')
+
+  def test_write_all(self):
+    with temporary_dir() as tmpdir:
+      self._make_poms(tmpdir)
+      os.mkdir(os.path.join(tmpdir, 'other'))
+      with open(os.path.join(tmpdir, 'other', 'pom.xml'), 'w') as pomfile:
+        pomfile.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+            <project>
+              <groupId>com.example</groupId>
+              <artifactId>other</artifactId>
+              <parent>
+                <groupId>com.example</groupId>
+                <artifactId>base</artifactId>
+                <relativePath>../pom.xml</relativePath>
+              </parent>
+            </project>
+            '''))
+      buffer = StringIO.StringIO()
+      PomProperties().write_all(['child', 'other'], output_stream=buffer, rootdir=tmpdir,
+                                output_format='jsonl')
+      records = [json.loads(line) for line in buffer.getvalue().splitlines()]
+      self.assertEquals(['child', 'other'], [record['module'] for record in records])
+      self.assertEquals('CHILD', records[0]['properties']['base_overridden'])
+      self.assertEquals('BASE', records[1]['properties']['base_overridden'])
+      self.assertEquals('other', records[1]['properties']['project_artifactId'])
+
+      output_dir = os.path.join(tmpdir, 'out')
+      PomProperties().write_all(['child', 'other'], output_dir=output_dir, rootdir=tmpdir)
+      with open(os.path.join(output_dir, 'other', 'pom_properties.sh')) as f:
+        self.assertIn('project_artifactId="other"\n', f.read())
+
+  def test_write_all_absolute_module(self):
+    with temporary_dir() as tmpdir:
+      self._make_poms(tmpdir)
+      output_dir = os.path.join(tmpdir, 'out')
+      PomProperties().write_all([os.path.join(tmpdir, 'child')], output_dir=output_dir,
+                                rootdir=tmpdir)
+      self.assertTrue(os.path.exists(os.path.join(output_dir, 'child', 'pom_properties.sh')))
+      self.assertFalse(os.path.exists(os.path.join(tmpdir, 'child', 'pom_properties.sh')))
+      # A module outside of the root would escape the output directory.
+      with self.assertRaises(ValueError):
+        PomProperties().write_all(['../child'], output_dir=output_dir,
+                                  rootdir=os.path.join(tmpdir, 'out'))
@@ -0,0 +1,139 @@
+# Tests for code in squarepants/src/main/python/squarepants/repo_model.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:repo_model
+
+import json
+import os
+from textwrap import dedent
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.generation_context import GenerationContext
+from squarepants.pom_file import PomFile
+from squarepants.pom_utils import PomUtils
+from squarepants.repo_model import RepoModel, RepoModelWriter, generated_targets
+
+
+POM_TEMPLATE = dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    <project>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      <parent>
+        <groupId>com.example</groupId>
+        <artifactId>base</artifactId>
+        <version>1.0</version>
+        <relativePath>../parents/base/pom.xml</relativePath>
+      </parent>
+      <properties>
+        <module.prop>${{base.prop}}-{artifact_id}</module.prop>
+      </properties>
+      <dependencies>
+        {dependencies}
+      </dependencies>
+    </project>
+    ''')
+
+
+class RepoModelTest(unittest.TestCase):
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _make_repo(self, root):
+    os.chdir(root)
+    with open('pom.xml', 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>all</artifactId>
+            <modules>
+              <module>a</module>
+              <module>b</module>
+            </modules>
+          </project>
+          '''))
+    os.makedirs('parents/base')
+    with open('parents/base/pom.xml', 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>base</artifactId>
+            <properties>
+              <base.prop>BASE</base.prop>
+            </properties>
+          </project>
+          '''))
+    for module, dependencies in (('a', ''), ('b', '''
+        <dependency><groupId>com.example</groupId><artifactId>a</artifactId></dependency>
+        <dependency>
+          <groupId>junit</groupId><artifactId>junit</artifactId><version>4.12</version>
+          <scope>test</scope>
+        </dependency>
+        ''')):
+      os.makedirs(os.path.join(module, 'src', 'main', 'java'))
+      with open(os.path.join(module, 'src', 'main', 'java', 'Main.java'), 'w') as f:
+        f.write('class Main {}')
+      with open(os.path.join(module, 'pom.xml'), 'w') as f:
+        f.write(POM_TEMPLATE.format(artifact_id=module, dependencies=dependencies))
+
+  def test_generated_targets(self):
+    self.assertEquals([{'type': 'java_library', 'name': 'lib'}, {'type': 'target', 'name': 'test'}],
+                      generated_targets(dedent('''
+                          # a/BUILD.gen
+                          java_library(name='lib',
+                            dependencies = [],
+                          )
+
+                          target(name="test")
+                          ''')))
+
+  def test_write_and_load(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      path = os.path.join('.pants.d', 'pom-gen', 'repo-model.jsonl')
+      context = GenerationContext()
+      writer = RepoModelWriter(path)
+      for module in ('a', 'b'):
+        pom_file = PomFile(os.path.join(module, 'pom.xml'), generation_context=context)
+        writer.write_module(pom_file, context,
+                            {'{0}/BUILD.gen'.format(module): [{'type': 'target', 'name': 'lib'}]},
+                            PomUtils.pom_provides_target(), set())
+      self.assertFalse(os.path.exists(path))
+      writer.close()
+
+      with open(path) as f:
+        self.assertEquals(['header', 'parent', 'module', 'module', 'end'],
+                          [json.loads(line)['record'] for line in f])
+      model = RepoModel.load(path)
+      self.assertEquals(['parents/base'], model.parents.keys())
+      self.assertEquals(set(['a', 'b']), set(model.modules))
+      b = model.modules['b']
+      self.assertEquals('com.example', b['group_id'])
+      self.assertEquals('parents/base', b['parent'])
+      self.assertEquals('BASE-b', b['properties']['module.prop'])
+      # Like DependencyInfo, the parent is reported as a dependency.
+      self.assertEquals([('base', 'external', None, 'compile'), ('a', 'local', 'a', 'compile'),
+                         ('junit', 'external', None, 'test')],
+                        [(dep['artifact_id'], dep['kind'], dep['module'], dep['scope'])
+                         for dep in b['dependencies']])
+      self.assertEquals({'b/BUILD.gen': [{'type': 'target', 'name': 'lib'}]}, b['build_files'])
+      self.assertEquals({'source_dirs': ['src/main/java'], 'hand_written_build': False,
+                         'main_class': None}, b['layout'])
+
+  def test_incomplete_model(self):
+    with temporary_dir() as root:
+      path = os.path.join(root, 'repo-model.jsonl')
+      with open(path, 'w') as f:
+        f.write(json.dumps({'record': 'header', 'version': RepoModel.VERSION}) + '\n')
+      with self.assertRaises(RepoModel.FormatError):
+        RepoModel.load(path)
+      with open(path, 'w') as f:
+        f.write(json.dumps({'record': 'header', 'version': -1}) + '\n')
+      with self.assertRaises(RepoModel.FormatError):
+        RepoModel.load(path)
@@ -0,0 +1,45 @@
+# Tests for code in squarepants/src/main/python/squarepants/sqlite_store.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:sqlite_store
+from __future__ import unicode_literals
+
+import os
+import sqlite3
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.sqlite_store import SQLiteStore
+
+
+class ExampleStore(SQLiteStore):
+  _VERSION = 2
+  _SCHEMA = (
+    'CREATE TABLE examples (name TEXT PRIMARY KEY)',
+  )
+
+
+class SQLiteStoreTest(unittest.TestCase):
+
+  def test_create(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'nested', 'example.db')
+      store = ExampleStore(path)
+      store._db.execute("INSERT INTO examples VALUES ('a')")
+      store._db.commit()
+      store.close()
+      # Opening it again keeps the data rather than creating the schema again.
+      store = ExampleStore(path)
+      self.assertEquals([('a',)], store._db.execute('SELECT name FROM examples').fetchall())
+      self.assertEquals(2, store._db.execute('PRAGMA user_version').fetchone()[0])
+      store.close()
+
+  def test_version_mismatch(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'example.db')
+      ExampleStore(path).close()
+      db = sqlite3.connect(path)
+      db.execute('PRAGMA user_version = 1000')
+      db.close()
+      with self.assertRaises(ExampleStore.FormatError):
+        ExampleStore(path)
@@ -0,0 +1,64 @@
+# Tests for code in squarepants/src/main/python/squarepants/timing_history.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:timing_history
+from __future__ import unicode_literals
+
+import os
+import unittest2 as unittest
+
+from squarepants import junit_report
+from squarepants.file_utils import temporary_dir
+from squarepants.timing_history import (TimingHistory, estimate_target_times, plan_shards,
+                                        target_test_classes)
+
+
+def case(full_name, time):
+  return junit_report.TestCase(full_name=full_name, time=time, state=junit_report.State.SUCCESS)
+
+
+class TimingHistoryTest(unittest.TestCase):
+
+  def test_record_run(self):
+    timings = TimingHistory(':memory:')
+    self.assertEquals(2, timings.record_run([case('com.example.FooTest.a', 1.0),
+                                             case('com.example.FooTest.b', 2.0),
+                                             case('com.example.BarTest.a', 4.0)]))
+    timings.record_run([case('com.example.FooTest.a', 5.0), case('com.example.FooTest.b', 2.0)])
+    stats = timings.statistics('com.example.FooTest')
+    self.assertEquals(2, stats['runs'])
+    self.assertAlmostEquals(5.0, stats['mean'])
+    self.assertAlmostEquals(2.0 ** 0.5 * 2, stats['stddev'])
+    self.assertAlmostEquals(3.0 + 0.3 * 4.0, stats['rolling'])
+    self.assertEquals(7.0, stats['last'])
+    self.assertIsNone(timings.statistics('com.example.BazTest'))
+    self.assertEquals({'com.example.FooTest': 4.2, 'com.example.BarTest': 4.0},
+                      dict((name, round(seconds, 6))
+                           for name, seconds in timings.expected_times().items()))
+
+  def test_target_test_classes(self):
+    with temporary_dir() as tmpdir:
+      source_dir = os.path.join(tmpdir, 'module', 'src', 'test', 'java')
+      os.makedirs(os.path.join(source_dir, 'com', 'example'))
+      for name in ('com/example/FooTest.java', 'com/example/README', 'TopTest.scala'):
+        with open(os.path.join(source_dir, name), 'w') as f:
+          f.write('')
+      self.assertEquals(['TopTest', 'com.example.FooTest'],
+                        target_test_classes('{}:test'.format(source_dir)))
+
+  def test_estimate_target_times(self):
+    classes = {'a:test': ['A1', 'A2'], 'b:test': ['B'], 'c:test': ['C'], 'new:test': ['New']}
+    times, estimated = estimate_target_times(sorted(classes), {'A1': 1.0, 'A2': 2.0, 'B': 5.0,
+                                                               'C': 4.0},
+                                             classes=classes.get)
+    self.assertEquals({'a:test': 3.0, 'b:test': 5.0, 'c:test': 4.0, 'new:test': 4.0}, times)
+    self.assertEquals(['new:test'], estimated)
+
+  def test_plan_shards(self):
+    shards = plan_shards({'a': 7, 'b': 5, 'c': 4, 'd': 3, 'e': 1}, 2)
+    self.assertEquals([{'targets': ['a', 'd'], 'expected_seconds': 10},
+                       {'targets': ['b', 'c', 'e'], 'expected_seconds': 10}], shards)
+    self.assertEquals([{'targets': ['a'], 'expected_seconds': 1},
+                       {'targets': [], 'expected_seconds': 0}], plan_shards({'a': 1}, 2))
+    with self.assertRaises(ValueError):
+      plan_shards({'a': 1}, 0)
@@ -0,0 +1,143 @@
+# Tests for code in squarepants/src/main/python/squarepants/version_convergence.py
+#
+# Run with:
+# ./pants test squarepants/src/test/python/squarepants_test:version_convergence
+
+import json
+import os
+from textwrap import dedent
+import unittest2 as unittest
+
+from squarepants.file_utils import temporary_dir
+from squarepants.pom_utils import PomUtils
+from squarepants.version_convergence import VersionConvergence, version_key
+
+
+POM_TEMPLATE = dedent('''<?xml version="1.0" encoding="UTF-8"?>
+    <project>
+      <groupId>com.example</groupId>
+      <artifactId>{artifact_id}</artifactId>
+      <parent>
+        <groupId>com.example</groupId>
+        <artifactId>base</artifactId>
+        <relativePath>../parents/base/pom.xml</relativePath>
+      </parent>
+      <dependencies>
+        {dependencies}
+      </dependencies>
+    </project>
+    ''')
+
+DEPENDENCY_TEMPLATE = dedent('''
+    <dependency>
+      <groupId>{0}</groupId>
+      <artifactId>{1}</artifactId>
+      {2}
+    </dependency>
+    ''')
+
+
+class VersionConvergenceTest(unittest.TestCase):
+
+  def setUp(self):
+    self._wd = os.getcwd()
+    PomUtils.reset_caches()
+
+  def tearDown(self):
+    os.chdir(self._wd)
+    PomUtils.reset_caches()
+
+  def _write_pom(self, module, dependencies):
+    os.makedirs(module)
+    with open(os.path.join(module, 'pom.xml'), 'w') as f:
+      f.write(POM_TEMPLATE.format(artifact_id=module, dependencies=''.join(
+        DEPENDENCY_TEMPLATE.format(*dep) for dep in dependencies)))
+
+  def _make_repo(self, root):
+    os.chdir(root)
+    with open('pom.xml', 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>all</artifactId>
+            <modules>
+              <module>a</module>
+              <module>b</module>
+              <module>c</module>
+            </modules>
+          </project>
+          '''))
+    os.makedirs('parents/base')
+    with open('parents/base/pom.xml', 'w') as f:
+      f.write(dedent('''<?xml version="1.0" encoding="UTF-8"?>
+          <project>
+            <groupId>com.example</groupId>
+            <artifactId>base</artifactId>
+            <properties>
+              <guava.version>18.0</guava.version>
+            </properties>
+            <dependencyManagement>
+              <dependencies>
+                <dependency>
+                  <groupId>com.google.guava</groupId>
+                  <artifactId>guava</artifactId>
+                  <version>${guava.version}</version>
+                </dependency>
+                <dependency>
+                  <groupId>junit</groupId>
+                  <artifactId>junit</artifactId>
+                  <version>4.12</version>
+                </dependency>
+              </dependencies>
+            </dependencyManagement>
+          </project>
+          '''))
+    self._write_pom('a', [('com.google.guava', 'guava', ''),
+                          ('junit', 'junit', ''),
+                          ('org.slf4j', 'slf4j-api', '<version>1.7.9</version>')])
+    self._write_pom('b', [('com.google.guava', 'guava', '<version>19.0</version>'),
+                          ('com.example', 'a', ''),
+                          ('org.slf4j', 'slf4j-api', '<version>1.7.10</version>')])
+    self._write_pom('c', [('com.google.guava', 'guava', '<version>${guava.version}</version>'),
+                          ('org.slf4j', 'slf4j-api', '<version>1.7.10</version>')])
+
+  def test_version_key(self):
+    self.assertEquals(['1.7.9', '1.7.10', '2.0-beta', '2.0'],
+                      sorted(['2.0', '1.7.10', '2.0-beta', '1.7.9'], key=version_key))
+
+  def test_analyze(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      divergences = VersionConvergence().analyze()
+      self.assertEquals(['com.google.guava:guava', 'org.slf4j:slf4j-api'],
+                        [divergence.coordinate for divergence in divergences])
+      guava, slf4j = divergences
+      self.assertEquals('18.0', guava.managed_version)
+      self.assertEquals('18.0', guava.effective_version)
+      self.assertEquals({'18.0': ['a', 'c'], '19.0': ['b']}, guava.modules_by_version)
+      self.assertEquals(['b'], guava.causes)
+      self.assertIsNone(slf4j.managed_version)
+      self.assertEquals('1.7.10', slf4j.effective_version)
+      self.assertEquals(['a'], slf4j.causes)
+
+  def test_format(self):
+    with temporary_dir() as root:
+      self._make_repo(root)
+      divergences = VersionConvergence().analyze()
+      self.assertEquals([
+        'com.google.guava:guava (effective version 18.0, managed)',
+        '  * 18.0: a, c',
+        '    19.0: b',
+        'org.slf4j:slf4j-api (effective version 1.7.10)',
+        '    1.7.9: a',
+        '  * 1.7.10: b, c',
+        '2 divergent artifacts.',
+      ], VersionConvergence.format_text(divergences))
+      report = json.loads(VersionConvergence.format_json(divergences))
+      self.assertEquals({
+        'coordinate': 'com.google.guava:guava',
+        'managed_version': '18.0',
+        'effective_version': '18.0',
+        'modules_by_version': {'18.0': ['a', 'c'], '19.0': ['b']},
+        'causes': ['b'],
+      }, report[0])